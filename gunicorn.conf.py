@@ -0,0 +1,41 @@
+"""
+Configuration gunicorn pour AgroBizChat
+Chargée automatiquement depuis le répertoire de travail ; les options
+de la ligne de commande (Procfile, render.yaml) restent prioritaires.
+"""
+
+def post_worker_init(worker):
+    """Lance les tâches de fond (préchauffage, SLO, écritures différées, archivage) dans chaque worker après le fork"""
+    from src.services.archive_service import archive_service
+    from src.services.buffered_writer import buffered_writer
+    from src.services.cache_service import cache_service
+    from src.services.cache_warmup import cache_warmup
+    from src.services.metrics_registry import metrics_registry
+    from src.services.slo_service import slo_service
+
+    # Un worker inactif republie ses métriques : elles restent dans l'export
+    metrics_registry.start()
+    cache_service.metrics.start()
+    if cache_warmup.start():
+        worker.log.info("Préchauffage du cache lancé (pid %s)", worker.pid)
+    slo_service.start()
+    # Reprend aussi les segments de spool laissés par un worker arrêté brutalement
+    buffered_writer.start()
+    # Un seul worker archive (verrou data/archive.lock)
+    archive_service.start()
+
+def on_starting(server):
+    """Au démarrage du maître : instantanés et cumuls de métriques de l'exécution précédente effacés"""
+    from src.services.worker_metrics import clear_snapshots
+
+    removed = clear_snapshots()
+    if removed:
+        server.log.info("%s instantanés de métriques effacés", removed)
+
+def worker_exit(server, worker):
+    """Dernier instantané des métriques du worker, cumulé ensuite avec les workers terminés"""
+    from src.services.cache_service import cache_service
+    from src.services.metrics_registry import metrics_registry
+
+    metrics_registry.publish()
+    cache_service.metrics.publish(force=True)
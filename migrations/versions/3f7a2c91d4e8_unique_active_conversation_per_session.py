@@ -0,0 +1,39 @@
+"""Unique active conversation per (user_id, session_id)
+
+Revision ID: 3f7a2c91d4e8
+Revises: b59d4bcbddb4
+Create Date: 2026-10-19 09:12:37.418205
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f7a2c91d4e8'
+down_revision = 'b59d4bcbddb4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Table créée par db.create_all() : index déjà présent
+    indexes = {index['name'] for index in sa.inspect(op.get_bind()).get_indexes('conversations')}
+    if 'uq_conversations_active_session' in indexes:
+        return
+
+    # Doublons créés par des webhooks concurrents : la plus ancienne conversation active
+    # (celle que get_or_create_conversation retrouvait) reste active
+    op.execute(
+        "UPDATE conversations SET status = 'abandoned' "
+        "WHERE status = 'active' AND id NOT IN ("
+        "SELECT MIN(id) FROM conversations WHERE status = 'active' GROUP BY user_id, session_id)"
+    )
+    op.create_index('uq_conversations_active_session', 'conversations', ['user_id', 'session_id'],
+                    unique=True,
+                    sqlite_where=sa.text("status = 'active'"),
+                    postgresql_where=sa.text("status = 'active'"))
+
+
+def downgrade():
+    op.drop_index('uq_conversations_active_session', table_name='conversations')
@@ -0,0 +1,44 @@
+"""Archive segments for messages and webhook logs
+
+Revision ID: 8d41b6e0c2a5
+Revises: 3f7a2c91d4e8
+Create Date: 2026-10-19 11:02:54.730164
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d41b6e0c2a5'
+down_revision = '3f7a2c91d4e8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # db.create_all() au démarrage de l'application a pu créer la table avant la migration
+    if 'archive_segments' in sa.inspect(op.get_bind()).get_table_names():
+        return
+    op.create_table('archive_segments',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('table_name', sa.String(length=50), nullable=False),
+        sa.Column('period', sa.String(length=7), nullable=False),
+        sa.Column('partition_key', sa.String(length=100), nullable=True),
+        sa.Column('row_count', sa.Integer(), nullable=False),
+        sa.Column('min_id', sa.Integer(), nullable=True),
+        sa.Column('max_id', sa.Integer(), nullable=True),
+        sa.Column('first_created_at', sa.DateTime(), nullable=True),
+        sa.Column('last_created_at', sa.DateTime(), nullable=True),
+        sa.Column('raw_bytes', sa.Integer(), nullable=True),
+        sa.Column('payload', sa.LargeBinary(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('idx_archive_segments_lookup', 'archive_segments',
+                    ['table_name', 'partition_key', 'first_created_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('idx_archive_segments_lookup', table_name='archive_segments')
+    op.drop_table('archive_segments')
@@ -0,0 +1,97 @@
+"""JSON text columns converted to JSONB on PostgreSQL
+
+Revision ID: a7d3f9c2e846
+Revises: f1a3c8e5d720
+Create Date: 2026-10-19 20:12:08.604193
+
+"""
+import json
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7d3f9c2e846'
+down_revision = 'f1a3c8e5d720'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 500
+
+# Table -> colonnes JSON (src/models/json_type.py)
+COLUMNS = {
+    'business_plan_templates': ['variables'],
+    'company_data': ['financial_data', 'market_data', 'competitive_data'],
+    'conversations': ['context'],
+    'messages': ['metadata_info'],
+    'business_plans': ['variables_used'],
+    'webhook_logs': ['webhook_data'],
+    'diagnosis_logs': ['diagnosis_data'],
+    'packages': ['features'],
+    'pineapple_varieties': ['characteristics', 'resistance_diseases'],
+    'pineapple_techniques': ['steps', 'requirements'],
+    'pineapple_diseases': ['symptoms', 'causes', 'treatments', 'prevention', 'affected_parts'],
+}
+
+
+def _is_json(value):
+    try:
+        json.loads(value)
+    except (TypeError, ValueError):
+        return False
+    return True
+
+
+def _existing(inspector):
+    """(table, colonne, nullable) présents dans la base"""
+    tables = set(inspector.get_table_names())
+    for table, names in COLUMNS.items():
+        if table not in tables:
+            continue
+        columns = {column['name']: column for column in inspector.get_columns(table)}
+        for name in names:
+            if name in columns:
+                yield table, name, columns[name]
+
+
+def _clean(bind, table_name, column_name, nullable):
+    """Textes invalides remplacés avant la conversion (lus comme vides par le modèle, refusés par ::jsonb)"""
+    table = sa.table(table_name, sa.column('id', sa.Integer), sa.column(column_name, sa.Text))
+    column = table.c[column_name]
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(table.c.id, column).where(table.c.id > last_id, column.isnot(None))
+            .order_by(table.c.id).limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        invalid = [row.id for row in rows if not _is_json(row[1])]
+        if invalid:
+            bind.execute(table.update().where(table.c.id.in_(invalid)).values({column_name: None if nullable else '{}'}))
+        last_id = rows[-1].id
+
+
+def upgrade():
+    bind = op.get_bind()
+    # SQLite : le type garde un TEXT, rien à convertir
+    if bind.dialect.name != 'postgresql':
+        return
+    for table, name, column in list(_existing(sa.inspect(bind))):
+        if isinstance(column['type'], postgresql.JSONB):
+            continue
+        _clean(bind, table, name, column['nullable'])
+        op.alter_column(table, name, type_=postgresql.JSONB(), existing_nullable=column['nullable'],
+                        postgresql_using=f'{name}::jsonb')
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        return
+    for table, name, column in list(_existing(sa.inspect(bind))):
+        if isinstance(column['type'], postgresql.JSONB):
+            op.alter_column(table, name, type_=sa.Text(), existing_nullable=column['nullable'],
+                            postgresql_using=f'{name}::text')
@@ -0,0 +1,106 @@
+"""Diagnosis photos moved from base64 column to blob store
+
+Revision ID: c5e9a1f47b3d
+Revises: 8d41b6e0c2a5
+Create Date: 2026-10-19 14:20:37.512840
+
+"""
+import base64
+
+from alembic import op
+import sqlalchemy as sa
+
+from src.services.blob_store import blob_store
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5e9a1f47b3d'
+down_revision = '8d41b6e0c2a5'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 200
+
+
+def _columns(bind):
+    inspector = sa.inspect(bind)
+    if 'diagnosis_logs' not in inspector.get_table_names():
+        return None
+    return {column['name'] for column in inspector.get_columns('diagnosis_logs')}
+
+
+def _drop_column(column_name):
+    """Colonne supprimée (SQLite : table recopiée ; les vues anciennes de la base ne sont pas revalidées)"""
+    sqlite = op.get_bind().dialect.name == 'sqlite'
+    if sqlite:
+        op.execute("PRAGMA legacy_alter_table=ON")
+    with op.batch_alter_table('diagnosis_logs') as batch_op:
+        batch_op.drop_column(column_name)
+    if sqlite:
+        op.execute("PRAGMA legacy_alter_table=OFF")
+
+
+def upgrade():
+    bind = op.get_bind()
+    columns = _columns(bind)
+    if columns is None:
+        # Le modèle avait sa propre instance SQLAlchemy : la table n'a jamais été créée
+        op.create_table('diagnosis_logs',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('disease_name', sa.String(length=200), nullable=False),
+            sa.Column('confidence', sa.Float(), nullable=True),
+            sa.Column('severity', sa.String(length=50), nullable=True),
+            sa.Column('culture', sa.String(length=50), nullable=True),
+            sa.Column('photo_hash', sa.String(length=64), nullable=True),
+            sa.Column('diagnosis_data', sa.Text(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+            sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ix_diagnosis_logs_photo_hash', 'diagnosis_logs', ['photo_hash'], unique=False)
+        return
+
+    if 'photo_hash' not in columns:
+        op.add_column('diagnosis_logs', sa.Column('photo_hash', sa.String(length=64), nullable=True))
+        op.create_index('ix_diagnosis_logs_photo_hash', 'diagnosis_logs', ['photo_hash'], unique=False)
+    if 'photo_data' not in columns:
+        return
+
+    # Photos écrites dans le stockage avant la suppression de la colonne (une photo en double n'est écrite qu'une fois)
+    logs = sa.table('diagnosis_logs', sa.column('id', sa.Integer), sa.column('photo_data', sa.Text),
+                    sa.column('photo_hash', sa.String))
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(logs.c.id, logs.c.photo_data)
+            .where(logs.c.id > last_id, logs.c.photo_data.isnot(None), logs.c.photo_hash.is_(None))
+            .order_by(logs.c.id).limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        for row in rows:
+            digest = blob_store.put(base64.b64decode(row.photo_data))
+            bind.execute(logs.update().where(logs.c.id == row.id).values(photo_hash=digest, photo_data=None))
+        last_id = rows[-1].id
+
+    _drop_column('photo_data')
+
+
+def downgrade():
+    columns = _columns(op.get_bind())
+    if columns is None or 'photo_hash' not in columns:
+        return
+    op.add_column('diagnosis_logs', sa.Column('photo_data', sa.Text(), nullable=True))
+
+    bind = op.get_bind()
+    logs = sa.table('diagnosis_logs', sa.column('id', sa.Integer), sa.column('photo_data', sa.Text),
+                    sa.column('photo_hash', sa.String))
+    for row in bind.execute(sa.select(logs.c.id, logs.c.photo_hash).where(logs.c.photo_hash.isnot(None))).all():
+        data = blob_store.get(row.photo_hash)
+        if data is not None:
+            bind.execute(logs.update().where(logs.c.id == row.id)
+                         .values(photo_data=base64.b64encode(data).decode('utf-8')))
+
+    op.drop_index('ix_diagnosis_logs_photo_hash', table_name='diagnosis_logs')
+    _drop_column('photo_hash')
@@ -0,0 +1,33 @@
+"""Counters table for admin statistics
+
+Revision ID: e2b8d4c61f09
+Revises: c5e9a1f47b3d
+Create Date: 2026-10-19 16:45:12.903418
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2b8d4c61f09'
+down_revision = 'c5e9a1f47b3d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # db.create_all() au démarrage de l'application a pu créer la table avant la migration
+    if 'stat_counters' in sa.inspect(op.get_bind()).get_table_names():
+        return
+    # Compteurs initialisés par un recomptage à la première lecture des statistiques
+    op.create_table('stat_counters',
+        sa.Column('name', sa.String(length=50), nullable=False),
+        sa.Column('value', sa.BigInteger(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('stat_counters')
@@ -0,0 +1,42 @@
+"""Composite indexes for keyset pagination
+
+Revision ID: f1a3c8e5d720
+Revises: e2b8d4c61f09
+Create Date: 2026-10-19 18:05:41.226307
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1a3c8e5d720'
+down_revision = 'e2b8d4c61f09'
+branch_labels = None
+depends_on = None
+
+# (index, table, colonnes) : tri de la pagination par curseur, clé primaire en dernier
+INDEXES = [
+    ('idx_users_created_id', 'users', ['created_at', 'id']),
+    ('idx_conversations_updated_id', 'conversations', ['updated_at', 'id']),
+    ('idx_conversations_user_updated_id', 'conversations', ['user_id', 'updated_at', 'id']),
+    ('idx_messages_conversation_created_id', 'messages', ['conversation_id', 'created_at', 'id']),
+    ('idx_business_plans_created_id', 'business_plans', ['created_at', 'id']),
+    ('idx_business_plans_user_created_id', 'business_plans', ['user_id', 'created_at', 'id']),
+]
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    tables = set(inspector.get_table_names())
+    for name, table, columns in INDEXES:
+        # Tables créées par db.create_all() : index déjà présents
+        if table in tables and name not in {index['name'] for index in inspector.get_indexes(table)}:
+            op.create_index(name, table, columns, unique=False)
+
+
+def downgrade():
+    inspector = sa.inspect(op.get_bind())
+    for name, table, _ in reversed(INDEXES):
+        if name in {index['name'] for index in inspector.get_indexes(table)}:
+            op.drop_index(name, table_name=table)
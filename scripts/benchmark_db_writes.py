@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Banc d'essai des écritures du webhook WhatsApp sur SQLite
+Compare le moteur par défaut (journal rollback, sans pragmas) et la configuration
+de src/services/db_engine.py (WAL, synchronous=NORMAL, busy_timeout, pool)
+avec plusieurs processus écrivains, comme les workers gunicorn
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import multiprocessing
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.resolve()))
+
+from sqlalchemy import create_engine, event, func, insert, select, update
+from sqlalchemy.exc import OperationalError
+
+from src.models.database import db, Message, WebhookLog
+from src.services.db_engine import apply_sqlite_pragmas, engine_options
+
+def _make_engine(url: str, tuned: bool):
+    """Moteur par défaut ou configuré comme l'application"""
+    if not tuned:
+        return create_engine(url)
+    engine = create_engine(url, **engine_options(url))
+    event.listen(engine, 'connect', lambda dbapi_connection, record: apply_sqlite_pragmas(dbapi_connection))
+    return engine
+
+def _webhook_writes(url: str, tuned: bool, writes: int, results):
+    """Un worker : journal du webhook, message, puis marquage traité (deux transactions)"""
+    engine = _make_engine(url, tuned)
+    latencies = []
+    errors = 0
+    payload = json.dumps({'Body': 'Je veux produire du maïs sur 2 hectares', 'From': 'whatsapp:+22900000000'})
+
+    for index in range(writes):
+        start = time.perf_counter()
+        try:
+            with engine.begin() as conn:
+                log_id = conn.execute(
+                    insert(WebhookLog.__table__).values(platform='whatsapp', webhook_data=payload, processed=False)
+                ).inserted_primary_key[0]
+                conn.execute(insert(Message.__table__).values(
+                    conversation_id=1, content=f"message {os.getpid()}-{index}", sender='user', message_type='text'))
+            with engine.begin() as conn:
+                conn.execute(update(WebhookLog.__table__).where(WebhookLog.__table__.c.id == log_id).values(processed=True))
+            latencies.append(time.perf_counter() - start)
+        except OperationalError:
+            errors += 1
+    engine.dispose()
+    results.put((latencies, errors))
+
+def _reader(url: str, tuned: bool, stop):
+    """Lectures concurrentes (tableau de bord admin) : bloquent les écrivains en journal rollback"""
+    engine = _make_engine(url, tuned)
+    while not stop.is_set():
+        try:
+            with engine.connect() as conn:
+                conn.execute(select(func.count()).select_from(Message.__table__)).scalar()
+                conn.execute(select(WebhookLog.__table__.c.id).order_by(WebhookLog.__table__.c.id.desc()).limit(50)).all()
+        except OperationalError:
+            pass
+    engine.dispose()
+
+def run(tuned: bool, workers: int, writes: int, readers: int) -> dict:
+    """
+    Exécute un scénario sur une base temporaire
+
+    Args:
+        tuned (bool): Configuration de l'application plutôt que le moteur par défaut
+        workers (int): Processus écrivains
+        writes (int): Webhooks par processus
+        readers (int): Processus lecteurs
+
+    Returns:
+        dict: Débit, latences et erreurs
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        url = f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}"
+        engine = _make_engine(url, tuned)
+        db.metadata.create_all(engine, tables=[WebhookLog.__table__, Message.__table__])
+        engine.dispose()
+
+        results = multiprocessing.Queue()
+        stop = multiprocessing.Event()
+        reader_processes = [multiprocessing.Process(target=_reader, args=(url, tuned, stop)) for _ in range(readers)]
+        writer_processes = [multiprocessing.Process(target=_webhook_writes, args=(url, tuned, writes, results))
+                            for _ in range(workers)]
+
+        for process in reader_processes:
+            process.start()
+        start = time.perf_counter()
+        for process in writer_processes:
+            process.start()
+        collected = [results.get() for _ in writer_processes]
+        elapsed = time.perf_counter() - start
+        stop.set()
+        for process in writer_processes + reader_processes:
+            process.join()
+
+    latencies = sorted(latency for worker_latencies, _ in collected for latency in worker_latencies)
+    errors = sum(worker_errors for _, worker_errors in collected)
+    return {
+        'config': 'db_engine (WAL)' if tuned else 'défaut (rollback)',
+        'webhooks': len(latencies),
+        'errors': errors,
+        'seconds': round(elapsed, 2),
+        'webhooks_per_s': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(latencies[len(latencies) // 2] * 1000, 2) if latencies else None,
+        'p99_ms': round(latencies[int(len(latencies) * 0.99)] * 1000, 2) if latencies else None
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Débit d'écriture du webhook sur SQLite")
+    parser.add_argument('--workers', type=int, default=4, help='Processus écrivains (workers gunicorn)')
+    parser.add_argument('--writes', type=int, default=200, help='Webhooks par processus')
+    parser.add_argument('--readers', type=int, default=1, help='Processus lecteurs concurrents')
+    args = parser.parse_args()
+
+    print(f"🧪 {args.workers} workers x {args.writes} webhooks, {args.readers} lecteur(s)\n")
+    baseline = run(False, args.workers, args.writes, args.readers)
+    tuned = run(True, args.workers, args.writes, args.readers)
+
+    for result in (baseline, tuned):
+        print(f"{result['config']:<20} {result['webhooks_per_s']:>8} webhooks/s  "
+              f"p50 {result['p50_ms']} ms  p99 {result['p99_ms']} ms  erreurs {result['errors']}")
+    if baseline['webhooks_per_s']:
+        print(f"\n📈 Gain de débit: x{tuned['webhooks_per_s'] / baseline['webhooks_per_s']:.1f}")
+
+if __name__ == '__main__':
+    main()
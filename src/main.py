@@ -3,12 +3,13 @@ import sys
 # DON'T CHANGE THIS !!!
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
-from flask import Flask, send_from_directory
+from flask import Flask, Response, request, send_from_directory
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
 from flask_migrate import Migrate
 from dotenv import load_dotenv
 from pathlib import Path
+from sqlalchemy.engine import make_url
 
 from src.models.database import db
 from src.routes.admin import admin_bp
@@ -19,32 +20,37 @@ from src.routes.gemini import gemini_bp
 from src.routes.payment import payment_bp
 from src.routes.performance import performance_bp
 from src.routes.localization import localization_bp
+from src.services.cache_warmup import cache_warmup
+from src.services.slo_service import slo_service
+from src.services.buffered_writer import buffered_writer
+from src.services.archive_service import archive_service
+from src.services.db_engine import configure_app as configure_database, init_app_engine
+from src.services.db_instrumentation import instrument_engines
+from src.services.metrics_registry import metrics_registry, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from src.services.request_timing import RequestTimingMiddleware, stamp_route
 
 # Charger les variables d'environnement
 load_dotenv()
 
 app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
+# Mesure de toutes les requêtes (webhooks, API, fichiers) au niveau WSGI
+app.wsgi_app = RequestTimingMiddleware(app.wsgi_app)
 
 # Configuration
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key-change-in-production')
 app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'jwt-secret-key-change-in-production')
 
-# Configuration de la base de données
-basedir = os.path.abspath(os.path.dirname(__file__))
-# db_path = os.path.join(basedir, '..', 'database', 'app.db')
+# Configuration de la base de données : DATABASE_URL (PostgreSQL) ou database/app.db,
+# options de pool et pragmas SQLite (WAL, busy_timeout) par connexion
 project_root = Path(__file__).parent.parent.resolve()
-db_dir = project_root / 'database'
-db_path = db_dir / 'app.db'
+database_url = configure_database(app)
+# Jamais de mot de passe dans les journaux
+database_label = make_url(database_url).render_as_string(hide_password=True)
 
 print(f"Base directory: {project_root}")
-print(f"Database path: {db_path}")
+print(f"Database: {database_label}")
 print(f"Current working directory: {os.getcwd()}")
 
-# S'assurer que le répertoire parent existe
-db_dir.mkdir(parents=True, exist_ok=True)
-
-app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
-
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 # Configuration JWT - S'assurer que l'identité est gérée de manière cohérente
@@ -63,9 +69,13 @@ app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16 MB max upload size
 # Initialisation des extensions
 CORS(app, origins="*")  # Permettre toutes les origines pour le développement
 jwt = JWTManager(app)
-print(f"SQLALCHEMY_DATABASE_URI before init_app: {app.config['SQLALCHEMY_DATABASE_URI']}")
+print(f"SQLALCHEMY_DATABASE_URI before init_app: {database_label}")
 db.init_app(app)
+init_app_engine(app, db)
 migrate = Migrate(app, db)
+instrument_engines()
+buffered_writer.init_app(app)
+archive_service.init_app(app)
 
 # Enregistrement des blueprints
 app.register_blueprint(admin_bp, url_prefix='/api/admin')
@@ -86,7 +96,7 @@ app.add_url_rule('/webhook/messenger', 'messenger_webhook_root', messenger_webho
 
 # Création des tables
 with app.app_context():
-    print(f"Attempting to create all tables for URI: {app.config['SQLALCHEMY_DATABASE_URI']}")
+    print(f"Attempting to create all tables for URI: {database_label}")
     try:
         db.create_all()
         print("Database tables created successfully.")
@@ -113,7 +123,32 @@ def serve(path):
 
 @app.route('/health')
 def health_check():
-    return {'status': 'healthy', 'service': 'chatbot-business-plan'}, 200
+    return {
+        'status': 'healthy',
+        'service': 'chatbot-business-plan',
+        'warmup': cache_warmup.get_progress()
+    }, 200
+
+@app.route('/health/ready')
+def readiness_check():
+    """Prêt à recevoir du trafic une fois le préchauffage du cache terminé"""
+    progress = cache_warmup.get_progress()
+    status_code = 200 if progress['ready'] else 503
+    return {
+        'status': 'ready' if progress['ready'] else 'warming',
+        'service': 'chatbot-business-plan',
+        'warmup': progress
+    }, status_code
+
+@app.before_request
+def record_route_template():
+    # Modèle de route (/api/user/<int:id>) et jamais le chemin réel : pas de numéro de téléphone en label
+    stamp_route(request)
+
+@app.route('/metrics')
+def metrics():
+    """Exposition OpenMetrics (Prometheus) agrégée sur tous les workers"""
+    return Response(metrics_registry.render(), mimetype=None, content_type=METRICS_CONTENT_TYPE)
 
 @app.route('/uploads/templates/<filename>')
 def uploaded_file(filename):
@@ -159,5 +194,11 @@ if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
     debug = os.environ.get('FLASK_ENV') == 'development'
     
+    # Sous gunicorn, les tâches de fond sont lancées par post_worker_init (gunicorn.conf.py)
+    cache_warmup.start()
+    slo_service.start()
+    buffered_writer.start()
+    archive_service.start()
+    
     app.run(host='0.0.0.0', port=port, debug=debug)
 
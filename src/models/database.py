@@ -1,8 +1,10 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
-import json
 import sqlite3
 import os
+from pathlib import Path
+
+from src.models.json_type import JSONType
 
 db = SQLAlchemy()
 
@@ -61,7 +63,7 @@ class BusinessPlanTemplate(db.Model):
     template_content = db.Column(db.Text)  # JSON ou HTML template (now optional as file upload)
     file_path = db.Column(db.String(500))  # New: Path to the uploaded file
     file_type = db.Column(db.String(50))   # New: MIME type or file extension
-    variables = db.Column(db.Text)  # JSON - Liste des variables requises
+    variables = db.Column(JSONType)  # JSON - Liste des variables requises
     category = db.Column(db.String(100))
     is_active = db.Column(db.Boolean, default=True)
     created_by = db.Column(db.Integer, db.ForeignKey('admin_users.id'))
@@ -72,15 +74,10 @@ class BusinessPlanTemplate(db.Model):
     creator = db.relationship('AdminUser', backref='templates')
     
     def get_variables(self):
-        if self.variables:
-            try:
-                return json.loads(self.variables)
-            except:
-                return []
-        return []
+        return self.variables if self.variables is not None else []
     
     def set_variables(self, variables_list):
-        self.variables = json.dumps(variables_list)
+        self.variables = variables_list
     
     def to_dict(self):
         return {
@@ -107,44 +104,29 @@ class CompanyData(db.Model):
     size = db.Column(db.String(50))  # 'startup', 'small', 'medium', 'large'
     location = db.Column(db.String(100))
     description = db.Column(db.Text)
-    financial_data = db.Column(db.Text)  # JSON - Données financières structurées
-    market_data = db.Column(db.Text)  # JSON - Données de marché
-    competitive_data = db.Column(db.Text)  # JSON - Données concurrentielles
+    financial_data = db.Column(JSONType)  # JSON - Données financières structurées
+    market_data = db.Column(JSONType)  # JSON - Données de marché
+    competitive_data = db.Column(JSONType)  # JSON - Données concurrentielles
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     def get_financial_data(self):
-        if self.financial_data:
-            try:
-                return json.loads(self.financial_data)
-            except:
-                return {}
-        return {}
+        return self.financial_data if self.financial_data is not None else {}
     
     def set_financial_data(self, data):
-        self.financial_data = json.dumps(data)
+        self.financial_data = data
     
     def get_market_data(self):
-        if self.market_data:
-            try:
-                return json.loads(self.market_data)
-            except:
-                return {}
-        return {}
+        return self.market_data if self.market_data is not None else {}
     
     def set_market_data(self, data):
-        self.market_data = json.dumps(data)
+        self.market_data = data
     
     def get_competitive_data(self):
-        if self.competitive_data:
-            try:
-                return json.loads(self.competitive_data)
-            except:
-                return {}
-        return {}
+        return self.competitive_data if self.competitive_data is not None else {}
     
     def set_competitive_data(self, data):
-        self.competitive_data = json.dumps(data)
+        self.competitive_data = data
     
     def to_dict(self):
         return {
@@ -193,8 +175,11 @@ class User(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     last_interaction = db.Column(db.DateTime)
     
-    # Contrainte d'unicité
-    __table_args__ = (db.UniqueConstraint('platform', 'platform_user_id'),)
+    # Contrainte d'unicité, index de la pagination par curseur
+    __table_args__ = (
+        db.UniqueConstraint('platform', 'platform_user_id'),
+        db.Index('idx_users_created_id', 'created_at', 'id'),
+    )
     
     def to_dict(self):
         return {
@@ -230,23 +215,27 @@ class Conversation(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     session_id = db.Column(db.String(100), nullable=False)
     status = db.Column(db.String(20), default='active')  # 'active', 'completed', 'abandoned'
-    context = db.Column(db.Text)  # JSON - Contexte de la conversation
+    context = db.Column(JSONType)  # JSON - Contexte de la conversation
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relations
     user = db.relationship('User', backref='conversations')
     
+    # Une seule conversation active par session : cible de l'upsert de identity_resolver
+    __table_args__ = (
+        db.Index('uq_conversations_active_session', 'user_id', 'session_id', unique=True,
+                 sqlite_where=db.text("status = 'active'"), postgresql_where=db.text("status = 'active'")),
+        # Pagination par curseur (plus récemment actives d'abord)
+        db.Index('idx_conversations_updated_id', 'updated_at', 'id'),
+        db.Index('idx_conversations_user_updated_id', 'user_id', 'updated_at', 'id'),
+    )
+    
     def get_context(self):
-        if self.context:
-            try:
-                return json.loads(self.context)
-            except:
-                return {}
-        return {}
+        return self.context if self.context is not None else {}
     
     def set_context(self, context_data):
-        self.context = json.dumps(context_data)
+        self.context = context_data
     
     def to_dict(self):
         return {
@@ -267,22 +256,22 @@ class Message(db.Model):
     sender = db.Column(db.String(10), nullable=False)  # 'user' ou 'bot'
     message_type = db.Column(db.String(20), default='text')  # 'text', 'image', 'document', 'audio'
     content = db.Column(db.Text, nullable=False)
-    metadata_info = db.Column(db.Text)  # JSON - Données supplémentaires
+    metadata_info = db.Column(JSONType)  # JSON - Données supplémentaires
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relations
     conversation = db.relationship('Conversation', backref='messages')
     
+    # Pagination par curseur dans une conversation
+    __table_args__ = (
+        db.Index('idx_messages_conversation_created_id', 'conversation_id', 'created_at', 'id'),
+    )
+    
     def get_metadata(self):
-        if self.metadata_info:
-            try:
-                return json.loads(self.metadata_info)
-            except:
-                return {}
-        return {}
+        return self.metadata_info if self.metadata_info is not None else {}
     
     def set_metadata(self, metadata_data):
-        self.metadata_info = json.dumps(metadata_data)
+        self.metadata_info = metadata_data
     
     def to_dict(self):
         return {
@@ -304,7 +293,7 @@ class BusinessPlan(db.Model):
     template_id = db.Column(db.Integer, db.ForeignKey('business_plan_templates.id'))
     company_name = db.Column(db.String(200), nullable=False)
     generated_content = db.Column(db.Text, nullable=False)
-    variables_used = db.Column(db.Text)  # JSON - Variables utilisées pour la génération
+    variables_used = db.Column(JSONType)  # JSON - Variables utilisées pour la génération
     file_path = db.Column(db.String(500))  # Chemin vers le fichier généré
     file_format = db.Column(db.String(10), default='pdf')  # 'pdf', 'docx', 'html'
     status = db.Column(db.String(20), default='generated')  # 'generated', 'sent', 'downloaded'
@@ -315,16 +304,17 @@ class BusinessPlan(db.Model):
     conversation = db.relationship('Conversation', backref='business_plans')
     template = db.relationship('BusinessPlanTemplate', backref='business_plans')
     
+    # Pagination par curseur (plus récents d'abord)
+    __table_args__ = (
+        db.Index('idx_business_plans_created_id', 'created_at', 'id'),
+        db.Index('idx_business_plans_user_created_id', 'user_id', 'created_at', 'id'),
+    )
+    
     def get_variables_used(self):
-        if self.variables_used:
-            try:
-                return json.loads(self.variables_used)
-            except:
-                return {}
-        return {}
+        return self.variables_used if self.variables_used is not None else {}
     
     def set_variables_used(self, variables_data):
-        self.variables_used = json.dumps(variables_data)
+        self.variables_used = variables_data
     
     def to_dict(self):
         return {
@@ -375,24 +365,20 @@ class WebhookLog(db.Model):
     
     id = db.Column(db.Integer, primary_key=True)
     platform = db.Column(db.String(20), nullable=False)
-    webhook_data = db.Column(db.Text, nullable=False)  # JSON
+    webhook_data = db.Column(JSONType, nullable=False)  # JSON
     processed = db.Column(db.Boolean, default=False)
     error_message = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     def get_webhook_data(self):
-        if self.webhook_data:
-            try:
-                return json.loads(self.webhook_data)
-            except json.JSONDecodeError:
-                return {}
-        return {}
+        return self.webhook_data if self.webhook_data is not None else {}
     
     def set_webhook_data(self, data):
         try:
-            self.webhook_data = json.dumps(data, ensure_ascii=False)
-        except Exception as e:
-            self.webhook_data = json.dumps({'error': str(e)})
+            self.webhook_data = data
+        except ValueError as e:
+            # Valeur sans équivalent JSON (octets, objet, booléen seul)
+            self.webhook_data = {'error': str(e)}
     
     def to_dict(self):
         return {
@@ -404,19 +390,72 @@ class WebhookLog(db.Model):
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
 
+class ArchiveSegment(db.Model):
+    """Lignes archivées d'une table, compressées par mois et clé de partition"""
+    __tablename__ = 'archive_segments'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    table_name = db.Column(db.String(50), nullable=False)  # 'messages', 'webhook_logs'
+    period = db.Column(db.String(7), nullable=False)  # 'YYYY-MM' (created_at des lignes)
+    partition_key = db.Column(db.String(100))  # conversation_id pour messages, plateforme pour webhook_logs
+    row_count = db.Column(db.Integer, nullable=False)
+    min_id = db.Column(db.Integer)
+    max_id = db.Column(db.Integer)
+    first_created_at = db.Column(db.DateTime)
+    last_created_at = db.Column(db.DateTime)
+    raw_bytes = db.Column(db.Integer)
+    payload = db.Column(db.LargeBinary, nullable=False)  # JSON compressé (zlib)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('idx_archive_segments_lookup', 'table_name', 'partition_key', 'first_created_at'),
+    )
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'table_name': self.table_name,
+            'period': self.period,
+            'partition_key': self.partition_key,
+            'row_count': self.row_count,
+            'first_created_at': self.first_created_at.isoformat() if self.first_created_at else None,
+            'last_created_at': self.last_created_at.isoformat() if self.last_created_at else None,
+            'raw_bytes': self.raw_bytes,
+            'compressed_bytes': len(self.payload) if self.payload is not None else 0
+        }
+
+class StatCounter(db.Model):
+    """Compteur du tableau de bord admin, tenu à jour dans la transaction des écritures"""
+    __tablename__ = 'stat_counters'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'value': self.value,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
 def get_db_connection():
-    """Fonction pour obtenir une connexion directe à la base de données SQLite."""
+    """Connexion DB-API directe à la base configurée (SQLite avec pragmas, ou connexion du pool)."""
+    from src.services.db_engine import apply_sqlite_pragmas, resolve_database_url, sqlite_database_path
+    
     try:
-        # Utiliser le même chemin que dans main.py
-        from pathlib import Path
-        project_root = Path(__file__).parent.parent.parent.resolve()
-        db_dir = project_root / 'database'
-        db_path = db_dir / 'app.db'
+        database_url = resolve_database_url()
+        db_path = sqlite_database_path(database_url)
+        if db_path is None:
+            # PostgreSQL : connexion empruntée au pool de l'application (rendue par close())
+            return db.engine.raw_connection()
         
         # S'assurer que le répertoire existe
-        db_dir.mkdir(parents=True, exist_ok=True)
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
         
-        return sqlite3.connect(str(db_path))
+        conn = sqlite3.connect(db_path, timeout=int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000')) / 1000)
+        apply_sqlite_pragmas(conn)
+        return conn
     except Exception as e:
         print(f"Erreur connexion base de données: {str(e)}")
         raise
@@ -424,16 +463,7 @@ def get_db_connection():
 # Configuration pour les plateformes cloud
 def get_database_url():
     """Récupère l'URL de base de données avec support des plateformes cloud"""
-    database_url = os.getenv('DATABASE_URL')
+    from src.services.db_engine import resolve_database_url
     
-    if database_url:
-        # Heroku et autres plateformes utilisent postgres:// qui n'est plus supporté
-        if database_url.startswith('postgres://'):
-            database_url = database_url.replace('postgres://', 'postgresql://', 1)
-        
-        # Render et autres plateformes modernes utilisent postgresql://
-        return database_url
-    
-    # Fallback local
-    return 'sqlite:///app.db'
-
+    # postgres:// (Heroku, Render) corrigé en postgresql://, fallback local database/app.db
+    return resolve_database_url()
@@ -2,11 +2,10 @@
 Modèle pour les logs de diagnostic de maladies
 """
 
-from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
-import json
 
-db = SQLAlchemy()
+from src.models.database import db
+from src.models.json_type import JSONType
 
 class DiagnosisLog(db.Model):
     """Modèle pour enregistrer les diagnostics de maladies"""
@@ -19,25 +18,20 @@ class DiagnosisLog(db.Model):
     confidence = db.Column(db.Float, default=0.0)  # Niveau de confiance (0-1)
     severity = db.Column(db.String(50))  # Élevée, Modérée, Faible, Incertaine
     culture = db.Column(db.String(50), default='mais')  # Culture concernée
-    photo_data = db.Column(db.Text)  # Photo en base64
-    diagnosis_data = db.Column(db.Text)  # Données complètes du diagnostic en JSON
+    photo_hash = db.Column(db.String(64), index=True)  # SHA-256 de la photo (src/services/blob_store.py)
+    diagnosis_data = db.Column(JSONType)  # Données complètes du diagnostic en JSON
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relations
-    user = db.relationship('User', backref='diagnosis_logs')
+    user = db.relationship('User', backref=db.backref('diagnosis_logs', cascade='all, delete-orphan'))
     
     def get_diagnosis_data(self):
         """Récupère les données de diagnostic parsées"""
-        if self.diagnosis_data:
-            try:
-                return json.loads(self.diagnosis_data)
-            except:
-                return {}
-        return {}
+        return self.diagnosis_data if self.diagnosis_data is not None else {}
     
     def set_diagnosis_data(self, data):
         """Définit les données de diagnostic"""
-        self.diagnosis_data = json.dumps(data)
+        self.diagnosis_data = data
     
     def to_dict(self):
         """Convertit en dictionnaire"""
@@ -48,6 +42,7 @@ class DiagnosisLog(db.Model):
             'confidence': self.confidence,
             'severity': self.severity,
             'culture': self.culture,
+            'photo_hash': self.photo_hash,
             'diagnosis_data': self.get_diagnosis_data(),
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
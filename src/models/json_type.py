@@ -0,0 +1,102 @@
+"""
+Type de colonne JSON pour les modèles AgroBizChat
+JSONB natif sous PostgreSQL, texte ailleurs ; valeur décodée une fois au chargement de la ligne
+et suivie en place (MutableDict / MutableList) : une modification marque la ligne à enregistrer
+"""
+
+import json
+
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.mutable import Mutable, MutableDict, MutableList
+from sqlalchemy.types import Text, TypeDecorator
+
+def _loads(value):
+    """Décode un texte JSON (objet, liste ou scalaire) ; ValueError si le texte n'est pas du JSON"""
+    return json.loads(value)
+
+def _scalar(value):
+    """Chaîne ou nombre JSON sous une forme acceptée par le suivi des modifications (autres valeurs inchangées)"""
+    if isinstance(value, JSONScalar) or isinstance(value, bool):
+        return value
+    if isinstance(value, str):
+        return JSONStr(value)
+    if isinstance(value, int):
+        return JSONInt(value)
+    if isinstance(value, float):
+        return JSONFloat(value)
+    return value
+
+class JSONText(TypeDecorator):
+    """Valeur JSON : JSONB sous PostgreSQL, TEXT sous SQLite"""
+
+    impl = Text
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == 'postgresql':
+            return dialect.type_descriptor(JSONB())
+        return dialect.type_descriptor(Text())
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        if isinstance(value, str) and not isinstance(value, JSONScalar):
+            # Texte déjà sérialisé (insertions directes, anciens appelants) : transmis tel quel
+            return json.loads(value) if dialect.name == 'postgresql' else value
+        if dialect.name == 'postgresql':
+            return value
+        return json.dumps(value, ensure_ascii=False)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        if isinstance(value, str) and dialect.name != 'postgresql':
+            try:
+                value = _loads(value)
+            except ValueError:
+                print(f"Erreur JSON illisible en base: {value[:80]!r}")
+                return None
+        return _scalar(value)
+
+class MutableJSON(Mutable):
+    """Suivi des modifications en place : dict -> MutableJSONDict, list -> MutableJSONList"""
+
+    @classmethod
+    def coerce(cls, key, value):
+        if value is None or isinstance(value, MutableJSON):
+            return value
+        if isinstance(value, str):
+            # Texte JSON (appelants qui sérialisaient eux-mêmes) ; un texte non JSON reste une chaîne
+            try:
+                value = _loads(value)
+            except ValueError:
+                return JSONStr(value)
+        if isinstance(value, dict):
+            return MutableJSONDict(value)
+        if isinstance(value, list):
+            return MutableJSONList(value)
+        if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+            # bool ne peut pas être dérivé : pas de booléen seul dans une colonne JSON
+            raise ValueError(f"Valeur JSON non prise en charge pour {key}: {type(value).__name__}")
+        return _scalar(value)
+
+class MutableJSONDict(MutableDict, MutableJSON):
+    """Objet JSON suivi (clés de premier niveau)"""
+
+class MutableJSONList(MutableList, MutableJSON):
+    """Liste JSON suivie (éléments de premier niveau)"""
+
+class JSONScalar(MutableJSON):
+    """Chaîne ou nombre JSON : valeur non modifiable, seule une réaffectation est enregistrée"""
+
+class JSONStr(str, JSONScalar):
+    """Chaîne JSON"""
+
+class JSONInt(int, JSONScalar):
+    """Entier JSON"""
+
+class JSONFloat(float, JSONScalar):
+    """Nombre décimal JSON"""
+
+# Type des colonnes JSON des modèles (une modification imbriquée demande flag_modified ou une réaffectation)
+JSONType = MutableJSON.as_mutable(JSONText())
@@ -4,7 +4,8 @@ Modèles pour les paiements et abonnements
 
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
-import json
+
+from src.models.json_type import JSONType
 
 db = SQLAlchemy()
 
@@ -114,7 +115,7 @@ class Package(db.Model):
     price = db.Column(db.Integer, nullable=False)  # Prix en FCFA
     currency = db.Column(db.String(10), default='XOF')
     duration_days = db.Column(db.Integer, default=30)
-    features = db.Column(db.Text)  # JSON des fonctionnalités
+    features = db.Column(JSONType)  # JSON des fonctionnalités
     description = db.Column(db.Text)
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -122,16 +123,11 @@ class Package(db.Model):
     
     def get_features(self):
         """Récupère les fonctionnalités parsées"""
-        if self.features:
-            try:
-                return json.loads(self.features)
-            except:
-                return {}
-        return {}
+        return self.features if self.features is not None else {}
     
     def set_features(self, features_dict):
         """Définit les fonctionnalités"""
-        self.features = json.dumps(features_dict)
+        self.features = features_dict
     
     def to_dict(self):
         """Convertit en dictionnaire"""
@@ -5,7 +5,8 @@ Variétés, techniques culturales, données économiques
 
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
-import json
+
+from src.models.json_type import JSONType
 
 db = SQLAlchemy()
 
@@ -18,10 +19,10 @@ class PineappleVariety(db.Model):
     name = db.Column(db.String(100), nullable=False)
     scientific_name = db.Column(db.String(100))
     description = db.Column(db.Text)
-    characteristics = db.Column(db.Text)  # JSON des caractéristiques
+    characteristics = db.Column(JSONType)  # JSON des caractéristiques
     yield_per_ha = db.Column(db.Float)  # Rendement en tonnes/ha
     cycle_duration = db.Column(db.Integer)  # Durée du cycle en mois
-    resistance_diseases = db.Column(db.Text)  # JSON des résistances
+    resistance_diseases = db.Column(JSONType)  # JSON des résistances
     market_demand = db.Column(db.String(50))  # Élevée, Modérée, Faible
     price_per_kg = db.Column(db.Float)  # Prix moyen en FCFA
     is_active = db.Column(db.Boolean, default=True)
@@ -30,29 +31,19 @@ class PineappleVariety(db.Model):
     
     def get_characteristics(self):
         """Récupère les caractéristiques parsées"""
-        if self.characteristics:
-            try:
-                return json.loads(self.characteristics)
-            except:
-                return {}
-        return {}
+        return self.characteristics if self.characteristics is not None else {}
     
     def set_characteristics(self, characteristics_dict):
         """Définit les caractéristiques"""
-        self.characteristics = json.dumps(characteristics_dict)
+        self.characteristics = characteristics_dict
     
     def get_resistance_diseases(self):
         """Récupère les résistances parsées"""
-        if self.resistance_diseases:
-            try:
-                return json.loads(self.resistance_diseases)
-            except:
-                return {}
-        return {}
+        return self.resistance_diseases if self.resistance_diseases is not None else {}
     
     def set_resistance_diseases(self, resistance_dict):
         """Définit les résistances"""
-        self.resistance_diseases = json.dumps(resistance_dict)
+        self.resistance_diseases = resistance_dict
     
     def to_dict(self):
         """Convertit en dictionnaire"""
@@ -84,8 +75,8 @@ class PineappleTechnique(db.Model):
     name = db.Column(db.String(100), nullable=False)
     category = db.Column(db.String(50))  # plantation, entretien, récolte, post-récolte
     description = db.Column(db.Text)
-    steps = db.Column(db.Text)  # JSON des étapes
-    requirements = db.Column(db.Text)  # JSON des exigences
+    steps = db.Column(JSONType)  # JSON des étapes
+    requirements = db.Column(JSONType)  # JSON des exigences
     duration_days = db.Column(db.Integer)  # Durée en jours
     cost_per_ha = db.Column(db.Float)  # Coût en FCFA/ha
     zone_agro_ecologique = db.Column(db.String(100))  # Zone applicable
@@ -96,29 +87,19 @@ class PineappleTechnique(db.Model):
     
     def get_steps(self):
         """Récupère les étapes parsées"""
-        if self.steps:
-            try:
-                return json.loads(self.steps)
-            except:
-                return []
-        return []
+        return self.steps if self.steps is not None else []
     
     def set_steps(self, steps_list):
         """Définit les étapes"""
-        self.steps = json.dumps(steps_list)
+        self.steps = steps_list
     
     def get_requirements(self):
         """Récupère les exigences parsées"""
-        if self.requirements:
-            try:
-                return json.loads(self.requirements)
-            except:
-                return {}
-        return {}
+        return self.requirements if self.requirements is not None else {}
     
     def set_requirements(self, requirements_dict):
         """Définit les exigences"""
-        self.requirements = json.dumps(requirements_dict)
+        self.requirements = requirements_dict
     
     def to_dict(self):
         """Convertit en dictionnaire"""
@@ -150,12 +131,12 @@ class PineappleDisease(db.Model):
     name = db.Column(db.String(100), nullable=False)
     scientific_name = db.Column(db.String(100))
     description = db.Column(db.Text)
-    symptoms = db.Column(db.Text)  # JSON des symptômes
-    causes = db.Column(db.Text)  # JSON des causes
-    treatments = db.Column(db.Text)  # JSON des traitements
-    prevention = db.Column(db.Text)  # JSON des préventions
+    symptoms = db.Column(JSONType)  # JSON des symptômes
+    causes = db.Column(JSONType)  # JSON des causes
+    treatments = db.Column(JSONType)  # JSON des traitements
+    prevention = db.Column(JSONType)  # JSON des préventions
     severity = db.Column(db.String(50))  # Élevée, Modérée, Faible
-    affected_parts = db.Column(db.Text)  # JSON des parties affectées
+    affected_parts = db.Column(JSONType)  # JSON des parties affectées
     season_risk = db.Column(db.String(50))  # Saison à risque
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -163,68 +144,43 @@ class PineappleDisease(db.Model):
     
     def get_symptoms(self):
         """Récupère les symptômes parsés"""
-        if self.symptoms:
-            try:
-                return json.loads(self.symptoms)
-            except:
-                return []
-        return []
+        return self.symptoms if self.symptoms is not None else []
     
     def set_symptoms(self, symptoms_list):
         """Définit les symptômes"""
-        self.symptoms = json.dumps(symptoms_list)
+        self.symptoms = symptoms_list
     
     def get_causes(self):
         """Récupère les causes parsées"""
-        if self.causes:
-            try:
-                return json.loads(self.causes)
-            except:
-                return []
-        return []
+        return self.causes if self.causes is not None else []
     
     def set_causes(self, causes_list):
         """Définit les causes"""
-        self.causes = json.dumps(causes_list)
+        self.causes = causes_list
     
     def get_treatments(self):
         """Récupère les traitements parsés"""
-        if self.treatments:
-            try:
-                return json.loads(self.treatments)
-            except:
-                return []
-        return []
+        return self.treatments if self.treatments is not None else []
     
     def set_treatments(self, treatments_list):
         """Définit les traitements"""
-        self.treatments = json.dumps(treatments_list)
+        self.treatments = treatments_list
     
     def get_prevention(self):
         """Récupère les préventions parsées"""
-        if self.prevention:
-            try:
-                return json.loads(self.prevention)
-            except:
-                return []
-        return []
+        return self.prevention if self.prevention is not None else []
     
     def set_prevention(self, prevention_list):
         """Définit les préventions"""
-        self.prevention = json.dumps(prevention_list)
+        self.prevention = prevention_list
     
     def get_affected_parts(self):
         """Récupère les parties affectées parsées"""
-        if self.affected_parts:
-            try:
-                return json.loads(self.affected_parts)
-            except:
-                return []
-        return []
+        return self.affected_parts if self.affected_parts is not None else []
     
     def set_affected_parts(self, parts_list):
         """Définit les parties affectées"""
-        self.affected_parts = json.dumps(parts_list)
+        self.affected_parts = parts_list
     
     def to_dict(self):
         """Convertit en dictionnaire"""
@@ -9,6 +9,7 @@ from flask import current_app # To access app.config
 import json
 
 from src.models.database import db, AdminUser, AIConfiguration, BusinessPlanTemplate, CompanyData
+from src.services.stat_counters import stat_counters
 
 admin_bp = Blueprint('admin', __name__)
 
@@ -367,21 +368,9 @@ def update_company_data(company_id):
 @admin_bp.route('/stats', methods=['GET'])
 @jwt_required()
 def get_stats():
-    """Récupérer les statistiques du système"""
-    from src.models.database import User, Conversation, BusinessPlan, Message
-    
-    stats = {
-        'total_users': User.query.count(),
-        'active_users': User.query.filter_by(is_active=True).count(),
-        'total_conversations': Conversation.query.count(),
-        'active_conversations': Conversation.query.filter_by(status='active').count(),
-        'total_business_plans': BusinessPlan.query.count(),
-        'total_messages': Message.query.count(),
-        'total_templates': BusinessPlanTemplate.query.count(),
-        'active_templates': BusinessPlanTemplate.query.filter_by(is_active=True).count(),
-        'total_companies': CompanyData.query.count(),
-        'ai_configurations': AIConfiguration.query.filter_by(is_active=True).count()
-    }
+    """Récupérer les statistiques du système (compteurs tenus à jour, ?exact=true pour recompter les tables)"""
+    exact = request.args.get('exact', 'false').lower() == 'true'
+    stats = stat_counters.get_all(exact=exact)
     
     return jsonify(stats), 200
 
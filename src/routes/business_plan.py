@@ -4,6 +4,7 @@ from datetime import datetime
 import os
 import json
 
+from sqlalchemy.orm import raiseload, selectinload
 from src.models.database import db, BusinessPlan, BusinessPlanTemplate, User, Conversation, CompanyData
 from src.services.weather_service import WeatherService
 from src.services.enhanced_pdf_generator import EnhancedPDFGenerator
@@ -11,6 +12,7 @@ from src.services.unit_converter import UnitConverter
 from src.models.payment_models import Subscription
 from src.routes.payment import get_package_features
 from src.services.pineapple_service import PineappleService
+from src.services.pagination import field_options, keyset_page, parse_limit, serialize
 
 business_plan_bp = Blueprint('business_plan', __name__)
 
@@ -169,7 +171,7 @@ def generate_enhanced_business_plan():
                 'weather_data': weather_data,
                 'business_data': business_data
             }),
-            variables_used=json.dumps(data),
+            variables_used=data,
             file_path=pdf_path,
             file_format='pdf',
             status='generated'
@@ -420,24 +422,58 @@ def download_business_plan(business_plan_id):
 @business_plan_bp.route('/list', methods=['GET'])
 @jwt_required()
 def list_business_plans():
-    """Lister les business plans générés"""
+    """
+    Lister les business plans générés (plus récents d'abord)
+    
+    Pagination par numéro de page (?page=, ?per_page=) ; avec ?cursor= (vide pour la première page)
+    et ?limit=, pagination par curseur ; ?fields=id,company_name,status évite de lire le contenu
+    généré, ?include=template charge les templates en une requête
+    """
     user_id = request.args.get('user_id')
-    page = int(request.args.get('page', 1))
-    per_page = int(request.args.get('per_page', 20))
+    include_template = 'template' in request.args.get('include', '').split(',')
     
-    query = BusinessPlan.query
+    try:
+        options, fields = field_options(BusinessPlan, request.args.get('fields'),
+                                        required=('id', 'template_id', 'created_at'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if include_template:
+        options.append(selectinload(BusinessPlan.template))
+    query = BusinessPlan.query.options(*options, raiseload('*'))
     if user_id:
         query = query.filter_by(user_id=user_id)
     
-    business_plans = query.order_by(BusinessPlan.created_at.desc()).paginate(
-        page=page, per_page=per_page, error_out=False
-    )
+    def to_dict(business_plan):
+        data = serialize(business_plan, fields)
+        if include_template:
+            template = business_plan.template
+            data['template'] = {'id': template.id, 'name': template.name} if template else None
+        return data
+    
+    if 'cursor' not in request.args:
+        page = int(request.args.get('page', 1))
+        per_page = int(request.args.get('per_page', 20))
+        business_plans = query.order_by(BusinessPlan.created_at.desc(), BusinessPlan.id.desc()).paginate(
+            page=page, per_page=per_page, error_out=False
+        )
+        return jsonify({
+            'business_plans': [to_dict(bp) for bp in business_plans.items],
+            'total': business_plans.total,
+            'pages': business_plans.pages,
+            'current_page': page
+        }), 200
+    
+    try:
+        business_plans, next_cursor = keyset_page(query, (BusinessPlan.created_at, BusinessPlan.id),
+                                                  request.args.get('cursor'),
+                                                  parse_limit(request.args.get('limit'), 20))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
     return jsonify({
-        'business_plans': [bp.to_dict() for bp in business_plans.items],
-        'total': business_plans.total,
-        'pages': business_plans.pages,
-        'current_page': page
+        'business_plans': [to_dict(bp) for bp in business_plans],
+        'next_cursor': next_cursor
     }), 200
 
 @business_plan_bp.route('/<int:business_plan_id>', methods=['GET'])
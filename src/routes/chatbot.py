@@ -9,14 +9,22 @@ from twilio.base.exceptions import TwilioRestException
 import logging
 from src.services.gemini_service import GeminiAnalysisService
 from src.services.document_generator import DocumentGenerator
-from src.models.database import db, User, Conversation, Message, WebhookLog, BusinessPlanTemplate, get_db_connection
+from sqlalchemy.orm import raiseload, selectinload
+from src.models.database import db, User, Conversation, Message, BusinessPlanTemplate, get_db_connection
 from src.services.disease_detection import DiseaseDetectionService
 from src.services.enhanced_pdf_generator import EnhancedPDFGenerator
-import base64
 import io
 import json
 from src.models.diagnosis_log import DiagnosisLog
 from src.services.conversational_ai import ConversationalAI
+from src.services.tracing import tracer, trace_request
+from src.services.monitoring_service import monitoring_service
+from src.services.archive_service import archive_service
+from src.services.blob_store import blob_store
+from src.services.buffered_writer import buffered_writer
+from src.services.identity_resolver import identity_resolver
+from src.services.pagination import (decode_cursor, encode_cursor, field_options, keyset_page, parse_limit,
+                                     serialize, stream_json)
 
 logger = logging.getLogger(__name__)
 
@@ -130,7 +138,7 @@ def process_bot_response(conversation: Conversation, message: Message) -> None:
             sent = bool(send_whatsapp_message(chat_id, response_text))
         
         if sent:
-            # Enregistrer la réponse du bot dans la base de données
+            # Enregistrer la réponse du bot dans la base de données (relue par l'historique au message suivant)
             bot_message = Message(
                 conversation_id=conversation.id,
                 sender='bot',
@@ -238,7 +246,8 @@ def process_ai_actions(actions: List[str], user_id: str, platform: str, platform
 @chatbot_bp.route('/webhook/telegram', methods=['POST'])
 def telegram_webhook():
     """Webhook pour recevoir les messages Telegram"""
-    log = None
+    data = None
+    logged = False
     
     try:
         # Reset any stale transaction state
@@ -252,20 +261,7 @@ def telegram_webhook():
         if 'message' not in data:
             return jsonify({'error': 'Invalid webhook data: no message found'}), 400
 
-        # Initialize webhook log
-        log = WebhookLog(
-            platform='telegram',
-            webhook_data='{}',  # Initialize with empty string
-            processed=False,
-            error_message=None
-        )
-        
         try:
-            # Save webhook data
-            log.set_webhook_data(data)
-            db.session.add(log)
-            db.session.flush()
-            
             # Get message data
             message_data = data['message']
             user_data = message_data.get('from', {})
@@ -275,22 +271,20 @@ def telegram_webhook():
             if not user_data.get('id') or not chat_data.get('id'):
                 raise ValueError('Missing required user or chat ID in webhook data')
             
-            # Create or get user
-            user = get_or_create_user(
+            # Upsert user and active conversation in the webhook transaction
+            user_id, conversation_id = identity_resolver.resolve(
                 platform='telegram',
                 platform_user_id=str(user_data.get('id')),
+                session_id=str(chat_data.get('id')),
                 username=user_data.get('username'),
                 first_name=user_data.get('first_name'),
                 last_name=user_data.get('last_name'),
                 language_code=user_data.get('language_code', 'fr')
             )
             
-            # Create or get conversation
-            conversation = get_or_create_conversation(user.id, str(chat_data.get('id')))
-            
             # Create message
             message = Message(
-                conversation_id=conversation.id,
+                conversation_id=conversation_id,
                 sender='user',
                 message_type='text',
                 content=message_data.get('text', '')
@@ -307,15 +301,16 @@ def telegram_webhook():
             # Save message
             db.session.add(message)
             
-            # Mark webhook as processed
-            log.processed = True
-            
             # Commit all changes
             db.session.commit()
             
+            # Webhook log written in the background (buffered writer)
+            buffered_writer.log_webhook('telegram', data, processed=True)
+            logged = True
+            
             try:
                 # Process bot response in a separate transaction
-                process_bot_response(conversation, message)
+                process_bot_response(db.session.get(Conversation, conversation_id), message)
             except Exception as bot_error:
                 print(f"Error in bot response: {str(bot_error)}")
                 # Don't fail the webhook just because the bot response failed
@@ -324,31 +319,16 @@ def telegram_webhook():
             
         except Exception as e:
             db.session.rollback()
-            if log:
-                log.error_message = str(e)
-                db.session.add(log)
-                db.session.commit()
             raise
             
     except Exception as e:
         error_msg = str(e)
         print(f"Telegram webhook error: {error_msg}")
+        monitoring_service.log_error('webhook', error_msg, {'platform': 'telegram', 'exception': type(e).__name__})
         
-        # Try to log the error if we haven't already
-        if log is None:
-            try:
-                log = WebhookLog(
-                    platform='telegram',
-                    webhook_data='{}',
-                    processed=False,
-                    error_message=error_msg
-                )
-                if data:
-                    log.set_webhook_data(data)
-                db.session.add(log)
-                db.session.commit()
-            except Exception as log_error:
-                print(f"Failed to log webhook error: {str(log_error)}")
+        # Log the error if the webhook was not logged yet
+        if not logged:
+            buffered_writer.log_webhook('telegram', data or {}, error_message=error_msg)
         
         return jsonify({
             'error': 'Internal server error',
@@ -361,14 +341,6 @@ def messenger_webhook():
     try:
         data = request.get_json()
         
-        # Logger le webhook
-        log = WebhookLog(
-            platform='messenger',
-            webhook_data={}
-        )
-        log.set_webhook_data(data)
-        db.session.add(log)
-        
         # Traiter les entrées
         if 'entry' in data:
             for entry in data['entry']:
@@ -377,21 +349,23 @@ def messenger_webhook():
                         if 'message' in messaging_event:
                             process_messenger_message(messaging_event)
         
-        log.processed = True
         db.session.commit()
+        buffered_writer.log_webhook('messenger', data, processed=True)
         
         return jsonify({'status': 'ok'}), 200
         
     except Exception as e:
-        if 'log' in locals():
-            log.error_message = str(e)
-            db.session.commit()
+        db.session.rollback()
+        if 'data' in locals():
+            buffered_writer.log_webhook('messenger', data, error_message=str(e))
         return jsonify({'error': str(e)}), 500
 
 # @chatbot_bp.route('/webhook/whatsapp', methods=['POST'])  # SUPPRIMÉE - Route enregistrée directement dans main.py
+@trace_request('whatsapp.webhook')
 def whatsapp_webhook():
     """Webhook pour recevoir les messages Twilio WhatsApp"""
-    log = None
+    data = None
+    logged = False
     
     try:
         # Gérer les deux formats possibles : form data (Twilio) et JSON (WhatsApp Business API)
@@ -412,57 +386,22 @@ def whatsapp_webhook():
                 except:
                     return jsonify({'error': 'No form data or JSON data received'}), 400
         
-        # Logger le webhook
-        log = WebhookLog(
-            platform='whatsapp',
-            webhook_data='{}',
-            processed=False,
-            error_message=None
-        )
-        log.set_webhook_data(data)
-        db.session.add(log)
-        db.session.flush()
-        
         # Extraire les données du message selon le format
-        if 'Body' in data and 'From' in data:
-            # Format Twilio
-            message_sid = data.get('MessageSid')
-            from_number = data.get('From', '').replace('whatsapp:', '')
-            body = data.get('Body', '')
-        elif 'messages' in data:
-            # Format WhatsApp Business API
-            messages = data.get('messages', [])
-            if messages:
-                message_data = messages[0]
-                message_sid = message_data.get('id')
-                from_number = message_data.get('from', '')
-                body = message_data.get('text', {}).get('body', '')
-            else:
-                message_sid = None
-                from_number = ''
-                body = ''
-        else:
-            # Format personnalisé
-            message_sid = data.get('MessageSid') or data.get('id')
-            from_number = data.get('From') or data.get('from', '')
-            body = data.get('Body') or data.get('body', '')
+        message_sid, from_number, body = parse_whatsapp_payload(data)
         
         if not from_number:
             raise ValueError('Missing required WhatsApp message data: from_number')
         
-        # Créer ou récupérer l'utilisateur
-        user = get_or_create_user(
+        # Utilisateur et conversation active (upsert dans la transaction du webhook)
+        user_id, conversation_id = identity_resolver.resolve(
             platform='whatsapp',
             platform_user_id=from_number,
             phone_number=from_number
         )
         
-        # Créer ou récupérer la conversation
-        conversation = get_or_create_conversation(user.id, from_number)
-        
         # Enregistrer le message
         message = Message(
-            conversation_id=conversation.id,
+            conversation_id=conversation_id,
             sender='user',
             message_type='text',
             content=body,
@@ -480,11 +419,13 @@ def whatsapp_webhook():
         
         db.session.add(message)
         
-        # Marquer le webhook comme traité
-        log.processed = True
-        
         # Commit all changes
-        db.session.commit()
+        with tracer.span('db.commit'):
+            db.session.commit()
+        
+        # Journal du webhook inséré par lot en arrière-plan
+        buffered_writer.log_webhook('whatsapp', data, processed=True)
+        logged = True
         
         # Nouveau système avec Gemini
         try:
@@ -571,6 +512,8 @@ Tapez votre projet de maïs en commençant par "Je veux" pour commencer ! 🚀""
                         logger.info(f"✅ Message de bienvenue envoyé à {from_number}")
         except Exception as bot_error:
             logger.error(f"💥 Erreur critique génération: {str(bot_error)}")
+            monitoring_service.log_error('plan_generation', str(bot_error),
+                                         {'platform': 'whatsapp', 'exception': type(bot_error).__name__})
             try:
                 from src.services.whatsapp_service import whatsapp_service
                 whatsapp_service.send_system_error_message(from_number)
@@ -582,15 +525,41 @@ Tapez votre projet de maïs en commençant par "Je veux" pour commencer ! 🚀""
     except Exception as e:
         error_msg = str(e)
         print(f"WhatsApp webhook error: {error_msg}")
+        monitoring_service.log_error('webhook', error_msg, {'platform': 'whatsapp', 'exception': type(e).__name__})
         
-        if log:
-            db.session.rollback()
-            log.error_message = error_msg
-            db.session.add(log)
-            db.session.commit()
+        db.session.rollback()
+        if data and not logged:
+            buffered_writer.log_webhook('whatsapp', data, error_message=error_msg)
         
         return jsonify({'error': 'Internal server error', 'details': error_msg}), 500
 
+@tracer.span('webhook.parse')
+def parse_whatsapp_payload(data: Dict[str, Any]):
+    """Extrait (message_sid, from_number, body) d'un webhook Twilio, WhatsApp Business ou personnalisé"""
+    if 'Body' in data and 'From' in data:
+        # Format Twilio
+        message_sid = data.get('MessageSid')
+        from_number = data.get('From', '').replace('whatsapp:', '')
+        body = data.get('Body', '')
+    elif 'messages' in data:
+        # Format WhatsApp Business API
+        messages = data.get('messages', [])
+        if messages:
+            message_data = messages[0]
+            message_sid = message_data.get('id')
+            from_number = message_data.get('from', '')
+            body = message_data.get('text', {}).get('body', '')
+        else:
+            message_sid = None
+            from_number = ''
+            body = ''
+    else:
+        # Format personnalisé
+        message_sid = data.get('MessageSid') or data.get('id')
+        from_number = data.get('From') or data.get('from', '')
+        body = data.get('Body') or data.get('body', '')
+    return message_sid, from_number, body
+
 def process_whatsapp_message(message: Dict[str, Any]) -> None:
     """Traiter un message WhatsApp entrant"""
     try:
@@ -602,19 +571,16 @@ def process_whatsapp_message(message: Dict[str, Any]) -> None:
         if not from_number:
             raise ValueError('Missing sender phone number in message')
         
-        # Créer ou récupérer l'utilisateur
-        user = get_or_create_user(
+        # Utilisateur et conversation active, validés avec le message
+        user_id, conversation_id = identity_resolver.resolve(
             platform='whatsapp',
             platform_user_id=from_number,
             phone_number=from_number
         )
         
-        # Créer ou récupérer la conversation
-        conversation = get_or_create_conversation(user.id, from_number)
-        
         # Créer le message
         db_message = Message(
-            conversation_id=conversation.id,
+            conversation_id=conversation_id,
             sender='user',
             message_type=message_type,
             content=message_content
@@ -631,7 +597,7 @@ def process_whatsapp_message(message: Dict[str, Any]) -> None:
         db.session.commit()
         
         # Traiter la réponse du bot
-        process_bot_response(conversation, db_message)
+        process_bot_response(db.session.get(Conversation, conversation_id), db_message)
         
     except Exception as e:
         db.session.rollback()
@@ -668,136 +634,140 @@ def whatsapp_webhook_verify():
 
 @chatbot_bp.route('/users', methods=['GET'])
 def get_users():
-    """Récupérer la liste des utilisateurs"""
+    """
+    Récupérer la liste des utilisateurs
+    
+    Pagination par numéro de page (?page=, ?per_page=) ; avec ?cursor= (vide pour la première page)
+    et ?limit=, pagination par curseur, plus récents d'abord ; ?fields=id,username limite les colonnes lues
+    """
     platform = request.args.get('platform')
-    page = int(request.args.get('page', 1))
-    per_page = int(request.args.get('per_page', 50))
     
-    query = User.query
+    try:
+        options, fields = field_options(User, request.args.get('fields'), required=('id', 'created_at'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    query = User.query.options(*options, raiseload('*'))
     if platform:
         query = query.filter_by(platform=platform)
     
-    users = query.paginate(page=page, per_page=per_page, error_out=False)
+    if 'cursor' not in request.args:
+        page = int(request.args.get('page', 1))
+        per_page = int(request.args.get('per_page', 50))
+        # Ordre d'insertion, comme avant la pagination par curseur
+        users = query.order_by(User.id.asc()).paginate(
+            page=page, per_page=per_page, error_out=False
+        )
+        return jsonify({
+            'users': [serialize(user, fields) for user in users.items],
+            'total': users.total,
+            'pages': users.pages,
+            'current_page': page
+        }), 200
+    
+    try:
+        users, next_cursor = keyset_page(query, (User.created_at, User.id), request.args.get('cursor'),
+                                         parse_limit(request.args.get('limit'), 50))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
     return jsonify({
-        'users': [user.to_dict() for user in users.items],
-        'total': users.total,
-        'pages': users.pages,
-        'current_page': page
+        'users': [serialize(user, fields) for user in users],
+        'next_cursor': next_cursor
     }), 200
 
 @chatbot_bp.route('/conversations', methods=['GET'])
 def get_conversations():
-    """Récupérer la liste des conversations"""
+    """
+    Récupérer la liste des conversations (plus récemment actives d'abord)
+    
+    Pagination par numéro de page (?page=, ?per_page=) ; avec ?cursor= (vide pour la première page)
+    et ?limit=, pagination par curseur ; ?fields= limite les colonnes lues, ?include=user charge
+    les utilisateurs en une requête
+    """
     user_id = request.args.get('user_id')
     status = request.args.get('status')
-    page = int(request.args.get('page', 1))
-    per_page = int(request.args.get('per_page', 50))
+    include_user = 'user' in request.args.get('include', '').split(',')
+    
+    try:
+        options, fields = field_options(Conversation, request.args.get('fields'),
+                                        required=('id', 'user_id', 'updated_at'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    query = Conversation.query
+    if include_user:
+        # Une seule requête IN pour tous les utilisateurs de la page
+        options.append(selectinload(Conversation.user))
+    query = Conversation.query.options(*options, raiseload('*'))
     if user_id:
         query = query.filter_by(user_id=user_id)
     if status:
         query = query.filter_by(status=status)
     
-    conversations = query.order_by(Conversation.updated_at.desc()).paginate(
-        page=page, per_page=per_page, error_out=False
-    )
+    def to_dict(conversation):
+        data = serialize(conversation, fields)
+        if include_user:
+            data['user'] = conversation.user.to_dict() if conversation.user else None
+        return data
+    
+    if 'cursor' not in request.args:
+        page = int(request.args.get('page', 1))
+        per_page = int(request.args.get('per_page', 50))
+        conversations = query.order_by(Conversation.updated_at.desc(), Conversation.id.desc()).paginate(
+            page=page, per_page=per_page, error_out=False
+        )
+        return jsonify({
+            'conversations': [to_dict(conv) for conv in conversations.items],
+            'total': conversations.total,
+            'pages': conversations.pages,
+            'current_page': page
+        }), 200
+    
+    try:
+        conversations, next_cursor = keyset_page(query, (Conversation.updated_at, Conversation.id),
+                                                 request.args.get('cursor'),
+                                                 parse_limit(request.args.get('limit'), 50))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
     return jsonify({
-        'conversations': [conv.to_dict() for conv in conversations.items],
-        'total': conversations.total,
-        'pages': conversations.pages,
-        'current_page': page
+        'conversations': [to_dict(conv) for conv in conversations],
+        'next_cursor': next_cursor
     }), 200
 
 @chatbot_bp.route('/conversations/<int:conversation_id>/messages', methods=['GET'])
 def get_conversation_messages(conversation_id):
-    """Récupérer les messages d'une conversation"""
+    """
+    Récupérer les messages d'une conversation (archivés puis récents)
+    
+    Pagination par numéro de page (?page=, ?per_page=) ; avec ?cursor= (vide pour la première page)
+    et ?limit=, pagination par curseur
+    """
+    if 'cursor' in request.args:
+        columns = (Message.created_at, Message.id)
+        cursor = request.args.get('cursor')
+        try:
+            after = decode_cursor(cursor, columns) if cursor else None
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        messages, next_key = archive_service.conversation_messages_after(
+            conversation_id, after, parse_limit(request.args.get('limit'), 100)
+        )
+        return jsonify({
+            'messages': messages,
+            'next_cursor': encode_cursor(next_key) if next_key else None
+        }), 200
+    
     page = int(request.args.get('page', 1))
     per_page = int(request.args.get('per_page', 100))
     
-    messages = Message.query.filter_by(conversation_id=conversation_id)\
-        .order_by(Message.created_at.asc())\
-        .paginate(page=page, per_page=per_page, error_out=False)
-    
-    return jsonify({
-        'messages': [msg.to_dict() for msg in messages.items],
-        'total': messages.total,
-        'pages': messages.pages,
-        'current_page': page
-    }), 200
-
-def get_or_create_user(platform, platform_user_id, **kwargs):
-    """Créer ou récupérer un utilisateur"""
-    try:
-        # Try to find existing user
-        user = User.query.filter_by(
-            platform=platform,
-            platform_user_id=platform_user_id
-        ).first()
-        
-        if not user:
-            # Create new user
-            user = User(
-                platform=platform,
-                platform_user_id=platform_user_id,
-                **kwargs
-            )
-            db.session.add(user)
-        else:
-            # Update existing user
-            user.last_interaction = datetime.utcnow()
-            
-            # Update changed information
-            for key, value in kwargs.items():
-                if hasattr(user, key) and value:
-                    setattr(user, key, value)
-        
-        # Commit to ensure user has an ID
-        db.session.commit()
-        return user
-        
-    except Exception as e:
-        db.session.rollback()
-        raise
+    return jsonify(archive_service.conversation_messages(conversation_id, page=page, per_page=per_page)), 200
 
-def get_or_create_conversation(user_id, session_id):
-    """Créer ou récupérer une conversation"""
-    try:
-        if not user_id:
-            raise ValueError("user_id cannot be None")
-        if not session_id:
-            raise ValueError("session_id cannot be None")
-            
-        # Try to find existing conversation
-        conversation = Conversation.query.filter_by(
-            user_id=user_id,
-            session_id=session_id,
-            status='active'
-        ).first()
-        
-        if not conversation:
-            # Create new conversation
-            conversation = Conversation(
-                user_id=user_id,
-                session_id=session_id,
-                status='active',
-                created_at=datetime.utcnow(),
-                updated_at=datetime.utcnow()
-            )
-            db.session.add(conversation)
-        else:
-            # Update existing conversation
-            conversation.updated_at = datetime.utcnow()
-        
-        # Commit changes
-        db.session.commit()
-        return conversation
-        
-    except Exception as e:
-        db.session.rollback()
-        raise
+@chatbot_bp.route('/conversations/<int:conversation_id>/messages/export', methods=['GET'])
+def export_conversation_messages(conversation_id):
+    """Exporter tous les messages d'une conversation (réponse JSON produite au fil de la lecture)"""
+    return stream_json(archive_service.iter_conversation_messages(conversation_id),
+                       key='messages', conversation_id=conversation_id)
 
 def process_messenger_message(messaging_event):
     """Traiter un message Facebook Messenger"""
@@ -805,18 +775,15 @@ def process_messenger_message(messaging_event):
         sender_id = messaging_event['sender']['id']
         message_data = messaging_event['message']
         
-        # Créer ou récupérer l'utilisateur
-        user = get_or_create_user(
+        # Utilisateur et conversation active, validés avec le message
+        user_id, conversation_id = identity_resolver.resolve(
             platform='messenger',
             platform_user_id=sender_id
         )
         
-        # Créer ou récupérer la conversation
-        conversation = get_or_create_conversation(user.id, sender_id)
-        
         # Enregistrer le message
         message = Message(
-            conversation_id=conversation.id,
+            conversation_id=conversation_id,
             sender='user',
             message_type='text',
             content=message_data.get('text', '')
@@ -830,7 +797,7 @@ def process_messenger_message(messaging_event):
         db.session.commit()
         
         # Process bot response
-        process_bot_response(conversation, message)
+        process_bot_response(db.session.get(Conversation, conversation_id), message)
         
     except Exception as e:
         db.session.rollback()
@@ -842,6 +809,7 @@ def process_messenger_message(messaging_event):
 #     """Route alternative pour le webhook WhatsApp"""
 #     return whatsapp_webhook()
 
+@tracer.span('db.get_templates')
 def get_all_templates():
     """Récupère tous les templates de la base de données."""
     try:
@@ -851,7 +819,7 @@ def get_all_templates():
         cursor.execute("""
             SELECT id, name, category, file_path, file_type, created_at
             FROM business_plan_templates
-            WHERE is_active = 1
+            WHERE is_active = TRUE
             ORDER BY created_at DESC
         """)
         
@@ -872,6 +840,7 @@ def get_all_templates():
         logger.error(f"Erreur récupération templates: {str(e)}")
         return []
 
+@tracer.span('business_plan.generate')
 def generate_business_plan_with_gemini(user_message, phone_number):
     """Génère un business plan complet avec Gemini basé sur le message utilisateur."""
     try:
@@ -957,6 +926,7 @@ def generate_business_plan_with_gemini(user_message, phone_number):
         }
 
 @chatbot_bp.route('/whatsapp-gemini', methods=['POST'])
+@trace_request('whatsapp_gemini.webhook')
 def whatsapp_gemini_webhook():
     """
     Webhook WhatsApp avec Gemini AI - génère automatiquement un business plan 
@@ -1110,6 +1080,7 @@ Tapez votre projet de maïs en commençant par "Je veux" pour commencer ! 🚀""
         
     except Exception as e:
         logger.error(f"💥 Erreur critique webhook WhatsApp: {str(e)}")
+        monitoring_service.log_error('webhook', str(e), {'platform': 'whatsapp-gemini', 'exception': type(e).__name__})
         
         # Envoyer message d'erreur système
         try:
@@ -1302,18 +1273,15 @@ def handle_text_message(platform: str, user_id: str, text: str):
     Gère le traitement d'un message texte avec IA conversationnelle
     """
     try:
-        # Créer ou récupérer l'utilisateur
-        user = get_or_create_user(
+        # Utilisateur et conversation active, validés avec le message
+        _, conversation_id = identity_resolver.resolve(
             platform=platform,
             platform_user_id=user_id
         )
         
-        # Créer ou récupérer la conversation
-        conversation = get_or_create_conversation(user.id, user_id)
-        
         # Créer le message utilisateur
         message = Message(
-            conversation_id=conversation.id,
+            conversation_id=conversation_id,
             sender='user',
             message_type='text',
             content=text
@@ -1323,7 +1291,7 @@ def handle_text_message(platform: str, user_id: str, text: str):
         db.session.commit()
         
         # Traiter avec l'IA conversationnelle
-        process_bot_response(conversation, message)
+        process_bot_response(db.session.get(Conversation, conversation_id), message)
         
     except Exception as e:
         db.session.rollback()
@@ -1358,6 +1326,9 @@ def handle_photo_message(platform: str, user_id: str, photo_data: bytes, caption
             db.session.add(user)
             db.session.commit()
         
+        # Photo enregistrée une fois (une photo déjà reçue n'est pas dupliquée)
+        photo_hash = blob_store.put(photo_data)
+        
         # Diagnostic de la maladie
         culture = user.primary_culture or 'mais'
         diagnosis = disease_service.detect_disease(photo_data, culture)
@@ -1389,7 +1360,7 @@ def handle_photo_message(platform: str, user_id: str, photo_data: bytes, caption
             send_message(platform, user_id, diagnosis_message)
             
             # Générer PDF diagnostic (premium)
-            pdf_path = generate_diagnosis_pdf(user, diagnosis, photo_data)
+            pdf_path = generate_diagnosis_pdf(user, diagnosis, photo_hash)
             
             if pdf_path:
                 # Envoyer le PDF
@@ -1419,7 +1390,7 @@ def handle_photo_message(platform: str, user_id: str, photo_data: bytes, caption
             )
         
         # Enregistrer l'interaction
-        log_diagnosis_interaction(user.id, diagnosis, photo_data)
+        log_diagnosis_interaction(user.id, diagnosis, photo_hash)
         
     except Exception as e:
         print(f"Erreur diagnostic photo: {e}")
@@ -1429,14 +1400,14 @@ def handle_photo_message(platform: str, user_id: str, photo_data: bytes, caption
             "Veuillez réessayer ou contacter le support."
         )
 
-def generate_diagnosis_pdf(user: User, diagnosis: Dict, photo_data: bytes) -> Optional[str]:
+def generate_diagnosis_pdf(user: User, diagnosis: Dict, photo_hash: str) -> Optional[str]:
     """
     Génère un PDF de diagnostic complet
     
     Args:
         user (User): Utilisateur
         diagnosis (dict): Résultats du diagnostic
-        photo_data (bytes): Données de la photo
+        photo_hash (str): Empreinte de la photo dans le stockage de fichiers
         
     Returns:
         str: Chemin du PDF généré ou None si erreur
@@ -1451,7 +1422,8 @@ def generate_diagnosis_pdf(user: User, diagnosis: Dict, photo_data: bytes) -> Op
                 'date': datetime.now().strftime('%d/%m/%Y à %H:%M')
             },
             'diagnosis': diagnosis,
-            'photo_data': base64.b64encode(photo_data).decode('utf-8')
+            'photo_hash': photo_hash,
+            'photo_path': blob_store.thumbnail_path(photo_hash)
         }
         
         # Générer le PDF
@@ -1471,14 +1443,14 @@ def generate_diagnosis_pdf(user: User, diagnosis: Dict, photo_data: bytes) -> Op
         print(f"Erreur génération PDF diagnostic: {e}")
         return None
 
-def log_diagnosis_interaction(user_id: int, diagnosis: Dict, photo_data: bytes):
+def log_diagnosis_interaction(user_id: int, diagnosis: Dict, photo_hash: str):
     """
     Enregistre l'interaction de diagnostic en base
     
     Args:
         user_id (int): ID de l'utilisateur
         diagnosis (dict): Résultats du diagnostic
-        photo_data (bytes): Données de la photo
+        photo_hash (str): Empreinte de la photo dans le stockage de fichiers
     """
     try:
         # Créer une entrée de diagnostic
@@ -1488,8 +1460,8 @@ def log_diagnosis_interaction(user_id: int, diagnosis: Dict, photo_data: bytes):
             confidence=diagnosis.get('confidence', 0),
             severity=diagnosis.get('severity', 'Inconnue'),
             culture=diagnosis.get('culture', 'mais'),
-            photo_data=base64.b64encode(photo_data).decode('utf-8'),
-            diagnosis_data=json.dumps(diagnosis),
+            photo_hash=photo_hash,
+            diagnosis_data=diagnosis,
             created_at=datetime.now()
         )
         
@@ -3,20 +3,40 @@ Routes pour les services de performance et monitoring
 Cache, monitoring et optimisation base de données
 """
 
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, jsonify, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from src.services.cache_service import CacheService
-from src.services.monitoring_service import MonitoringService
+from functools import wraps
+from src.services.cache_service import cache_service
+from src.services.monitoring_service import monitoring_service
+from src.services.archive_service import ARCHIVED_TABLES, archive_service
 from src.services.database_optimizer import DatabaseOptimizer
+from src.services.db_instrumentation import query_shapes
+from src.services.tracing import tracer
+from src.services.profiler import sampling_profiler
+from src.services.slo_service import slo_service
 import time
+from datetime import datetime
 
 performance_bp = Blueprint('performance', __name__)
 
 # Initialiser les services
-cache_service = CacheService()
-monitoring_service = MonitoringService()
 db_optimizer = DatabaseOptimizer()
 
+def admin_required(view):
+    """Réserve une route aux administrateurs actifs (token JWT émis par /api/admin/login)"""
+    @wraps(view)
+    @jwt_required()
+    def wrapper(*args, **kwargs):
+        from src.models.database import AdminUser
+        
+        jwt_identity = get_jwt_identity()
+        admin_id = jwt_identity.get('user_id') if isinstance(jwt_identity, dict) else None
+        admin = AdminUser.query.get(admin_id) if admin_id else None
+        if not admin or not admin.is_active:
+            return jsonify({'success': False, 'error': 'Accès réservé aux administrateurs'}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
 @performance_bp.route('/cache/health', methods=['GET'])
 def cache_health():
     """
@@ -71,6 +91,38 @@ def clear_cache():
             'error': f'Erreur effacement cache: {str(e)}'
         }), 500
 
+@performance_bp.route('/cache/clear-tags', methods=['POST'])
+@jwt_required()
+def clear_cache_tags():
+    """
+    Invalide les clés enregistrées sous un ou plusieurs tags
+    """
+    try:
+        data = request.get_json() or {}
+        tags = data.get('tags') or []
+
+        if isinstance(tags, str):
+            tags = [tags]
+
+        if not tags:
+            return jsonify({
+                'success': False,
+                'error': 'Tags manquants'
+            }), 400
+
+        deleted_count = cache_service.invalidate_tags(*tags)
+
+        return jsonify({
+            'success': True,
+            'deleted_count': deleted_count,
+            'tags': tags
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f'Erreur invalidation tags cache: {str(e)}'
+        }), 500
+
 @performance_bp.route('/cache/clear-user', methods=['POST'])
 @jwt_required()
 def clear_user_cache():
@@ -120,6 +172,24 @@ def monitoring_health():
             'message': f'Erreur vérification monitoring: {str(e)}'
         }), 500
 
+@performance_bp.route('/monitoring/slo', methods=['GET'])
+@admin_required
+def monitoring_slo():
+    """
+    État des objectifs de latence (taux de consommation du budget par fenêtre)
+    """
+    try:
+        report = slo_service.evaluate()
+        return jsonify({
+            'success': True,
+            'slo': report
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f'Erreur évaluation SLO: {str(e)}'
+        }), 500
+
 @performance_bp.route('/monitoring/api-stats', methods=['GET'])
 def get_api_stats():
     """
@@ -168,6 +238,27 @@ def get_summary():
             'error': f'Erreur rapport synthèse: {str(e)}'
         }), 500
 
+@performance_bp.route('/monitoring/history', methods=['GET'])
+def get_performance_history():
+    """
+    Historique des métriques système et processus (brut, 1m, 10m ou 1h)
+    """
+    try:
+        hours = float(request.args.get('hours', 24))
+        resolution = request.args.get('resolution')
+        history = monitoring_service.get_performance_history(hours, resolution)
+        
+        return jsonify({
+            'success': True,
+            'count': len(history),
+            'history': history
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f'Erreur historique performances: {str(e)}'
+        }), 500
+
 @performance_bp.route('/monitoring/export', methods=['GET'])
 def export_metrics():
     """
@@ -188,6 +279,85 @@ def export_metrics():
             'error': f'Erreur export métriques: {str(e)}'
         }), 500
 
+@performance_bp.route('/traces/slowest', methods=['GET'])
+@admin_required
+def slowest_traces():
+    """
+    Traces récentes les plus lentes, détaillées par étape (tous workers)
+    """
+    try:
+        limit = min(int(request.args.get('limit', 10)), 100)
+        minutes = float(request.args.get('minutes', 60))
+        traces = tracer.slowest(limit=limit, minutes=minutes, name=request.args.get('name'))
+        
+        return jsonify({
+            'success': True,
+            'count': len(traces),
+            'traces': traces
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f'Erreur traces: {str(e)}'
+        }), 500
+
+@performance_bp.route('/profiler/start', methods=['POST'])
+@admin_required
+def start_profiler():
+    """
+    Lance un profilage statistique borné dans le worker qui reçoit la requête
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        result = sampling_profiler.start(
+            duration=float(data.get('duration', 10)),
+            interval_ms=float(data.get('interval_ms', 10)),
+            route=data.get('route'),
+            requests_only=bool(data.get('requests_only', False))
+        )
+        return jsonify(result), 202 if result['success'] else 409
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f'Erreur démarrage profilage: {str(e)}'
+        }), 500
+
+@performance_bp.route('/profiler/<session_id>', methods=['GET'])
+@admin_required
+def get_profiler_session(session_id):
+    """
+    État d'une session et fonctions les plus échantillonnées
+    """
+    session = sampling_profiler.get_session(session_id)
+    if not session:
+        return jsonify({'success': False, 'error': 'Session inconnue'}), 404
+    
+    response = {'success': True, 'session': session}
+    if session['status'] != 'running':
+        response['top_functions'] = sampling_profiler.top_functions(session_id)
+    return jsonify(response)
+
+@performance_bp.route('/profiler/<session_id>/collapsed', methods=['GET'])
+@admin_required
+def get_profiler_collapsed(session_id):
+    """
+    Résultat au format collapsed stacks (flamegraph.pl, speedscope)
+    """
+    collapsed = sampling_profiler.get_collapsed(session_id)
+    if collapsed is None:
+        return jsonify({'success': False, 'error': 'Profil indisponible (session inconnue ou en cours)'}), 404
+    return Response(collapsed, mimetype='text/plain')
+
+@performance_bp.route('/profiler/<session_id>/stop', methods=['POST'])
+@admin_required
+def stop_profiler(session_id):
+    """
+    Arrête une session avant la fin de sa durée
+    """
+    if not sampling_profiler.stop(session_id):
+        return jsonify({'success': False, 'error': 'Session inconnue'}), 404
+    return jsonify({'success': True, 'session_id': session_id})
+
 @performance_bp.route('/database/optimize', methods=['POST'])
 @jwt_required()
 def optimize_database():
@@ -287,6 +457,164 @@ def get_query_suggestions():
             'message': f'Erreur suggestions: {str(e)}'
         }), 500
 
+@performance_bp.route('/database/index-advice', methods=['GET'])
+@admin_required
+def get_index_advice():
+    """
+    Index proposés à partir des requêtes exécutées par ce worker (sans modifier la base)
+    """
+    try:
+        result = db_optimizer.advise_indexes(repeat=request.args.get('repeat', 20, type=int))
+        return jsonify(result)
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'message': f'Erreur conseiller d\'index: {str(e)}'
+        }), 500
+
+@performance_bp.route('/database/index-advice/apply', methods=['POST'])
+@admin_required
+def apply_index_advice():
+    """
+    Crée les index proposés qui sont utilisés par le planificateur
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        result = db_optimizer.advise_indexes(queries=data.get('queries'), apply=True,
+                                             repeat=int(data.get('repeat', 20)))
+        return jsonify(result)
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'message': f'Erreur conseiller d\'index: {str(e)}'
+        }), 500
+
+@performance_bp.route('/database/slow-queries', methods=['GET'])
+@admin_required
+def get_slow_queries():
+    """
+    Requêtes SQL par empreinte (les plus coûteuses d'abord) et requêtes lentes récentes, tous workers
+    """
+    try:
+        limit = min(request.args.get('limit', 20, type=int), 100)
+        sort = request.args.get('sort', 'total')
+        if sort not in ('total', 'p95', 'count', 'rows'):
+            return jsonify({
+                'success': False,
+                'error': 'Classement inconnu (total, p95, count, rows)'
+            }), 400
+        
+        statistics = monitoring_service.get_query_statistics(limit=limit, sort=sort)
+        return jsonify({
+            'success': True,
+            **statistics
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f'Erreur requêtes lentes: {str(e)}'
+        }), 500
+
+@performance_bp.route('/database/slow-queries/reset', methods=['POST'])
+@admin_required
+def reset_slow_queries():
+    """
+    Remet à zéro le relevé des requêtes du worker courant
+    """
+    try:
+        query_shapes.reset()
+        monitoring_service.publish_snapshot(force=True)
+        return jsonify({
+            'success': True,
+            'message': 'Relevé des requêtes remis à zéro'
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f'Erreur remise à zéro: {str(e)}'
+        }), 500
+
+@performance_bp.route('/database/archive', methods=['GET'])
+@admin_required
+def get_archive_stats():
+    """
+    Segments archivés par table (lignes, compression, périodes couvertes)
+    """
+    try:
+        return jsonify({
+            'success': True,
+            'archive': archive_service.get_stats()
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f'Erreur statistiques archivage: {str(e)}'
+        }), 500
+
+@performance_bp.route('/database/archive', methods=['POST'])
+@admin_required
+def run_archive():
+    """
+    Archive maintenant les lignes anciennes ; enable_incremental_vacuum convertit d'abord la base (VACUUM complet)
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        result = {}
+        if data.get('enable_incremental_vacuum'):
+            result['enable_incremental_vacuum'] = archive_service.enable_incremental_vacuum()
+        result.update(archive_service.archive(tables=data.get('tables'), vacuum=data.get('vacuum', True)))
+        return jsonify(result)
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'message': f'Erreur archivage: {str(e)}'
+        }), 500
+
+@performance_bp.route('/database/archive/<table_name>', methods=['GET'])
+@admin_required
+def read_archive(table_name):
+    """
+    Lignes archivées d'une table, filtrées par clé de partition (conversation ou plateforme) et période
+    """
+    try:
+        if table_name not in ARCHIVED_TABLES:
+            return jsonify({
+                'success': False,
+                'error': f'Table non archivée: {table_name}'
+            }), 404
+        
+        limit = min(request.args.get('limit', 100, type=int), 1000)
+        since = request.args.get('since')
+        until = request.args.get('until')
+        rows = []
+        for row in archive_service.read_archived(table_name, partition_key=request.args.get('key'),
+                                                 since=datetime.fromisoformat(since) if since else None,
+                                                 until=datetime.fromisoformat(until) if until else None):
+            rows.append({key: value.isoformat() if isinstance(value, datetime) else value for key, value in row.items()})
+            if len(rows) >= limit:
+                break
+        
+        return jsonify({
+            'success': True,
+            'count': len(rows),
+            'rows': rows
+        })
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': f'Date invalide: {str(e)}'
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f'Erreur lecture archive: {str(e)}'
+        }), 500
+
 @performance_bp.route('/performance/overview', methods=['GET'])
 def performance_overview():
     """
@@ -326,24 +654,3 @@ def performance_overview():
             'success': False,
             'error': f'Erreur vue d\'ensemble: {str(e)}'
         }), 500
-
-# Middleware pour mesurer les temps de réponse
-@performance_bp.before_request
-def before_request():
-    """Mesure le temps de début de requête"""
-    request.start_time = time.time()
-
-@performance_bp.after_request
-def after_request(response):
-    """Mesure le temps de réponse et enregistre les métriques"""
-    if hasattr(request, 'start_time'):
-        response_time = time.time() - request.start_time
-        
-        # Enregistrer l'appel API
-        endpoint = request.endpoint
-        method = request.method
-        status_code = response.status_code
-        
-        monitoring_service.log_api_call(endpoint, method, status_code, response_time)
-    
-    return response 
\ No newline at end of file
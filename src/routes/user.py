@@ -1,12 +1,16 @@
 from flask import Blueprint, jsonify, request
 from src.models.database import User, db
+from src.services.identity_resolver import identity_resolver
+from src.services.pagination import STREAM_BATCH_SIZE, stream_json
+from sqlalchemy.orm import raiseload
 
 user_bp = Blueprint('user', __name__)
 
 @user_bp.route('/users', methods=['GET'])
 def get_users():
-    users = User.query.all()
-    return jsonify([user.to_dict() for user in users])
+    # Tableau JSON écrit au fil de la lecture, par lots : la liste complète n'est jamais en mémoire
+    users = User.query.options(raiseload('*')).order_by(User.id).yield_per(STREAM_BATCH_SIZE)
+    return stream_json(user.to_dict() for user in users)
 
 @user_bp.route('/users', methods=['POST'])
 def create_user():
@@ -36,4 +40,5 @@ def delete_user(user_id):
     user = User.query.get_or_404(user_id)
     db.session.delete(user)
     db.session.commit()
+    identity_resolver.forget(user.platform, user.platform_user_id)
     return '', 204
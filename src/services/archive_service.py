@@ -0,0 +1,514 @@
+"""
+Archivage des données froides pour AgroBizChat
+Les messages et journaux de webhooks anciens sont déplacés dans des segments compressés
+(un par mois et par conversation ou plateforme), relus de façon transparente, et l'espace
+libéré est rendu par VACUUM incrémental
+"""
+
+import os
+import json
+import zlib
+import math
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import DateTime, func, select, tuple_
+
+try:
+    import fcntl
+except ImportError:  # Windows : pas de verrou, chaque processus archive
+    fcntl = None
+
+from src.models.database import db, ArchiveSegment, Message
+from src.services.stat_counters import ARCHIVED_MESSAGES, stat_counters
+
+# Table archivée -> colonne de partition des segments (chemin de lecture)
+ARCHIVED_TABLES = {
+    'messages': 'conversation_id',
+    'webhook_logs': 'platform'
+}
+# Identifiants par DELETE ... IN (...) (limite de variables SQLite)
+_DELETE_CHUNK = 500
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Valeur non sérialisable: {type(value).__name__}")
+
+class ArchiveService:
+    """Déplace les lignes anciennes vers archive_segments et les relit à la demande"""
+
+    def __init__(self, engine=None, lock_path: str = None):
+        """
+        Initialise l'archivage
+
+        Args:
+            engine: Moteur SQLAlchemy (défaut: db.engine de l'application passée à init_app)
+            lock_path (str): Verrou du worker qui planifie l'archivage (défaut: data/archive.lock)
+        """
+        self.enabled = os.getenv('ARCHIVE_ENABLED', 'true').lower() == 'true'
+        default_days = int(os.getenv('ARCHIVE_AFTER_DAYS', '90'))
+        self.after_days = {
+            'messages': int(os.getenv('ARCHIVE_MESSAGES_AFTER_DAYS', str(default_days))),
+            # Charges utiles brutes : rarement relues, archivées plus tôt
+            'webhook_logs': int(os.getenv('ARCHIVE_WEBHOOK_LOGS_AFTER_DAYS', '30'))
+        }
+        self.batch_size = int(os.getenv('ARCHIVE_BATCH_SIZE', '5000'))
+        self.vacuum_pages = int(os.getenv('ARCHIVE_VACUUM_PAGES', '2000'))
+        self.interval = float(os.getenv('ARCHIVE_INTERVAL_HOURS', '24')) * 3600
+        self.compression_level = int(os.getenv('ARCHIVE_COMPRESSION_LEVEL', '6'))
+        self.lock_path = lock_path or str(Path(__file__).parent.parent.parent.resolve() / 'data' / 'archive.lock')
+
+        self._engine = engine
+        self._app = None
+        self._pid = os.getpid()
+        self._lock_file = None
+        self._thread = None
+        self._stop = threading.Event()
+        self.last_run = None
+
+    def init_app(self, app):
+        """
+        Rattache l'archivage à l'application (moteur lu dans son contexte)
+
+        Args:
+            app (Flask): Application
+        """
+        self._app = app
+
+    def _get_engine(self):
+        if self._engine is not None:
+            return self._engine
+        if self._app is None:
+            return db.engine
+        with self._app.app_context():
+            return db.engine
+
+    def archive(self, tables: List[str] = None, now: datetime = None, vacuum: bool = True) -> Dict:
+        """
+        Archive les lignes plus anciennes que le délai de chaque table
+
+        Chaque lot insère ses segments et supprime les lignes dans la même transaction :
+        une ligne est soit chaude, soit archivée, jamais les deux ni aucune.
+
+        Args:
+            tables (list): Tables à archiver (défaut: messages et webhook_logs)
+            now (datetime): Date de référence (défaut: maintenant, UTC)
+            vacuum (bool): Rendre ensuite l'espace libéré (SQLite en auto_vacuum incrémental)
+
+        Returns:
+            dict: Lignes et segments archivés par table, résultat du VACUUM
+        """
+        if not self.enabled:
+            return {'status': 'disabled', 'message': 'Archivage désactivé'}
+
+        engine = self._get_engine()
+        now = now or datetime.utcnow()
+        result = {'status': 'success', 'tables': {}}
+        for table_name in tables or list(ARCHIVED_TABLES):
+            if table_name not in ARCHIVED_TABLES:
+                raise ValueError(f"Table non archivable: {table_name}")
+            cutoff = now - timedelta(days=self.after_days[table_name])
+            archived = {'cutoff': cutoff.isoformat(), 'rows': 0, 'segments': 0, 'compressed_bytes': 0, 'raw_bytes': 0}
+            while True:
+                batch = self._archive_batch(engine, table_name, cutoff)
+                for field in ('rows', 'segments', 'compressed_bytes', 'raw_bytes'):
+                    archived[field] += batch[field]
+                if batch['rows'] < self.batch_size:
+                    break
+            result['tables'][table_name] = archived
+
+        if vacuum:
+            result['vacuum'] = self.incremental_vacuum(engine)
+        self.last_run = {'timestamp': now.isoformat(), **result}
+        return result
+
+    def _archive_batch(self, engine, table_name: str, cutoff: datetime) -> Dict:
+        """Archive au plus batch_size lignes (les plus anciennes) en une transaction"""
+        table = db.metadata.tables[table_name]
+        key_column = ARCHIVED_TABLES[table_name]
+        stats = {'rows': 0, 'segments': 0, 'compressed_bytes': 0, 'raw_bytes': 0}
+
+        with engine.begin() as conn:
+            rows = conn.execute(
+                select(table).where(table.c.created_at < cutoff).order_by(table.c.id).limit(self.batch_size)
+            ).mappings().all()
+            if not rows:
+                return stats
+
+            groups = {}
+            for row in rows:
+                key = (row['created_at'].strftime('%Y-%m'), str(row[key_column]))
+                groups.setdefault(key, []).append(dict(row))
+
+            segments = []
+            for (period, partition_key), group in groups.items():
+                raw = json.dumps(group, default=_encode, ensure_ascii=False).encode('utf-8')
+                payload = zlib.compress(raw, self.compression_level)
+                segments.append({
+                    'table_name': table_name,
+                    'period': period,
+                    'partition_key': partition_key,
+                    'row_count': len(group),
+                    'min_id': group[0]['id'],
+                    'max_id': group[-1]['id'],
+                    'first_created_at': min(row['created_at'] for row in group),
+                    'last_created_at': max(row['created_at'] for row in group),
+                    'raw_bytes': len(raw),
+                    'payload': payload,
+                    'created_at': datetime.utcnow()
+                })
+                stats['raw_bytes'] += len(raw)
+                stats['compressed_bytes'] += len(payload)
+
+            # Supprimer d'abord : un archivage concurrent (autre worker, appel admin) ne supprime
+            # rien et annule sa transaction au lieu de dupliquer les segments
+            ids = [row['id'] for row in rows]
+            deleted = 0
+            for start in range(0, len(ids), _DELETE_CHUNK):
+                deleted += conn.execute(table.delete().where(table.c.id.in_(ids[start:start + _DELETE_CHUNK]))).rowcount
+            if deleted != len(ids):
+                raise RuntimeError(f"Archivage concurrent de {table_name}: {deleted}/{len(ids)} lignes supprimées")
+            conn.execute(ArchiveSegment.__table__.insert(), segments)
+            if table_name == 'messages':
+                # total_messages inchangé : les messages archivés restent comptés
+                stat_counters.increment(conn, {ARCHIVED_MESSAGES: len(rows)})
+
+        stats['rows'] = len(rows)
+        stats['segments'] = len(segments)
+        return stats
+
+    def incremental_vacuum(self, engine=None, pages: int = None) -> Dict:
+        """
+        Rend au système de fichiers une partie des pages libres (SQLite, auto_vacuum=INCREMENTAL)
+
+        Args:
+            engine: Moteur SQLAlchemy
+            pages (int): Pages libérées au plus (travail borné, défaut: ARCHIVE_VACUUM_PAGES)
+
+        Returns:
+            dict: Pages libres avant/après, ou raison de l'absence de VACUUM
+        """
+        engine = engine or self._get_engine()
+        if engine.dialect.name != 'sqlite':
+            # PostgreSQL : l'autovacuum réutilise l'espace des lignes supprimées
+            return {'status': 'skipped', 'message': 'VACUUM incrémental propre à SQLite'}
+
+        with engine.connect() as conn:
+            mode = conn.exec_driver_sql("PRAGMA auto_vacuum").scalar()
+            freelist_before = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+            if mode != 2:
+                return {
+                    'status': 'unavailable',
+                    'auto_vacuum': mode,
+                    'freelist_pages': freelist_before,
+                    'message': 'auto_vacuum=INCREMENTAL requis : enable_incremental_vacuum() (VACUUM complet, une fois)'
+                }
+            released = conn.exec_driver_sql(f"PRAGMA incremental_vacuum({int(pages or self.vacuum_pages)})")
+            # Une page libérée par étape : parcourir le résultat jusqu'au bout
+            if released.returns_rows:
+                released.fetchall()
+            conn.commit()
+            freelist_after = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+        return {'status': 'success', 'freelist_before': freelist_before, 'freelist_after': freelist_after,
+                'pages_released': freelist_before - freelist_after}
+
+    def enable_incremental_vacuum(self, engine=None) -> Dict:
+        """
+        Passe une base SQLite existante en auto_vacuum=INCREMENTAL (VACUUM complet : base bloquée le temps de la copie)
+
+        Returns:
+            dict: Mode auto_vacuum résultant et taille de la base
+        """
+        engine = engine or self._get_engine()
+        if engine.dialect.name != 'sqlite':
+            return {'status': 'skipped', 'message': 'VACUUM incrémental propre à SQLite'}
+        with engine.connect() as conn:
+            conn = conn.execution_options(isolation_level='AUTOCOMMIT')
+            conn.exec_driver_sql("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.exec_driver_sql("VACUUM")
+            mode = conn.exec_driver_sql("PRAGMA auto_vacuum").scalar()
+            pages = conn.exec_driver_sql("PRAGMA page_count").scalar()
+            page_size = conn.exec_driver_sql("PRAGMA page_size").scalar()
+        return {'status': 'success' if mode == 2 else 'error', 'auto_vacuum': mode,
+                'size_mb': round(pages * page_size / (1024 * 1024), 2)}
+
+    def _segments(self, conn, table_name: str, partition_key: str = None, since: datetime = None,
+                  until: datetime = None):
+        """Segments (sans charge utile) dans l'ordre chronologique"""
+        segment = ArchiveSegment.__table__
+        query = select(segment.c.id, segment.c.row_count, segment.c.first_created_at, segment.c.last_created_at) \
+            .where(segment.c.table_name == table_name)
+        if partition_key is not None:
+            query = query.where(segment.c.partition_key == str(partition_key))
+        if since is not None:
+            query = query.where(segment.c.last_created_at >= since)
+        if until is not None:
+            query = query.where(segment.c.first_created_at < until)
+        return conn.execute(query.order_by(segment.c.first_created_at, segment.c.id)).all()
+
+    def _load(self, conn, table_name: str, segment_id: int) -> List[Dict]:
+        """Lignes d'un segment, colonnes DateTime reconverties"""
+        payload = conn.execute(
+            select(ArchiveSegment.__table__.c.payload).where(ArchiveSegment.__table__.c.id == segment_id)
+        ).scalar_one()
+        rows = json.loads(zlib.decompress(payload))
+        table = db.metadata.tables[table_name]
+        date_columns = [column.name for column in table.columns if isinstance(column.type, DateTime)]
+        for row in rows:
+            for name in date_columns:
+                if row.get(name):
+                    row[name] = datetime.fromisoformat(row[name])
+        rows.sort(key=lambda row: (row['created_at'], row['id']))
+        return rows
+
+    def read_archived(self, table_name: str, partition_key: str = None, since: datetime = None,
+                      until: datetime = None) -> Iterator[Dict]:
+        """
+        Parcourt les lignes archivées, segment par segment (mémoire bornée à un segment)
+
+        Args:
+            table_name (str): Table d'origine
+            partition_key (str): Conversation (messages) ou plateforme (webhook_logs)
+            since (datetime): Lignes créées à partir de cette date
+            until (datetime): Lignes créées avant cette date
+
+        Yields:
+            dict: Ligne telle qu'elle était dans la table d'origine
+        """
+        with self._get_engine().connect() as conn:
+            for segment in self._segments(conn, table_name, partition_key, since, until):
+                for row in self._load(conn, table_name, segment.id):
+                    if (since is None or row['created_at'] >= since) and (until is None or row['created_at'] < until):
+                        yield row
+
+    def archived_count(self, table_name: str, partition_key: str = None) -> int:
+        """Nombre de lignes archivées d'une table (somme des segments, sans décompression)"""
+        segment = ArchiveSegment.__table__
+        query = select(func.coalesce(func.sum(segment.c.row_count), 0)).where(segment.c.table_name == table_name)
+        if partition_key is not None:
+            query = query.where(segment.c.partition_key == str(partition_key))
+        with self._get_engine().connect() as conn:
+            return conn.execute(query).scalar()
+
+    def conversation_messages(self, conversation_id: int, page: int = 1, per_page: int = 100) -> Dict:
+        """
+        Messages d'une conversation, archivés puis chauds, par ordre chronologique
+
+        Les lignes archivées sont toutes antérieures aux lignes chaudes (archivage par âge) :
+        la pagination parcourt les segments puis la table, en ne décompressant que les
+        segments de la page demandée.
+
+        Args:
+            conversation_id (int): Conversation
+            page (int): Page (à partir de 1)
+            per_page (int): Messages par page
+
+        Returns:
+            dict: {'messages', 'total', 'pages', 'current_page'} (format de Message.to_dict)
+        """
+        page = max(1, page)
+        per_page = max(1, per_page)
+        offset = (page - 1) * per_page
+        items = []
+
+        with self._get_engine().connect() as conn:
+            segments = self._segments(conn, 'messages', partition_key=str(conversation_id))
+            archived_total = sum(segment.row_count for segment in segments)
+            hot_total = conn.execute(
+                select(func.count()).select_from(Message.__table__).where(Message.__table__.c.conversation_id == conversation_id)
+            ).scalar()
+
+            position = 0
+            for segment in segments:
+                if position + segment.row_count > offset and len(items) < per_page:
+                    rows = self._load(conn, 'messages', segment.id)
+                    start = max(0, offset - position)
+                    items.extend(Message(**row).to_dict() for row in rows[start:start + per_page - len(items)])
+                position += segment.row_count
+
+            remaining = per_page - len(items)
+            if remaining > 0 and offset + len(items) - archived_total < hot_total:
+                hot_offset = max(0, offset - archived_total)
+                rows = conn.execute(
+                    select(Message.__table__)
+                    .where(Message.__table__.c.conversation_id == conversation_id)
+                    .order_by(Message.__table__.c.created_at.asc(), Message.__table__.c.id.asc())
+                    .offset(hot_offset).limit(remaining)
+                ).mappings().all()
+                items.extend(Message(**dict(row)).to_dict() for row in rows)
+
+        total = archived_total + hot_total
+        return {
+            'messages': items,
+            'total': total,
+            'pages': int(math.ceil(total / per_page)) if total else 0,
+            'current_page': page
+        }
+
+    def conversation_messages_after(self, conversation_id: int, after: Tuple = None,
+                                    limit: int = 100) -> Tuple[List[Dict], Optional[Tuple]]:
+        """
+        Messages d'une conversation postérieurs à (created_at, id), archivés puis chauds (pagination par curseur)
+
+        Seuls les segments qui se terminent après le curseur sont décompressés ; la table
+        est lue par l'index (conversation_id, created_at, id) à partir du curseur.
+
+        Args:
+            conversation_id (int): Conversation
+            after (tuple): (created_at, id) du dernier message déjà reçu (None : depuis le début)
+            limit (int): Messages au plus
+
+        Returns:
+            tuple: (messages au format Message.to_dict, (created_at, id) du dernier si la suite existe, sinon None)
+        """
+        rows = []
+        table = Message.__table__
+        with self._get_engine().connect() as conn:
+            for segment in self._segments(conn, 'messages', partition_key=str(conversation_id),
+                                          since=after[0] if after else None):
+                for row in self._load(conn, 'messages', segment.id):
+                    if after is None or (row['created_at'], row['id']) > tuple(after):
+                        rows.append(row)
+                if len(rows) > limit:
+                    break
+
+            if len(rows) <= limit:
+                query = select(table).where(table.c.conversation_id == conversation_id)
+                if after is not None:
+                    query = query.where(tuple_(table.c.created_at, table.c.id) > tuple_(*after))
+                query = query.order_by(table.c.created_at.asc(), table.c.id.asc()).limit(limit + 1 - len(rows))
+                rows.extend(dict(row) for row in conn.execute(query).mappings())
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        next_key = (rows[-1]['created_at'], rows[-1]['id']) if has_more else None
+        return [Message(**row).to_dict() for row in rows], next_key
+
+    def iter_conversation_messages(self, conversation_id: int, batch_size: int = 500) -> Iterator[Dict]:
+        """
+        Tous les messages d'une conversation, archivés puis chauds, lus par lots (export)
+
+        Args:
+            conversation_id (int): Conversation
+            batch_size (int): Messages lus par requête
+
+        Yields:
+            dict: Message au format Message.to_dict
+        """
+        for row in self.read_archived('messages', partition_key=str(conversation_id)):
+            yield Message(**row).to_dict()
+
+        table = Message.__table__
+        after = None
+        while True:
+            query = select(table).where(table.c.conversation_id == conversation_id)
+            if after is not None:
+                query = query.where(tuple_(table.c.created_at, table.c.id) > tuple_(*after))
+            query = query.order_by(table.c.created_at.asc(), table.c.id.asc()).limit(batch_size)
+            # Connexion rendue entre deux lots : un client lent ne la monopolise pas
+            with self._get_engine().connect() as conn:
+                rows = conn.execute(query).mappings().all()
+            for row in rows:
+                yield Message(**dict(row)).to_dict()
+            if len(rows) < batch_size:
+                return
+            after = (rows[-1]['created_at'], rows[-1]['id'])
+
+    def get_stats(self) -> Dict:
+        """Segments, lignes et taux de compression par table"""
+        segment = ArchiveSegment.__table__
+        with self._get_engine().connect() as conn:
+            rows = conn.execute(
+                select(segment.c.table_name, func.count(), func.sum(segment.c.row_count),
+                       func.sum(segment.c.raw_bytes), func.sum(func.length(segment.c.payload)),
+                       func.min(segment.c.period), func.max(segment.c.period))
+                .group_by(segment.c.table_name)
+            ).all()
+        tables = {
+            table_name: {
+                'segments': segments,
+                'rows': row_count or 0,
+                'raw_bytes': raw_bytes or 0,
+                'compressed_bytes': compressed or 0,
+                'compression_ratio': round(raw_bytes / compressed, 2) if compressed else None,
+                'oldest_period': oldest,
+                'newest_period': newest
+            }
+            for table_name, segments, row_count, raw_bytes, compressed, oldest, newest in rows
+        }
+        return {
+            'enabled': self.enabled,
+            'after_days': dict(self.after_days),
+            'tables': tables,
+            'last_run': self.last_run
+        }
+
+    def is_leader(self) -> bool:
+        """
+        Un seul worker planifie l'archivage : celui qui détient le verrou (réélu si il disparaît)
+
+        Returns:
+            bool: True si le processus courant archive
+        """
+        if self._lock_file is not None:
+            return True
+        if fcntl is None:
+            self._lock_file = True
+            return True
+        try:
+            os.makedirs(os.path.dirname(self.lock_path), exist_ok=True)
+            lock_file = open(self.lock_path, 'a')
+        except Exception as e:
+            print(f"Erreur verrou archivage: {e}")
+            return False
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def start(self) -> bool:
+        """
+        Démarre l'archivage périodique en arrière-plan (une fois par processus)
+
+        Returns:
+            bool: True si un thread a été lancé
+        """
+        if not self.enabled:
+            return False
+        if self._pid != os.getpid():
+            # Processus forké : ni le thread ni le verrou ne sont hérités
+            self._pid = os.getpid()
+            self._lock_file = None
+            self._thread = None
+            self._stop = threading.Event()
+        if self._thread is not None and self._thread.is_alive():
+            return False
+        self._thread = threading.Thread(target=self._loop, name='archiver', daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        """Arrête l'archivage périodique"""
+        self._stop.set()
+
+    def _loop(self):
+        """Archive à intervalle fixe ; seul le worker détenteur du verrou travaille"""
+        while not self._stop.wait(self.interval):
+            if not self.is_leader():
+                continue
+            try:
+                result = self.archive()
+                archived = sum(table['rows'] for table in result.get('tables', {}).values())
+                if archived:
+                    print(f"🗄️ Archivage: {archived} lignes déplacées dans archive_segments")
+            except Exception as e:
+                print(f"Erreur archivage: {e}")
+
+# Instance globale du service d'archivage
+archive_service = ArchiveService()
@@ -0,0 +1,203 @@
+"""
+Stockage des fichiers binaires pour AgroBizChat (photos de diagnostic)
+Fichiers adressés par leur SHA-256 sur le disque local : un contenu identique n'est stocké
+qu'une fois, la base ne garde que l'empreinte
+"""
+
+import io
+import os
+import re
+import hashlib
+import tempfile
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+
+from PIL import Image
+
+from src.services.metrics_registry import metrics_registry
+
+blob_writes = metrics_registry.counter('blob_store_writes', 'Écritures du stockage de fichiers', ['result'])
+
+_DIGEST = re.compile(r'^[0-9a-f]{64}$')
+
+def _default_root() -> str:
+    return str(Path(__file__).parent.parent.parent.resolve() / 'data' / 'blobs')
+
+class BlobStore:
+    """Fichiers immuables répartis en sous-répertoires ab/cd/<sha256>, miniatures à la demande"""
+
+    def __init__(self, root: str = None, thumbnail_size: int = None, fsync: bool = None):
+        """
+        Initialise le stockage
+
+        Args:
+            root (str): Répertoire racine (BLOB_STORE_DIR, défaut: data/blobs)
+            thumbnail_size (int): Plus grand côté des miniatures en pixels (BLOB_THUMBNAIL_SIZE)
+            fsync (bool): fsync avant de publier un fichier (BLOB_STORE_FSYNC)
+        """
+        self.root = root or os.getenv('BLOB_STORE_DIR') or _default_root()
+        self.thumbnail_size = thumbnail_size or int(os.getenv('BLOB_THUMBNAIL_SIZE', '512'))
+        self.fsync = fsync if fsync is not None else os.getenv('BLOB_STORE_FSYNC', 'true').lower() == 'true'
+        self._lock = threading.Lock()
+        self.writes = 0
+        self.deduplicated = 0
+        self.bytes_saved = 0
+
+    def path(self, digest: str, suffix: str = '') -> str:
+        """
+        Chemin d'un fichier : deux niveaux de 256 répertoires pour garder des répertoires courts
+
+        Args:
+            digest (str): Empreinte SHA-256 (hexadécimal)
+            suffix (str): Variante du fichier (miniature)
+
+        Returns:
+            str: Chemin absolu
+        """
+        if not isinstance(digest, str) or not _DIGEST.match(digest):
+            raise ValueError(f"Empreinte SHA-256 invalide: {digest!r}")
+        return os.path.join(self.root, digest[:2], digest[2:4], digest + suffix)
+
+    def put(self, data: bytes) -> str:
+        """
+        Enregistre un contenu (sans effet s'il est déjà présent)
+
+        Le fichier est écrit à côté puis renommé : un lecteur ne voit jamais un fichier partiel
+        et deux workers qui enregistrent la même photo produisent le même fichier.
+
+        Args:
+            data (bytes): Contenu
+
+        Returns:
+            str: Empreinte SHA-256 à conserver en base
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path(digest)
+        if os.path.exists(path):
+            with self._lock:
+                self.deduplicated += 1
+                self.bytes_saved += len(data)
+            blob_writes.inc(result='deduplicated')
+            return digest
+
+        self._write(path, data)
+        with self._lock:
+            self.writes += 1
+        blob_writes.inc(result='written')
+        return digest
+
+    def _write(self, path: str, data: bytes):
+        """Écriture atomique (fichier temporaire du même répertoire puis os.replace)"""
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as handle:
+                handle.write(data)
+                if self.fsync:
+                    handle.flush()
+                    os.fsync(handle.fileno())
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def get(self, digest: str) -> Optional[bytes]:
+        """
+        Contenu d'un fichier
+
+        Args:
+            digest (str): Empreinte SHA-256
+
+        Returns:
+            bytes: Contenu, None si absent
+        """
+        try:
+            with open(self.path(digest), 'rb') as handle:
+                return handle.read()
+        except FileNotFoundError:
+            return None
+
+    def exists(self, digest: str) -> bool:
+        """Fichier présent"""
+        return os.path.exists(self.path(digest))
+
+    def delete(self, digest: str) -> bool:
+        """
+        Supprime un fichier et ses miniatures (à n'appeler que si plus aucune ligne ne le référence)
+
+        Returns:
+            bool: True si le fichier existait
+        """
+        path = self.path(digest)
+        directory = os.path.dirname(path)
+        if os.path.isdir(directory):
+            for name in os.listdir(directory):
+                if name.startswith(digest + '.thumb'):
+                    os.unlink(os.path.join(directory, name))
+        try:
+            os.unlink(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def thumbnail_path(self, digest: str, size: int = None) -> Optional[str]:
+        """
+        Miniature JPEG d'une image, générée au premier appel puis conservée à côté de l'original
+
+        Args:
+            digest (str): Empreinte de l'image
+            size (int): Plus grand côté en pixels (défaut: thumbnail_size)
+
+        Returns:
+            str: Chemin de la miniature, None si le fichier est absent ou n'est pas une image
+        """
+        size = int(size or self.thumbnail_size)
+        path = self.path(digest, f'.thumb{size}.jpg')
+        if os.path.exists(path):
+            return path
+        data = self.get(digest)
+        if data is None:
+            return None
+        try:
+            with Image.open(io.BytesIO(data)) as image:
+                image.thumbnail((size, size))
+                output = io.BytesIO()
+                image.convert('RGB').save(output, format='JPEG', quality=85, optimize=True)
+        except Exception as e:
+            print(f"Erreur miniature {digest[:12]}: {e}")
+            return None
+        self._write(path, output.getvalue())
+        return path
+
+    def thumbnail(self, digest: str, size: int = None) -> Optional[bytes]:
+        """Contenu de la miniature (voir thumbnail_path)"""
+        path = self.thumbnail_path(digest, size)
+        if path is None:
+            return None
+        with open(path, 'rb') as handle:
+            return handle.read()
+
+    def get_stats(self) -> Dict:
+        """Écritures, doublons évités et occupation disque"""
+        files = 0
+        total_bytes = 0
+        if os.path.isdir(self.root):
+            for directory, _, names in os.walk(self.root):
+                for name in names:
+                    if _DIGEST.match(name):
+                        files += 1
+                        total_bytes += os.path.getsize(os.path.join(directory, name))
+        return {
+            'root': self.root,
+            'blobs': files,
+            'size_mb': round(total_bytes / (1024 * 1024), 2),
+            'writes': self.writes,
+            'deduplicated': self.deduplicated,
+            'bytes_saved': self.bytes_saved
+        }
+
+# Instance globale du stockage de fichiers
+blob_store = BlobStore()
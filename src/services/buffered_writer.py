@@ -0,0 +1,356 @@
+"""
+Écritures différées pour AgroBizChat
+Journaux de webhooks et lignes de faible priorité ajoutés à un fichier de spool local,
+puis insérés par lots (executemany) par un thread de fond, sur seuil de taille ou de temps
+"""
+
+import os
+import json
+import time
+import fcntl
+import atexit
+import threading
+from datetime import date, datetime
+from pathlib import Path
+from typing import Dict, List
+
+from sqlalchemy import DateTime
+from sqlalchemy.exc import OperationalError, SQLAlchemyError
+
+from src.models.database import WebhookLog
+from src.services.metrics_registry import metrics_registry
+
+buffered_rows_written = metrics_registry.counter(
+    'buffered_writer_rows', 'Lignes insérées par lot par table', ['table']
+)
+buffered_flush_failures = metrics_registry.counter('buffered_writer_flush_failures', 'Lots non insérés', ['reason'])
+
+def _default_spool_dir() -> str:
+    return str(Path(__file__).parent.parent.parent.resolve() / 'data' / 'spool')
+
+def _encode(value):
+    """Valeurs non JSON des lignes (dates)"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Valeur non sérialisable: {type(value).__name__}")
+
+class BufferedWriter:
+    """Spool append-only par worker, vidé par lots dans une transaction par segment"""
+
+    def __init__(self, spool_dir: str = None, max_rows: int = None, interval: float = None,
+                 fsync: bool = None, engine=None):
+        """
+        Initialise l'écrivain
+
+        Args:
+            spool_dir (str): Répertoire des segments (BUFFERED_WRITER_SPOOL_DIR, défaut: data/spool)
+            max_rows (int): Lignes en attente déclenchant un vidage (BUFFERED_WRITER_MAX_ROWS)
+            interval (float): Secondes maximales entre deux vidages (BUFFERED_WRITER_INTERVAL)
+            fsync (bool): fsync après chaque ligne, durable même en cas de coupure (BUFFERED_WRITER_FSYNC)
+            engine: Moteur SQLAlchemy (défaut: db.engine de l'application passée à init_app)
+        """
+        self.enabled = os.getenv('BUFFERED_WRITER_ENABLED', 'true').lower() == 'true'
+        self.spool_dir = spool_dir or os.getenv('BUFFERED_WRITER_SPOOL_DIR') or _default_spool_dir()
+        self.max_rows = max_rows if max_rows is not None else int(os.getenv('BUFFERED_WRITER_MAX_ROWS', '200'))
+        self.interval = interval if interval is not None else float(os.getenv('BUFFERED_WRITER_INTERVAL', '2'))
+        self.fsync = fsync if fsync is not None else os.getenv('BUFFERED_WRITER_FSYNC', 'false').lower() == 'true'
+        self._engine = engine
+        self._app = None
+        self.tables = {}
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pid = None
+        self._segment = None
+        self._file = None
+        self._sequence = 0
+        self._pending = 0
+        # Segments fermés du worker -> lignes pas encore validées en base
+        self._closed = {}
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self.rows_written = 0
+        self.last_flush = None
+        self.last_error = None
+
+        try:
+            os.makedirs(self.spool_dir, exist_ok=True)
+        except Exception as e:
+            print(f"Erreur création répertoire spool: {e}")
+        atexit.register(self.close)
+
+    def init_app(self, app):
+        """
+        Rattache l'écrivain à l'application (moteur lu dans son contexte)
+
+        Args:
+            app (Flask): Application
+        """
+        self._app = app
+
+    def register_table(self, table):
+        """
+        Autorise les écritures différées vers une table
+
+        Args:
+            table (Table): Table SQLAlchemy (Model.__table__)
+        """
+        self.tables[table.name] = table
+
+    def _get_engine(self):
+        if self._engine is not None:
+            return self._engine
+        if self._app is None:
+            return None
+        from src.models.database import db
+        with self._app.app_context():
+            return db.engine
+
+    def add(self, table_name: str, row: Dict):
+        """
+        Ajoute une ligne au spool (quelques microsecondes, aucune requête SQL)
+
+        La ligne est dans le fichier avant le retour : un arrêt brutal du worker ne la perd pas,
+        le segment est repris au vidage suivant (par ce worker ou un autre).
+
+        Args:
+            table_name (str): Table enregistrée par register_table
+            row (dict): Valeurs des colonnes (les défauts du modèle s'appliquent à l'insertion)
+        """
+        table = self.tables.get(table_name)
+        if table is None:
+            raise ValueError(f"Table non enregistrée pour l'écriture différée: {table_name}")
+        if not self.enabled:
+            self._insert_now(table, row)
+            return
+
+        line = json.dumps({'table': table_name, 'row': row}, default=_encode, ensure_ascii=False) + '\n'
+        with self._lock:
+            self._ensure_process()
+            if self._file is None:
+                self._open_segment()
+            self._file.write(line)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self._pending += 1
+            pending = self._pending
+        if pending >= self.max_rows:
+            self._wake.set()
+
+    def log_webhook(self, platform: str, data, processed: bool = False, error_message: str = None):
+        """
+        Journal d'un webhook (état final : traité ou erreur), hors du chemin critique
+
+        Args:
+            platform (str): Plateforme
+            data: Charge utile reçue
+            processed (bool): Message traité
+            error_message (str): Erreur rencontrée
+        """
+        try:
+            webhook_data = json.dumps(data, ensure_ascii=False)
+        except Exception as e:
+            webhook_data = json.dumps({'error': str(e)})
+        try:
+            self.add('webhook_logs', {
+                'platform': platform,
+                'webhook_data': webhook_data,
+                'processed': processed,
+                'error_message': error_message,
+                'created_at': datetime.utcnow()
+            })
+        except Exception as e:
+            # Un journal perdu ne doit pas faire échouer le webhook
+            print(f"Erreur journal webhook différé: {e}")
+
+    def start(self) -> bool:
+        """
+        Démarre le thread de vidage du worker (reprend aussi les segments d'un worker arrêté)
+
+        Returns:
+            bool: True si un thread a été lancé
+        """
+        if not self.enabled:
+            return False
+        with self._lock:
+            if self._pid == os.getpid():
+                return False
+            self._ensure_process()
+            return True
+
+    def pending_count(self) -> int:
+        """Lignes du worker en attente d'insertion (segment ouvert et segments fermés non validés, .failed compris)"""
+        with self._lock:
+            return self._pending + sum(self._closed.values())
+
+    def _ensure_process(self):
+        """Worker forké : le segment et le thread du parent ne lui appartiennent pas"""
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        if self._file is not None:
+            try:
+                self._file.close()
+            except Exception:
+                pass
+        self._file = None
+        self._segment = None
+        self._pending = 0
+        self._closed = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name='buffered-writer', daemon=True)
+        self._thread.start()
+
+    def _open_segment(self):
+        """Nouveau segment, verrouillé tant que le worker y écrit"""
+        self._sequence += 1
+        self._segment = os.path.join(self.spool_dir, f"{os.getpid()}-{int(time.time() * 1000)}-{self._sequence}.jsonl")
+        self._file = open(self._segment, 'a', encoding='utf-8')
+        fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+
+    def _rotate(self):
+        """Ferme le segment courant : il devient disponible pour le vidage"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                # Lignes toujours en attente jusqu'à la validation du lot
+                self._closed[self._segment] = self._pending
+            self._file = None
+            self._segment = None
+            self._pending = 0
+
+    def flush(self) -> int:
+        """
+        Insère tous les segments fermés, y compris ceux laissés par un worker arrêté
+
+        Returns:
+            int: Lignes insérées
+        """
+        with self._flush_lock:
+            self._rotate()
+            engine = self._get_engine()
+            if engine is None:
+                return 0
+            written = 0
+            segments = sorted(Path(self.spool_dir).glob('*.jsonl'), key=lambda path: path.stat().st_mtime
+                              if path.exists() else 0)
+            for segment in segments:
+                written += self._replay(engine, str(segment))
+            self.last_flush = datetime.now().isoformat()
+            return written
+
+    def _replay(self, engine, path: str) -> int:
+        """Insère un segment en une transaction puis le supprime (verrou : un seul worker par segment)"""
+        try:
+            handle = open(path, 'r', encoding='utf-8')
+        except FileNotFoundError:
+            return 0
+        with handle:
+            try:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # Segment en cours d'écriture ou déjà pris par un autre worker
+                return 0
+            try:
+                # Supprimé par un autre worker entre l'ouverture et le verrou
+                if os.fstat(handle.fileno()).st_ino != os.stat(path).st_ino:
+                    return 0
+            except FileNotFoundError:
+                return 0
+
+            batches = self._read_batches(handle)
+            if batches:
+                try:
+                    with engine.begin() as conn:
+                        for (table_name, _), rows in batches.items():
+                            # Une seule instruction par table et jeu de colonnes : executemany
+                            conn.execute(self.tables[table_name].insert(), rows)
+                except OperationalError as e:
+                    # Base indisponible ou verrouillée : nouvel essai au prochain vidage
+                    self.last_error = str(e)
+                    buffered_flush_failures.inc(reason='operational')
+                    return 0
+                except SQLAlchemyError as e:
+                    # Lignes refusées par la base : segment mis de côté pour ne pas bloquer les suivants
+                    self.last_error = str(e)
+                    buffered_flush_failures.inc(reason='rejected')
+                    os.replace(path, path + '.failed')
+                    print(f"Erreur écriture différée, segment conservé: {path}.failed ({e})")
+                    return 0
+
+            os.unlink(path)
+            with self._lock:
+                self._closed.pop(path, None)
+            count = sum(len(rows) for rows in batches.values())
+            for (table_name, _), rows in batches.items():
+                buffered_rows_written.inc(len(rows), table=table_name)
+            self.rows_written += count
+            return count
+
+    def _read_batches(self, handle) -> Dict[tuple, List[Dict]]:
+        """Lignes du segment regroupées par table et colonnes (une ligne tronquée par un arrêt brutal est ignorée)"""
+        batches = {}
+        for line in handle:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            table = self.tables.get(entry.get('table'))
+            if table is None:
+                continue
+            row = entry.get('row') or {}
+            for column in table.columns:
+                if isinstance(column.type, DateTime) and isinstance(row.get(column.name), str):
+                    row[column.name] = datetime.fromisoformat(row[column.name])
+            batches.setdefault((table.name, tuple(sorted(row))), []).append(row)
+        return batches
+
+    def _insert_now(self, table, row: Dict):
+        """Écriture immédiate (écrivain désactivé)"""
+        engine = self._get_engine()
+        with engine.begin() as conn:
+            conn.execute(table.insert(), [row])
+
+    def _loop(self):
+        """Vide le spool toutes les interval secondes, ou dès que max_rows lignes attendent"""
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"Erreur vidage écritures différées: {e}")
+
+    def close(self):
+        """Dernier vidage à l'arrêt du worker (ce qui reste est repris au démarrage suivant)"""
+        self._stop.set()
+        self._wake.set()
+        if self._pid != os.getpid():
+            return
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"Erreur vidage final écritures différées: {e}")
+
+    def get_stats(self) -> Dict:
+        """État de l'écrivain : lignes en attente, segments, dernières erreurs"""
+        segments = list(Path(self.spool_dir).glob('*.jsonl'))
+        return {
+            'enabled': self.enabled,
+            'pending_rows': self.pending_count(),
+            'segments': len(segments),
+            'failed_segments': len(list(Path(self.spool_dir).glob('*.failed'))),
+            'rows_written': self.rows_written,
+            'last_flush': self.last_flush,
+            'last_error': self.last_error
+        }
+
+# Instance globale de l'écrivain différé
+buffered_writer = BufferedWriter()
+buffered_writer.register_table(WebhookLog.__table__)
+
+queue_depth = metrics_registry.gauge('queue_depth', 'Tâches en attente par file de travail', ['queue'])
+queue_depth.set_function(buffered_writer.pending_count, queue='buffered_writer')
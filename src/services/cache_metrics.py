@@ -0,0 +1,196 @@
+"""
+Instrumentation du cache par préfixe logique pour AgroBizChat
+Hits, misses, erreurs, latences et volumes, agrégés entre workers (workers terminés compris)
+"""
+
+import os
+import threading
+from typing import Dict, List
+
+from src.services.latency_histogram import LatencyHistogram
+from src.services.worker_metrics import WorkerSnapshotStore
+
+COUNTER_FIELDS = ('hits', 'misses', 'errors', 'sets', 'deletes', 'bytes_read', 'bytes_written')
+OTHER_PREFIX = 'other'
+
+class CacheMetrics:
+    """Compteurs et histogrammes de latence par préfixe de clé"""
+
+    def __init__(self, namespace: str, store: WorkerSnapshotStore = None):
+        """
+        Initialise les métriques
+
+        Args:
+            namespace (str): Espace de noms des clés (ex: "agrobiz")
+            store (WorkerSnapshotStore): Partage inter-workers (optionnel)
+        """
+        self.namespace = namespace
+        self.max_prefixes = int(os.getenv('CACHE_METRICS_MAX_PREFIXES', '50'))
+        self.store = store if store is not None else WorkerSnapshotStore('cache')
+        self._prefixes = {}
+        self._lock = threading.Lock()
+
+    def prefix_of(self, key) -> str:
+        """
+        Extrait le préfixe logique d'une clé "<namespace>:<prefix>:<hash>"
+
+        Args:
+            key (str|bytes): Clé de cache
+
+        Returns:
+            str: Préfixe logique ou "other"
+        """
+        if isinstance(key, bytes):
+            key = key.decode('utf-8', 'replace')
+        parts = str(key).split(':', 2)
+        if len(parts) == 3 and parts[0] == self.namespace:
+            return parts[1]
+        return OTHER_PREFIX
+
+    def _entry(self, prefix: str) -> Dict:
+        """Entrée d'un préfixe, bornée à max_prefixes (le surplus va dans "other")"""
+        entry = self._prefixes.get(prefix)
+        if entry is None:
+            if len(self._prefixes) >= self.max_prefixes and prefix != OTHER_PREFIX:
+                return self._entry(OTHER_PREFIX)
+            entry = {field: 0 for field in COUNTER_FIELDS}
+            entry['latency'] = {}
+            self._prefixes[prefix] = entry
+        return entry
+
+    def record(self, key, operation: str, elapsed_ms: float, outcome: str = None, nbytes: int = 0):
+        """
+        Enregistre une opération de cache
+
+        Args:
+            key (str): Clé concernée
+            operation (str): "get", "set" ou "delete"
+            elapsed_ms (float): Durée de l'opération en ms
+            outcome (str): "hits", "misses" ou "errors" (optionnel)
+            nbytes (int): Taille de la charge utile lue ou écrite
+        """
+        prefix = self.prefix_of(key)
+        with self._lock:
+            entry = self._entry(prefix)
+            if outcome:
+                entry[outcome] += 1
+            if operation == 'set' and outcome != 'errors':
+                entry['sets'] += 1
+                entry['bytes_written'] += nbytes
+            elif operation == 'delete' and outcome != 'errors':
+                entry['deletes'] += 1
+            elif nbytes:
+                entry['bytes_read'] += nbytes
+
+            histogram = entry['latency'].get(operation)
+            if histogram is None:
+                histogram = entry['latency'][operation] = LatencyHistogram()
+            histogram.record(elapsed_ms)
+
+        if self.store.should_publish():
+            self.publish()
+
+    def snapshot(self) -> Dict:
+        """Instantané JSON-sérialisable du processus courant"""
+        with self._lock:
+            return {
+                prefix: {
+                    **{field: entry[field] for field in COUNTER_FIELDS},
+                    'latency': {op: histogram.to_dict() for op, histogram in entry['latency'].items()}
+                }
+                for prefix, entry in self._prefixes.items()
+            }
+
+    def publish(self, force: bool = False) -> bool:
+        """Publie l'instantané pour les autres workers"""
+        return self.store.publish(self.snapshot(), force=force)
+
+    def start(self) -> bool:
+        """
+        Publication périodique de l'instantané du worker, même inactif (post_worker_init)
+
+        Returns:
+            bool: True si la publication a été lancée dans ce processus
+        """
+        return self.store.start_publisher(self.snapshot)
+
+    @staticmethod
+    def _fold(snapshots: List[Dict]) -> Dict:
+        """Somme des compteurs et fusion des histogrammes de latence par préfixe"""
+        merged = {}
+        for snapshot in snapshots:
+            for prefix, data in snapshot.items():
+                entry = merged.setdefault(prefix, {field: 0 for field in COUNTER_FIELDS})
+                entry.setdefault('latency', {})
+                for field in COUNTER_FIELDS:
+                    entry[field] += data.get(field, 0)
+                for op, histogram_data in (data.get('latency') or {}).items():
+                    histogram = entry['latency'].setdefault(op, LatencyHistogram())
+                    histogram.merge(LatencyHistogram.from_dict(histogram_data))
+        return merged
+
+    @classmethod
+    def _retire(cls, retired: Dict, snapshot: Dict) -> Dict:
+        """Ajoute l'instantané d'un worker terminé au cumul"""
+        return {
+            prefix: {
+                **{field: entry[field] for field in COUNTER_FIELDS},
+                'latency': {op: histogram.to_dict() for op, histogram in entry['latency'].items()}
+            }
+            for prefix, entry in cls._fold([retired, snapshot]).items()
+        }
+
+    def get_stats(self) -> Dict:
+        """
+        Statistiques par préfixe fusionnées sur tous les workers, vivants et terminés
+
+        Returns:
+            dict: Compteurs, taux de hit et percentiles de latence par préfixe
+        """
+        self.publish(force=True)
+        snapshots, retired = self.store.collect_totals(self._retire)
+        snapshots = snapshots or [self.snapshot()]
+        merged = self._fold(snapshots + [retired])
+
+        stats = {}
+        for prefix, entry in sorted(merged.items()):
+            lookups = entry['hits'] + entry['misses']
+            stats[prefix] = {
+                **{field: entry[field] for field in COUNTER_FIELDS},
+                'hit_ratio': round(entry['hits'] / lookups, 4) if lookups else None,
+                'latency': {op: histogram.summary() for op, histogram in entry['latency'].items()}
+            }
+
+        return {
+            'workers': len(snapshots),
+            'prefixes': stats
+        }
+
+    def openmetrics_families(self) -> List[Dict]:
+        """
+        Familles OpenMetrics (collecteur de MetricsRegistry)
+
+        Returns:
+            list: Compteurs de requêtes et d'octets, résumés de latence par préfixe
+        """
+        requests = {'name': 'agrobiz_cache_requests', 'type': 'counter',
+                    'help': 'Lectures du cache par préfixe et résultat', 'samples': []}
+        transferred = {'name': 'agrobiz_cache_bytes', 'type': 'counter',
+                       'help': 'Octets lus et écrits dans le cache par préfixe', 'samples': []}
+        latency = {'name': 'agrobiz_cache_operation_latency_seconds', 'type': 'summary',
+                   'help': 'Latence des opérations de cache par préfixe', 'samples': []}
+
+        for prefix, data in self.get_stats()['prefixes'].items():
+            for result, field in (('hit', 'hits'), ('miss', 'misses'), ('error', 'errors')):
+                requests['samples'].append(('_total', {'prefix': prefix, 'result': result}, data[field]))
+            transferred['samples'].append(('_total', {'prefix': prefix, 'direction': 'read'}, data['bytes_read']))
+            transferred['samples'].append(('_total', {'prefix': prefix, 'direction': 'write'}, data['bytes_written']))
+            for operation, summary in data['latency'].items():
+                labels = {'prefix': prefix, 'operation': operation}
+                for quantile, field in (('0.5', 'p50_ms'), ('0.95', 'p95_ms'), ('0.99', 'p99_ms')):
+                    if summary.get(field) is not None:
+                        latency['samples'].append(('', {**labels, 'quantile': quantile}, summary[field] / 1000))
+                latency['samples'].append(('_count', labels, summary['count']))
+                latency['samples'].append(('_sum', labels, (summary['avg_ms'] or 0) * summary['count'] / 1000))
+
+        return [requests, transferred, latency]
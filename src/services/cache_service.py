@@ -5,12 +5,49 @@ Optimisation des performances avec cache intelligent
 
 import redis
 import json
+import math
 import pickle
+import random
 import hashlib
-from typing import Any, Optional, Dict, List
+import threading
+import time
+import uuid
+from typing import Any, Optional, Dict, List, Iterable
 from datetime import datetime, timedelta
 import os
 
+from src.services.local_cache_backend import LocalCacheBackend
+from src.services.cache_metrics import CacheMetrics
+from src.services.metrics_registry import metrics_registry
+
+KEY_NAMESPACE = "agrobiz"
+TAG_NAMESPACE = f"{KEY_NAMESPACE}:tag"
+LOCK_NAMESPACE = f"{KEY_NAMESPACE}:lock"
+
+# Libère le verrou seulement s'il appartient encore à l'appelant
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+class CacheEntry:
+    """Valeur stockée par get_or_set avec son expiration logique"""
+    
+    __slots__ = ('value', 'expires_at', 'compute_time')
+    
+    def __init__(self, value: Any, expires_at: float, compute_time: float):
+        self.value = value
+        self.expires_at = expires_at
+        self.compute_time = compute_time
+    
+    def __getstate__(self):
+        return (self.value, self.expires_at, self.compute_time)
+    
+    def __setstate__(self, state):
+        self.value, self.expires_at, self.compute_time = state
+
 class CacheService:
     """Service de cache Redis pour optimiser les performances"""
     
@@ -23,17 +60,63 @@ class CacheService:
         """
         self.redis_url = redis_url or os.getenv('REDIS_URL', 'redis://localhost:6379')
         self.redis_client = None
+        self.backend = None
         self.cache_enabled = os.getenv('CACHE_ENABLED', 'true').lower() == 'true'
-        
-        try:
-            self.redis_client = redis.from_url(self.redis_url)
-            # Test de connexion
-            self.redis_client.ping()
-            print(f"✅ Cache Redis connecté: {self.redis_url}")
-        except Exception as e:
-            print(f"⚠️ Cache Redis non disponible: {e}")
+        cache_backend = os.getenv('CACHE_BACKEND', 'auto').lower()
+        
+        if self.cache_enabled and cache_backend in ('auto', 'redis'):
+            try:
+                self.redis_client = redis.from_url(self.redis_url)
+                # Test de connexion
+                self.redis_client.ping()
+                self.backend = 'redis'
+                print(f"✅ Cache Redis connecté: {self.redis_url}")
+            except Exception as e:
+                print(f"⚠️ Cache Redis non disponible: {e}")
+                self.redis_client = None
+        
+        # Sans Redis, le cache local SQLite (partagé entre workers) prend le relais
+        if self.cache_enabled and self.redis_client is None and cache_backend in ('auto', 'local'):
+            try:
+                self.redis_client = LocalCacheBackend()
+                self.backend = 'local'
+                print(f"✅ Cache local SQLite activé: {self.redis_client.path}")
+            except Exception as e:
+                print(f"⚠️ Cache local non disponible: {e}")
+                self.redis_client = None
+        
+        if self.redis_client is None:
             self.cache_enabled = False
-            self.redis_client = None
+        
+        # Durée de vie minimale des ensembles de tags (doit couvrir le TTL le plus long)
+        self.tag_ttl = int(os.getenv('CACHE_TAG_TTL', '172800'))
+        # Taille des lots pour SCAN et les suppressions groupées
+        self.scan_batch_size = int(os.getenv('CACHE_SCAN_BATCH_SIZE', '500'))
+        
+        # Protection contre les stampedes de get_or_set
+        self.stale_ttl = int(os.getenv('CACHE_STALE_TTL', '300'))
+        self.xfetch_beta = float(os.getenv('CACHE_XFETCH_BETA', '1.0'))
+        self.lock_ttl = float(os.getenv('CACHE_LOCK_TTL', '30'))
+        self.lock_wait_timeout = float(os.getenv('CACHE_LOCK_WAIT_TIMEOUT', '10'))
+        self.lock_poll_interval = 0.05
+        self._local_locks = {}
+        self._local_locks_guard = threading.Lock()
+        self._release_lock_script = None
+        self._stampede_stats = {
+            'hits': 0,
+            'misses': 0,
+            'early_recomputes': 0,
+            'stale_served': 0,
+            'stale_refreshes': 0,
+            'lock_waits': 0,
+            'lock_wait_hits': 0,
+            'lock_timeouts': 0,
+            'callback_errors': 0
+        }
+        self._stampede_stats_lock = threading.Lock()
+        
+        # Hits, misses, erreurs, latences et volumes par préfixe de clé
+        self.metrics = CacheMetrics(KEY_NAMESPACE)
     
     def is_available(self) -> bool:
         """Vérifie si le cache est disponible"""
@@ -69,9 +152,21 @@ class CacheService:
         for key, value in sorted(kwargs.items()):
             key_parts.append(f"{key}:{value}")
         
-        # Créer un hash de la clé
+        # Créer un hash de la clé, en gardant le préfixe lisible pour SCAN
         key_string = ":".join(key_parts)
-        return f"agrobiz:{hashlib.md5(key_string.encode()).hexdigest()}"
+        return f"{KEY_NAMESPACE}:{prefix}:{hashlib.md5(key_string.encode()).hexdigest()}"
+    
+    def _tag_key(self, tag: str) -> str:
+        """
+        Génère la clé de l'ensemble Redis qui référence les clés d'un tag
+        
+        Args:
+            tag (str): Tag logique (ex: "user:42", "zone:Zone côtière")
+            
+        Returns:
+            str: Clé de l'ensemble du tag
+        """
+        return f"{TAG_NAMESPACE}:{tag}"
     
     def get(self, key: str, default: Any = None) -> Any:
         """
@@ -87,16 +182,38 @@ class CacheService:
         if not self.is_available():
             return default
         
+        value = self._get_raw(key)
+        if value is None:
+            return default
+        if isinstance(value, CacheEntry):
+            return value.value
+        return value
+    
+    def _get_raw(self, key: str) -> Any:
+        """
+        Récupère la valeur brute (éventuellement une CacheEntry) sans la déballer
+        
+        Args:
+            key (str): Clé de cache
+            
+        Returns:
+            any: Valeur désérialisée ou None
+        """
+        start_time = time.perf_counter()
         try:
             value = self.redis_client.get(key)
-            if value is not None:
-                return pickle.loads(value)
-            return default
+            elapsed_ms = (time.perf_counter() - start_time) * 1000
+            if value is None:
+                self.metrics.record(key, 'get', elapsed_ms, 'misses')
+                return None
+            self.metrics.record(key, 'get', elapsed_ms, 'hits', len(value))
+            return pickle.loads(value)
         except Exception as e:
+            self.metrics.record(key, 'get', (time.perf_counter() - start_time) * 1000, 'errors')
             print(f"Erreur récupération cache: {e}")
-            return default
+            return None
     
-    def set(self, key: str, value: Any, ttl: int = 3600) -> bool:
+    def set(self, key: str, value: Any, ttl: int = 3600, tags: Iterable[str] = None) -> bool:
         """
         Stocke une valeur dans le cache
         
@@ -104,6 +221,7 @@ class CacheService:
             key (str): Clé de cache
             value (any): Valeur à stocker
             ttl (int): Time to live en secondes (défaut: 1h)
+            tags (iterable): Tags d'invalidation (ex: ["user:42", "zone:Zone côtière"])
             
         Returns:
             bool: True si succès, False sinon
@@ -111,10 +229,25 @@ class CacheService:
         if not self.is_available():
             return False
         
+        start_time = time.perf_counter()
         try:
             serialized_value = pickle.dumps(value)
-            return self.redis_client.setex(key, ttl, serialized_value)
+            pipe = self.redis_client.pipeline()
+            pipe.setex(key, ttl, serialized_value)
+            
+            # Enregistrer la clé dans l'ensemble de chaque tag
+            tag_ttl = max(ttl, self.tag_ttl)
+            for tag in tags or ():
+                tag_key = self._tag_key(tag)
+                pipe.sadd(tag_key, key)
+                pipe.expire(tag_key, tag_ttl)
+            
+            success = bool(pipe.execute()[0])
+            self.metrics.record(key, 'set', (time.perf_counter() - start_time) * 1000,
+                                None if success else 'errors', len(serialized_value))
+            return success
         except Exception as e:
+            self.metrics.record(key, 'set', (time.perf_counter() - start_time) * 1000, 'errors')
             print(f"Erreur stockage cache: {e}")
             return False
     
@@ -131,16 +264,47 @@ class CacheService:
         if not self.is_available():
             return False
         
+        start_time = time.perf_counter()
         try:
-            return bool(self.redis_client.delete(key))
+            deleted = bool(self.redis_client.delete(key))
+            self.metrics.record(key, 'delete', (time.perf_counter() - start_time) * 1000)
+            return deleted
         except Exception as e:
+            self.metrics.record(key, 'delete', (time.perf_counter() - start_time) * 1000, 'errors')
             print(f"Erreur suppression cache: {e}")
             return False
     
+    def _delete_in_batches(self, keys: Iterable) -> int:
+        """
+        Supprime des clés par lots pour ne pas bloquer Redis
+        
+        Args:
+            keys (iterable): Clés à supprimer
+            
+        Returns:
+            int: Nombre de clés supprimées
+        """
+        deleted_count = 0
+        batch = []
+        
+        for key in keys:
+            batch.append(key)
+            if len(batch) >= self.scan_batch_size:
+                deleted_count += self.redis_client.delete(*batch)
+                batch = []
+        
+        if batch:
+            deleted_count += self.redis_client.delete(*batch)
+        
+        return deleted_count
+    
     def clear_pattern(self, pattern: str) -> int:
         """
         Supprime toutes les clés correspondant à un pattern
         
+        Utilise SCAN (incrémental) plutôt que KEYS, qui bloque le serveur
+        sur les grands espaces de clés.
+        
         Args:
             pattern (str): Pattern Redis (ex: "agrobiz:weather:*")
             
@@ -151,39 +315,233 @@ class CacheService:
             return 0
         
         try:
-            keys = self.redis_client.keys(pattern)
-            if keys:
-                return self.redis_client.delete(*keys)
-            return 0
+            keys = self.redis_client.scan_iter(match=pattern, count=self.scan_batch_size)
+            return self._delete_in_batches(keys)
         except Exception as e:
             print(f"Erreur suppression pattern cache: {e}")
             return 0
     
-    def get_or_set(self, key: str, callback: callable, ttl: int = 3600) -> Any:
+    def invalidate_tags(self, *tags: str) -> int:
+        """
+        Supprime exactement les clés enregistrées sous les tags donnés
+        
+        Args:
+            *tags (str): Tags à invalider (ex: "user:42")
+            
+        Returns:
+            int: Nombre de clés supprimées
+        """
+        if not self.is_available():
+            return 0
+        
+        deleted_count = 0
+        for tag in tags:
+            try:
+                tag_key = self._tag_key(tag)
+                members = self.redis_client.smembers(tag_key)
+                if members:
+                    deleted_count += self._delete_in_batches(members)
+                self.redis_client.delete(tag_key)
+            except Exception as e:
+                print(f"Erreur invalidation tag cache {tag}: {e}")
+        
+        return deleted_count
+    
+    def _count(self, stat: str):
+        """Incrémente un compteur de chemin de get_or_set"""
+        with self._stampede_stats_lock:
+            self._stampede_stats[stat] += 1
+    
+    def _acquire_lock(self, key: str) -> Optional[tuple]:
+        """
+        Acquiert le verrou de recalcul d'une clé (processus puis Redis)
+        
+        Args:
+            key (str): Clé de cache protégée
+            
+        Returns:
+            tuple: (verrou local, jeton Redis) ou None si déjà pris
+        """
+        with self._local_locks_guard:
+            local_lock = self._local_locks.setdefault(key, threading.Lock())
+        
+        if not local_lock.acquire(blocking=False):
+            return None
+        
+        token = uuid.uuid4().hex
+        try:
+            acquired = self.redis_client.set(
+                f"{LOCK_NAMESPACE}:{key}", token, nx=True, px=int(self.lock_ttl * 1000)
+            )
+        except Exception as e:
+            print(f"Erreur verrou cache: {e}")
+            acquired = True  # Redis indisponible : le verrou local suffit
+            token = None
+        
+        if not acquired:
+            self._release_local_lock(key, local_lock)
+            return None
+        
+        return local_lock, token
+    
+    def _release_local_lock(self, key: str, local_lock: threading.Lock):
+        """Libère le verrou local et l'oublie s'il n'est plus utilisé"""
+        with self._local_locks_guard:
+            local_lock.release()
+            if self._local_locks.get(key) is local_lock:
+                del self._local_locks[key]
+    
+    def _release_lock(self, key: str, lock: tuple):
+        """
+        Libère un verrou acquis par _acquire_lock
+        
+        Args:
+            key (str): Clé de cache protégée
+            lock (tuple): Verrou retourné par _acquire_lock
+        """
+        local_lock, token = lock
+        try:
+            if token is not None and self.backend == 'local':
+                self.redis_client.delete_if_equals(f"{LOCK_NAMESPACE}:{key}", token)
+            elif token is not None:
+                if self._release_lock_script is None:
+                    self._release_lock_script = self.redis_client.register_script(RELEASE_LOCK_SCRIPT)
+                self._release_lock_script(keys=[f"{LOCK_NAMESPACE}:{key}"], args=[token])
+        except Exception as e:
+            print(f"Erreur libération verrou cache: {e}")
+        finally:
+            self._release_local_lock(key, local_lock)
+    
+    def _compute_and_store(self, key: str, callback: callable, ttl: int, tags: Iterable[str]) -> Any:
+        """
+        Exécute le callback et stocke le résultat avec son expiration logique
+        
+        La clé vit ttl + stale_ttl secondes dans Redis pour pouvoir servir
+        l'ancienne valeur pendant qu'un seul appelant la recalcule.
+        """
+        start_time = time.time()
+        result = callback()
+        compute_time = time.time() - start_time
+        
+        entry = CacheEntry(result, time.time() + ttl, compute_time)
+        self.set(key, entry, ttl=ttl + self.stale_ttl, tags=tags)
+        return result
+    
+    def _should_recompute_early(self, entry: CacheEntry, now: float, beta: float) -> bool:
+        """
+        Recalcul anticipé probabiliste (XFetch)
+        
+        La probabilité augmente à l'approche de l'expiration, proportionnellement
+        au temps de calcul de la valeur.
+        """
+        if beta <= 0 or entry.compute_time <= 0:
+            return False
+        return now - entry.compute_time * beta * math.log(random.random() or 1e-12) >= entry.expires_at
+    
+    def _wait_for_value(self, key: str) -> Optional[CacheEntry]:
+        """
+        Attend qu'un autre appelant ait stocké la valeur
+        
+        Returns:
+            CacheEntry: Entrée trouvée ou None après lock_wait_timeout
+        """
+        deadline = time.time() + self.lock_wait_timeout
+        while time.time() < deadline:
+            time.sleep(self.lock_poll_interval)
+            entry = self._get_raw(key)
+            if entry is not None:
+                return entry
+        return None
+    
+    def get_or_set(self, key: str, callback: callable, ttl: int = 3600, tags: Iterable[str] = None,
+                   beta: float = None) -> Any:
         """
         Récupère une valeur du cache ou l'exécute et la stocke
         
+        Un seul appelant (par processus et entre workers) exécute le callback
+        pour une clé donnée ; les autres servent l'ancienne valeur ou attendent
+        le résultat.
+        
         Args:
             key (str): Clé de cache
             callback (callable): Fonction à exécuter si pas en cache
             ttl (int): Time to live en secondes
+            tags (iterable): Tags d'invalidation
+            beta (float): Agressivité du recalcul anticipé (0 pour le désactiver)
             
         Returns:
             any: Valeur en cache ou résultat de callback
         """
-        # Essayer de récupérer du cache
-        cached_value = self.get(key)
-        if cached_value is not None:
-            return cached_value
+        if not self.is_available():
+            try:
+                return callback()
+            except Exception as e:
+                self._count('callback_errors')
+                print(f"Erreur callback cache: {e}")
+                return None
+        
+        beta = self.xfetch_beta if beta is None else beta
+        entry = self._get_raw(key)
+        now = time.time()
+        
+        # Valeur stockée par set() sans expiration logique
+        if entry is not None and not isinstance(entry, CacheEntry):
+            self._count('hits')
+            return entry
+        
+        if entry is not None:
+            fresh = now < entry.expires_at
+            if fresh and not self._should_recompute_early(entry, now, beta):
+                self._count('hits')
+                return entry.value
+            
+            lock = self._acquire_lock(key)
+            if lock is None:
+                # Un autre appelant recalcule : servir l'ancienne valeur
+                self._count('hits' if fresh else 'stale_served')
+                return entry.value
+            
+            self._count('early_recomputes' if fresh else 'stale_refreshes')
+            try:
+                return self._compute_and_store(key, callback, ttl, tags)
+            except Exception as e:
+                self._count('callback_errors')
+                print(f"Erreur callback cache: {e}")
+                return entry.value
+            finally:
+                self._release_lock(key, lock)
+        
+        # Absente du cache : un seul appelant calcule, les autres attendent
+        lock = self._acquire_lock(key)
+        if lock is None:
+            self._count('lock_waits')
+            entry = self._wait_for_value(key)
+            if entry is not None:
+                self._count('lock_wait_hits')
+                return entry.value if isinstance(entry, CacheEntry) else entry
+            self._count('lock_timeouts')
+        else:
+            self._count('misses')
         
-        # Exécuter la fonction et stocker le résultat
         try:
-            result = callback()
-            self.set(key, result, ttl)
-            return result
+            return self._compute_and_store(key, callback, ttl, tags)
         except Exception as e:
+            self._count('callback_errors')
             print(f"Erreur callback cache: {e}")
             return None
+        finally:
+            if lock is not None:
+                self._release_lock(key, lock)
+    
+    def get_stampede_stats(self) -> Dict:
+        """
+        Récupère les compteurs des chemins empruntés par get_or_set
+        
+        Returns:
+            dict: Nombre de passages par chemin
+        """
+        with self._stampede_stats_lock:
+            return dict(self._stampede_stats)
     
     def cache_weather_data(self, zone: str, weather_data: Dict) -> bool:
         """
@@ -197,7 +555,7 @@ class CacheService:
             bool: True si succès
         """
         key = self._generate_key("weather", zone)
-        return self.set(key, weather_data, ttl=1800)  # 30 minutes
+        return self.set(key, weather_data, ttl=1800, tags=[f"zone:{zone}"])  # 30 minutes
     
     def get_cached_weather_data(self, zone: str) -> Optional[Dict]:
         """
@@ -223,7 +581,7 @@ class CacheService:
             bool: True si succès
         """
         key = self._generate_key("pineapple", "varieties")
-        return self.set(key, varieties, ttl=7200)  # 2 heures
+        return self.set(key, varieties, ttl=7200, tags=["pineapple"])  # 2 heures
     
     def get_cached_pineapple_varieties(self) -> Optional[List[Dict]]:
         """
@@ -247,7 +605,7 @@ class CacheService:
             bool: True si succès
         """
         key = self._generate_key("business_plan", user_id)
-        return self.set(key, plan_data, ttl=3600)  # 1 heure
+        return self.set(key, plan_data, ttl=3600, tags=[f"user:{user_id}"])  # 1 heure
     
     def get_cached_business_plan(self, user_id: int) -> Optional[Dict]:
         """
@@ -262,19 +620,21 @@ class CacheService:
         key = self._generate_key("business_plan", user_id)
         return self.get(key)
     
-    def cache_disease_diagnosis(self, image_hash: str, diagnosis: Dict) -> bool:
+    def cache_disease_diagnosis(self, image_hash: str, diagnosis: Dict, user_id: str = None) -> bool:
         """
         Cache un diagnostic de maladie
         
         Args:
             image_hash (str): Hash de l'image
             diagnosis (dict): Résultats du diagnostic
+            user_id (str): ID de l'utilisateur (optionnel, pour l'invalidation)
             
         Returns:
             bool: True si succès
         """
         key = self._generate_key("diagnosis", image_hash)
-        return self.set(key, diagnosis, ttl=86400)  # 24 heures
+        tags = [f"user:{user_id}"] if user_id is not None else None
+        return self.set(key, diagnosis, ttl=86400, tags=tags)  # 24 heures
     
     def get_cached_diagnosis(self, image_hash: str) -> Optional[Dict]:
         """
@@ -301,7 +661,7 @@ class CacheService:
             bool: True si succès
         """
         key = self._generate_key("user_context", user_id)
-        return self.set(key, context, ttl=1800)  # 30 minutes
+        return self.set(key, context, ttl=1800, tags=[f"user:{user_id}"])  # 30 minutes
     
     def get_cached_user_context(self, user_id: str) -> Optional[Dict]:
         """
@@ -330,17 +690,8 @@ class CacheService:
             return False
         
         try:
-            # Supprimer toutes les clés liées à l'utilisateur
-            patterns = [
-                f"agrobiz:business_plan:*{user_id}*",
-                f"agrobiz:user_context:*{user_id}*",
-                f"agrobiz:diagnosis:*{user_id}*"
-            ]
-            
-            deleted_count = 0
-            for pattern in patterns:
-                deleted_count += self.clear_pattern(pattern)
-            
+            # Les clés sont hachées : on passe par le tag utilisateur
+            deleted_count = self.invalidate_tags(f"user:{user_id}")
             return deleted_count > 0
         except Exception as e:
             print(f"Erreur effacement cache utilisateur: {e}")
@@ -357,8 +708,10 @@ class CacheService:
             return {
                 'enabled': False,
                 'connected': False,
+                'backend': self.backend,
                 'keys_count': 0,
-                'memory_usage': 0
+                'memory_usage': 0,
+                'operations': self.metrics.get_stats()
             }
         
         try:
@@ -368,18 +721,23 @@ class CacheService:
             return {
                 'enabled': True,
                 'connected': True,
+                'backend': self.backend,
                 'keys_count': keys_count,
                 'memory_usage': info.get('used_memory_human', '0B'),
                 'redis_version': info.get('redis_version', 'Unknown'),
-                'uptime': info.get('uptime_in_seconds', 0)
+                'uptime': info.get('uptime_in_seconds', 0),
+                'get_or_set': self.get_stampede_stats(),
+                'operations': self.metrics.get_stats()
             }
         except Exception as e:
             print(f"Erreur statistiques cache: {e}")
             return {
                 'enabled': True,
                 'connected': False,
+                'backend': self.backend,
                 'keys_count': 0,
-                'memory_usage': '0B'
+                'memory_usage': '0B',
+                'operations': self.metrics.get_stats()
             }
     
     def health_check(self) -> Dict:
@@ -398,7 +756,7 @@ class CacheService:
         if not self.is_available():
             return {
                 'status': 'error',
-                'message': 'Cache Redis non disponible'
+                'message': f'Cache {self.backend or "Redis"} non disponible'
             }
         
         try:
@@ -406,7 +764,7 @@ class CacheService:
             self.redis_client.ping()
             
             # Test d'écriture/lecture
-            test_key = "agrobiz:health_check"
+            test_key = f"{KEY_NAMESPACE}:health_check"
             test_value = {"test": "data", "timestamp": datetime.now().isoformat()}
             
             self.set(test_key, test_value, ttl=60)
@@ -415,7 +773,7 @@ class CacheService:
             if retrieved_value and retrieved_value.get('test') == 'data':
                 return {
                     'status': 'healthy',
-                    'message': 'Cache opérationnel',
+                    'message': f'Cache opérationnel ({self.backend})',
                     'stats': self.get_cache_stats()
                 }
             else:
@@ -428,4 +786,8 @@ class CacheService:
             return {
                 'status': 'error',
                 'message': f'Erreur cache: {str(e)}'
-            } 
\ No newline at end of file
+            }
+
+# Instance partagée du service de cache
+cache_service = CacheService()
+metrics_registry.register_collector(cache_service.metrics.openmetrics_families)
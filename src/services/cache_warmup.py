@@ -0,0 +1,180 @@
+"""
+Préchauffage du cache au démarrage des workers AgroBizChat
+Charge les données de référence en arrière-plan, avec une concurrence bornée
+"""
+
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Tuple
+
+from src.services.metrics_registry import metrics_registry
+
+# Les données ananas sont construites en mémoire par PineappleService : rien à préchauffer
+DEFAULT_TASK_GROUPS = ('weather', 'templates')
+
+def _warm_weather(zone: str) -> Callable:
+    """Météo actuelle d'une zone (mise en cache par WeatherService)"""
+    def task():
+        from src.services.weather_service import WeatherService
+        WeatherService().get_current_weather(zone)
+    return task
+
+def _warm_templates():
+    """Texte des templates actifs (cache d'extraction de GeminiAnalysisService)"""
+    from src.routes.chatbot import get_all_templates
+    from src.services.gemini_service import GeminiAnalysisService
+
+    gemini_service = GeminiAnalysisService()
+    for template in get_all_templates():
+        if template.get('file_path'):
+            gemini_service.extract_text_from_file(template['file_path'], template.get('file_type') or '')
+
+class CacheWarmup:
+    """Exécute les tâches de préchauffage et expose leur progression"""
+
+    def __init__(self):
+        self.enabled = os.getenv('CACHE_WARMUP_ENABLED', 'true').lower() == 'true'
+        self.concurrency = max(1, int(os.getenv('CACHE_WARMUP_CONCURRENCY', '2')))
+        self.timeout = float(os.getenv('CACHE_WARMUP_TIMEOUT', '120'))
+        groups = os.getenv('CACHE_WARMUP_TASKS', ','.join(DEFAULT_TASK_GROUPS))
+        self.task_groups = [group.strip() for group in groups.split(',') if group.strip()]
+
+        self._lock = threading.Lock()
+        self._pid = None
+        self._reset()
+
+    def _reset(self):
+        """Réinitialise la progression (nouveau processus)"""
+        self.status = 'disabled' if not self.enabled else 'pending'
+        self.started_at = None
+        self.finished_at = None
+        self.tasks = {}
+
+    def build_tasks(self) -> List[Tuple[str, Callable]]:
+        """
+        Construit la liste des tâches selon CACHE_WARMUP_TASKS
+
+        Returns:
+            list: Couples (nom, fonction)
+        """
+        from src.services.weather_service import WeatherService
+
+        tasks = []
+        if 'weather' in self.task_groups:
+            for zone in WeatherService.ZONE_COORDINATES:
+                tasks.append((f"weather:{zone}", _warm_weather(zone)))
+        if 'templates' in self.task_groups:
+            tasks.append(('templates', _warm_templates))
+        return tasks
+
+    def start(self, tasks: List[Tuple[str, Callable]] = None, background: bool = True) -> bool:
+        """
+        Lance le préchauffage (une seule fois par processus)
+
+        Args:
+            tasks (list): Tâches à exécuter (défaut: build_tasks())
+            background (bool): Exécuter dans un thread démon
+
+        Returns:
+            bool: True si le préchauffage a été lancé
+        """
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._reset()
+            if not self.enabled or self.status != 'pending':
+                return False
+
+            self.status = 'running'
+            self.started_at = time.time()
+
+        try:
+            tasks = tasks if tasks is not None else self.build_tasks()
+        except Exception as e:
+            print(f"Erreur construction tâches préchauffage: {e}")
+            tasks = []
+
+        for name, _ in tasks:
+            self.tasks[name] = {'status': 'pending'}
+
+        if background:
+            threading.Thread(target=self._run, args=(tasks,), name='cache-warmup', daemon=True).start()
+        else:
+            self._run(tasks)
+        return True
+
+    def _run_task(self, name: str, func: Callable):
+        """Exécute une tâche et enregistre sa durée"""
+        self.tasks[name]['status'] = 'running'
+        start_time = time.perf_counter()
+        try:
+            func()
+            self.tasks[name]['status'] = 'done'
+        except Exception as e:
+            self.tasks[name]['status'] = 'failed'
+            self.tasks[name]['error'] = str(e)
+            print(f"Erreur préchauffage {name}: {e}")
+        self.tasks[name]['duration_ms'] = round((time.perf_counter() - start_time) * 1000, 2)
+
+    def _run(self, tasks: List[Tuple[str, Callable]]):
+        """Exécute les tâches avec une concurrence bornée et un délai global"""
+        executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='cache-warmup')
+        try:
+            futures = [executor.submit(self._run_task, name, func) for name, func in tasks]
+            wait(futures, timeout=self.timeout)
+        finally:
+            executor.shutdown(wait=False)
+
+        # Les tâches trop lentes continuent, mais le worker est déclaré prêt
+        for task in self.tasks.values():
+            if task['status'] in ('pending', 'running'):
+                task['status'] = 'timeout'
+
+        self.finished_at = time.time()
+        self.status = 'done'
+        print(f"✅ Préchauffage cache terminé en {self.finished_at - self.started_at:.2f}s "
+              f"({self._count('done')}/{len(self.tasks)} tâches)")
+
+    def _count(self, status: str) -> int:
+        """Nombre de tâches dans un état donné"""
+        return sum(1 for task in list(self.tasks.values()) if task['status'] == status)
+
+    def pending_count(self) -> int:
+        """Nombre de tâches pas encore terminées"""
+        return self._count('pending') + self._count('running')
+
+    def is_ready(self) -> bool:
+        """Le worker peut recevoir du trafic (préchauffage terminé, désactivé ou jamais lancé : flask run, Vercel)"""
+        return self.status != 'running'
+
+    def get_progress(self) -> Dict:
+        """
+        Progression du préchauffage pour le health check
+
+        Returns:
+            dict: État global et détail des tâches
+        """
+        total = len(self.tasks)
+        completed = total - self._count('pending') - self._count('running')
+
+        progress = {
+            'status': self.status,
+            'ready': self.is_ready(),
+            'total': total,
+            'completed': completed,
+            'failed': self._count('failed') + self._count('timeout'),
+            'percent': round(completed * 100 / total, 1) if total else 100.0,
+            'tasks': {name: dict(task) for name, task in list(self.tasks.items())}
+        }
+        if self.started_at:
+            end_time = self.finished_at or time.time()
+            progress['duration_s'] = round(end_time - self.started_at, 3)
+        return progress
+
+# Instance globale du préchauffage
+cache_warmup = CacheWarmup()
+
+queue_depth = metrics_registry.gauge('queue_depth', 'Tâches en attente par file de travail', ['queue'])
+queue_depth.set_function(cache_warmup.pending_count, queue='cache_warmup')
@@ -3,11 +3,71 @@ Service d'optimisation de base de données pour AgroBizChat
 Index, requêtes optimisées et maintenance
 """
 
+import re
 import sqlite3
+import tempfile
+import time
 from typing import Dict, List, Optional, Tuple
 from datetime import datetime
 import os
 
+from src.services.db_engine import is_sqlite, resolve_database_url, sqlite_database_path
+
+_TABLE_REF = re.compile(r'\b(?:FROM|JOIN|UPDATE)\s+"?(\w+)"?(?:\s+(?:AS\s+)?(?!WHERE\b|ON\b|SET\b|JOIN\b|LEFT\b|INNER\b|ORDER\b|GROUP\b|LIMIT\b)(\w+))?', re.I)
+_PREDICATE = re.compile(r'(?:"?(\w+)"?\.)?"?(\w+)"?\s*(==|=|<=|>=|<>|!=|<|>|\bIS\b|\bIN\b|\bBETWEEN\b|\bLIKE\b)', re.I)
+_CLAUSE_END = re.compile(r'\b(?:GROUP BY|ORDER BY|LIMIT|HAVING|RETURNING)\b', re.I)
+_EQUALITY = {'=', '==', 'IS', 'IN'}
+_RANGE = {'<', '>', '<=', '>=', 'BETWEEN', 'LIKE'}
+
+def _clause(sql: str, keyword: str) -> str:
+    """Texte d'une clause (WHERE, ORDER BY) jusqu'à la clause suivante"""
+    match = re.search(r'\b' + keyword + r'\b', sql, re.I)
+    if not match:
+        return ''
+    rest = sql[match.end():]
+    end = _CLAUSE_END.search(rest) if keyword.upper() == 'WHERE' else re.search(r'\b(?:LIMIT|OFFSET)\b', rest, re.I)
+    return rest[:end.start()] if end else rest
+
+def _query_columns(sql: str) -> Dict[str, Dict[str, List[str]]]:
+    """
+    Colonnes filtrées, triées et lues par table d'une requête (SQL généré par SQLAlchemy ou écrit à la main)
+
+    Returns:
+        dict: {table: {'equality': [...], 'range': [...], 'order': [...], 'selected': [...]}}
+    """
+    aliases = {}
+    for table, alias in _TABLE_REF.findall(sql):
+        aliases[table] = table
+        if alias:
+            aliases[alias] = table
+    tables = list(dict.fromkeys(aliases.values()))
+    default_table = tables[0] if len(tables) == 1 else None
+    columns = {table: {'equality': [], 'range': [], 'order': [], 'selected': []} for table in tables}
+
+    def owner(qualifier: str) -> Optional[str]:
+        return aliases.get(qualifier) if qualifier else default_table
+
+    for qualifier, column, operator in _PREDICATE.findall(_clause(sql, 'WHERE')):
+        table = owner(qualifier)
+        if table is None or column.upper() in ('AND', 'OR', 'NOT', 'NULL'):
+            continue
+        kind = 'equality' if operator.upper() in _EQUALITY else 'range' if operator.upper() in _RANGE else None
+        if kind and column not in columns[table][kind]:
+            columns[table][kind].append(column)
+
+    for term in _clause(sql, 'ORDER BY').split(','):
+        match = re.match(r'\s*(?:"?(\w+)"?\.)?"?(\w+)"?', term)
+        if match and owner(match.group(1)) and match.group(2).upper() not in ('ASC', 'DESC'):
+            columns[owner(match.group(1))]['order'].append(match.group(2))
+
+    select_match = re.match(r'\s*SELECT\s+(.*?)\s+FROM\b', sql, re.I | re.S)
+    if select_match:
+        for qualifier, column in re.findall(r'(?:"?(\w+)"?\.)"?(\w+)"?', select_match.group(1)):
+            table = owner(qualifier)
+            if table and column not in columns[table]['selected']:
+                columns[table]['selected'].append(column)
+    return columns
+
 class DatabaseOptimizer:
     """Service d'optimisation de base de données"""
     
@@ -18,7 +78,11 @@ class DatabaseOptimizer:
         Args:
             db_path (str): Chemin vers la base de données
         """
-        self.db_path = db_path or os.path.join(os.path.dirname(__file__), '..', '..', 'database', 'app.db')
+        # Même base que l'application (DATABASE_URL ou database/app.db) ; les outils ci-dessous sont propres à SQLite
+        database_url = resolve_database_url()
+        self.is_sqlite = db_path is not None or is_sqlite(database_url)
+        self.db_path = db_path or sqlite_database_path(database_url) or \
+            os.path.join(os.path.dirname(__file__), '..', '..', 'database', 'app.db')
         self.optimization_enabled = os.getenv('DB_OPTIMIZATION_ENABLED', 'true').lower() == 'true'
     
     def create_indexes(self) -> Dict:
@@ -37,27 +101,27 @@ class DatabaseOptimizer:
             
             indexes_created = []
             indexes_existing = []
+            indexes_skipped = []
             
             # Index pour la table users
+            # (platform, platform_user_id) est déjà couvert par l'index de la contrainte UNIQUE
             user_indexes = [
                 ('idx_users_email', 'users', 'email'),
-                ('idx_users_phone', 'users', 'phone'),
                 ('idx_users_zone', 'users', 'zone_agro_ecologique'),
                 ('idx_users_created_at', 'users', 'created_at')
             ]
             
-            # Index pour la table conversations
+            # Index pour la table conversations (recherche de la session du webhook)
             conversation_indexes = [
                 ('idx_conversations_user_id', 'conversations', 'user_id'),
-                ('idx_conversations_platform', 'conversations', 'platform'),
+                ('idx_conversations_user_session_status', 'conversations', 'user_id, session_id, status'),
                 ('idx_conversations_created_at', 'conversations', 'created_at')
             ]
             
-            # Index pour la table messages
+            # Index pour la table messages (historique d'une conversation trié par date)
             message_indexes = [
-                ('idx_messages_conversation_id', 'messages', 'conversation_id'),
-                ('idx_messages_created_at', 'messages', 'created_at'),
-                ('idx_messages_sender_type', 'messages', 'sender_type')
+                ('idx_messages_conversation_created', 'messages', 'conversation_id, created_at'),
+                ('idx_messages_created_at', 'messages', 'created_at')
             ]
             
             # Index pour la table business_plans
@@ -103,7 +167,18 @@ class DatabaseOptimizer:
                 business_plan_indexes + pineapple_indexes + payment_indexes + diagnosis_indexes
             )
             
+            table_columns = {}
             for index_name, table_name, columns in all_indexes:
+                # Tables absentes (modules non installés) ou colonnes renommées : index ignoré
+                if table_name not in table_columns:
+                    cursor.execute(f"PRAGMA table_info({table_name})")
+                    table_columns[table_name] = {row[1] for row in cursor.fetchall()}
+                missing = [column.strip() for column in columns.split(',')
+                           if column.strip() not in table_columns[table_name]] if table_columns[table_name] else [table_name]
+                if missing:
+                    indexes_skipped.append({'index': index_name, 'missing': missing})
+                    continue
+                
                 try:
                     # Vérifier si l'index existe déjà
                     cursor.execute("""
@@ -130,6 +205,7 @@ class DatabaseOptimizer:
                 'status': 'success',
                 'indexes_created': indexes_created,
                 'indexes_existing': indexes_existing,
+                'indexes_skipped': indexes_skipped,
                 'total_indexes': len(indexes_created) + len(indexes_existing)
             }
             
@@ -387,6 +463,226 @@ class DatabaseOptimizer:
                 'message': f'Erreur création vues: {str(e)}'
             }
     
+    @staticmethod
+    def _index_columns(cursor, table: str) -> List[List[str]]:
+        """Colonnes des index existants d'une table (clé primaire entière comprise)"""
+        indexes = []
+        cursor.execute(f"PRAGMA table_info({table})")
+        for row in cursor.fetchall():
+            if row[5] == 1 and (row[2] or '').upper() == 'INTEGER':
+                indexes.append([row[1]])
+        cursor.execute(f"PRAGMA index_list({table})")
+        for index in cursor.fetchall():
+            cursor.execute(f"PRAGMA index_info({index[1]})")
+            indexes.append([row[2] for row in sorted(cursor.fetchall())])
+        return indexes
+
+    @staticmethod
+    def _plan_access(plan: List[str], table: str, aliases: List[str]) -> Dict:
+        """Accès à une table dans un plan : parcours complet, recherche indexée, colonnes contraintes"""
+        for detail in plan:
+            match = re.match(r'(SCAN|SEARCH)(?: TABLE)? (\w+)(?: AS (\w+))?(.*)', detail)
+            if not match or not ({match.group(2), match.group(3)} & set(aliases + [table])):
+                continue
+            constrained = re.search(r'\((.*)\)\s*$', match.group(4))
+            return {
+                'access': match.group(1).lower(),
+                'covering': 'COVERING INDEX' in match.group(4),
+                'indexed': 'INDEX' in match.group(4) or 'PRIMARY KEY' in match.group(4),
+                'constrained': re.findall(r'(\w+)\s*[=<>]', constrained.group(1)) if constrained else []
+            }
+        return {}
+
+    @staticmethod
+    def _time_statement(cursor, sql: str, parameters: tuple, repeat: int) -> float:
+        """Durée médiane d'une requête en millisecondes"""
+        durations = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            cursor.execute(sql, parameters)
+            cursor.fetchall()
+            durations.append(time.perf_counter() - start)
+        durations.sort()
+        return round(durations[len(durations) // 2] * 1000, 4)
+
+    def _index_candidates(self, cursor, sql: str, plan: List[str]) -> List[Dict]:
+        """Index composites ou couvrants qui éviteraient un parcours complet, un index partiel ou un tri temporaire"""
+        candidates = []
+        temp_sort = any('TEMP B-TREE FOR ORDER BY' in detail for detail in plan)
+        aliases = {}
+        for table, alias in _TABLE_REF.findall(sql):
+            aliases.setdefault(table, []).append(alias or table)
+
+        for table, columns in _query_columns(sql).items():
+            proposed = list(dict.fromkeys(columns['equality'] + (columns['order'] or columns['range'][:1])))
+            if not proposed:
+                continue
+
+            access = self._plan_access(plan, table, aliases.get(table, []))
+            partial = access.get('access') == 'search' and len(access['constrained']) < len(columns['equality'])
+            full_scan = access.get('access') == 'scan' and not access.get('covering')
+            if not (full_scan or partial or (temp_sort and columns['order'])):
+                continue
+            if any(existing[:len(proposed)] == proposed for existing in self._index_columns(cursor, table)):
+                continue
+
+            # Couvrant si la requête ne lit que quelques colonnes courtes en plus : plus d'accès à la table
+            extra = [column for column in columns['selected'] if column not in proposed]
+            cursor.execute(f"PRAGMA table_info({table})")
+            large = {row[1] for row in cursor.fetchall() if (row[2] or '').upper() in ('TEXT', 'BLOB', 'JSON', '')}
+            kind = 'composite' if len(proposed) > 1 else 'simple'
+            if columns['selected'] and 0 < len(extra) <= 2 and not large & set(extra):
+                proposed += extra
+                kind = 'couvrant'
+            candidates.append({
+                'index': f"idx_{table}_{'_'.join(proposed)}",
+                'table': table,
+                'columns': proposed,
+                'kind': kind,
+                'reason': 'parcours complet' if full_scan else 'index partiel' if partial else 'tri temporaire'
+            })
+        return candidates
+
+    def _scratch_copy(self) -> str:
+        """
+        Copie temporaire de la base (API de sauvegarde SQLite : lecture cohérente, aucun verrou d'écriture)
+
+        Returns:
+            str: Chemin de la copie, à supprimer par l'appelant
+        """
+        fd, path = tempfile.mkstemp(prefix='index-advisor-', suffix='.db')
+        os.close(fd)
+        try:
+            source = sqlite3.connect(self.db_path, timeout=5)
+            target = sqlite3.connect(path)
+            try:
+                source.backup(target)
+            finally:
+                target.close()
+                source.close()
+        except Exception:
+            os.unlink(path)
+            raise
+        return path
+
+    def advise_indexes(self, queries: List[Dict] = None, apply: bool = False, repeat: int = 20,
+                       limit: int = 20) -> Dict:
+        """
+        Propose des index à partir des requêtes réellement exécutées (EXPLAIN QUERY PLAN)
+
+        Les mesures sont faites sur une copie temporaire de la base : chaque index candidat y est
+        créé dans une transaction annulée, le plan et la durée médiane sont mesurés avant et après.
+        La base en service n'est ni verrouillée ni modifiée, sauf avec apply : les index utilisés
+        par le planificateur et qui ne ralentissent pas la requête y sont alors créés.
+
+        Args:
+            queries (list): Requêtes {sql, parameters} (défaut: formes relevées par l'instrumentation)
+            apply (bool): Créer les index retenus
+            repeat (int): Exécutions par mesure de durée
+            limit (int): Nombre de formes analysées (les plus coûteuses)
+
+        Returns:
+            dict: Propositions avec plans et durées avant/après, index créés
+        """
+        if not self.optimization_enabled:
+            return {'status': 'disabled', 'message': 'Optimisation désactivée'}
+        if not self.is_sqlite:
+            return {'status': 'unsupported', 'message': 'Conseiller d\'index disponible pour SQLite uniquement'}
+
+        if queries is None:
+            from src.services.db_instrumentation import query_shapes
+            queries = query_shapes.shapes()
+        queries = queries[:limit]
+
+        proposals = {}
+        skipped = []
+        scratch_path = None
+        try:
+            scratch_path = self._scratch_copy()
+            conn = sqlite3.connect(scratch_path, isolation_level=None)
+            cursor = conn.cursor()
+
+            for query in queries:
+                sql = query['sql']
+                parameters = tuple(query.get('parameters') or ())
+                if sql.count('?') != len(parameters):
+                    skipped.append({'sql': sql[:200], 'reason': 'paramètres indisponibles'})
+                    continue
+                try:
+                    cursor.execute(f"EXPLAIN QUERY PLAN {sql}", parameters)
+                    plan = [row[3] for row in cursor.fetchall()]
+                    candidates = self._index_candidates(cursor, sql, plan)
+                except sqlite3.Error as e:
+                    skipped.append({'sql': sql[:200], 'reason': str(e)})
+                    continue
+
+                for candidate in candidates:
+                    if candidate['index'] in proposals:
+                        proposals[candidate['index']]['queries'] += 1
+                        continue
+                    column_list = ', '.join(candidate['columns'])
+                    # Mesure dans une transaction annulée (y compris pour UPDATE/DELETE)
+                    cursor.execute("BEGIN")
+                    try:
+                        before_ms = self._time_statement(cursor, sql, parameters, repeat)
+                        cursor.execute(f"CREATE INDEX {candidate['index']} ON {candidate['table']} ({column_list})")
+                        cursor.execute(f"EXPLAIN QUERY PLAN {sql}", parameters)
+                        plan_after = [row[3] for row in cursor.fetchall()]
+                        after_ms = self._time_statement(cursor, sql, parameters, repeat)
+                    finally:
+                        cursor.execute("ROLLBACK")
+
+                    proposals[candidate['index']] = {
+                        **candidate,
+                        'sql': sql[:300],
+                        'calls': query.get('count'),
+                        'queries': 1,
+                        'plan_before': plan,
+                        'plan_after': plan_after,
+                        'before_ms': before_ms,
+                        'after_ms': after_ms,
+                        'used': any(candidate['index'] in detail for detail in plan_after)
+                    }
+            conn.close()
+
+            applied = []
+            if apply:
+                conn = sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+                cursor = conn.cursor()
+                created = []
+                # Les plus larges d'abord : un index préfixe d'un index créé serait redondant
+                for proposal in sorted(proposals.values(), key=lambda proposal: -len(proposal['columns'])):
+                    # Tolérance sur les requêtes sub-milliseconde, dont la mesure est bruitée
+                    if not proposal['used'] or proposal['after_ms'] > proposal['before_ms'] * 1.5:
+                        continue
+                    if any(table == proposal['table'] and columns[:len(proposal['columns'])] == proposal['columns']
+                           for table, columns in created):
+                        continue
+                    created.append((proposal['table'], proposal['columns']))
+                    cursor.execute(f"CREATE INDEX IF NOT EXISTS {proposal['index']} "
+                                   f"ON {proposal['table']} ({', '.join(proposal['columns'])})")
+                    cursor.execute(f"ANALYZE {proposal['table']}")
+                    applied.append(proposal['index'])
+                conn.close()
+
+            return {
+                'status': 'success',
+                'analyzed_queries': len(queries) - len(skipped),
+                'proposals': sorted(proposals.values(), key=lambda proposal: proposal['before_ms'] - proposal['after_ms'],
+                                    reverse=True),
+                'applied': applied,
+                'skipped': skipped
+            }
+
+        except Exception as e:
+            return {
+                'status': 'error',
+                'message': f'Erreur conseiller d\'index: {str(e)}'
+            }
+        finally:
+            if scratch_path and os.path.exists(scratch_path):
+                os.unlink(scratch_path)
+    
     def get_query_suggestions(self) -> Dict:
         """
         Suggère des optimisations de requêtes
@@ -0,0 +1,181 @@
+"""
+Configuration du moteur de base de données pour AgroBizChat
+URL (DATABASE_URL, PostgreSQL ou SQLite), options de pool adaptées aux workers
+gunicorn et pragmas SQLite appliqués à chaque connexion
+"""
+
+import os
+import sqlite3
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+
+def default_sqlite_path() -> Path:
+    """Base SQLite locale : database/app.db à la racine du projet (indépendant du répertoire courant)"""
+    return Path(__file__).parent.parent.parent.resolve() / 'database' / 'app.db'
+
+def resolve_database_url(url: str = None) -> str:
+    """
+    URL de connexion effective
+
+    Args:
+        url (str): URL explicite (défaut: DATABASE_URL)
+
+    Returns:
+        str: URL SQLAlchemy (postgres:// corrigé en postgresql://, SQLite locale par défaut)
+    """
+    url = (url or os.getenv('DATABASE_URL') or '').strip()
+    if not url:
+        return f"sqlite:///{default_sqlite_path()}"
+    # Heroku et Render fournissent encore postgres://, refusé par SQLAlchemy 1.4+
+    if url.startswith('postgres://'):
+        url = url.replace('postgres://', 'postgresql://', 1)
+    return url
+
+def is_sqlite(url: str) -> bool:
+    """Indique si l'URL désigne une base SQLite"""
+    return make_url(url).get_backend_name() == 'sqlite'
+
+def sqlite_database_path(url: str) -> Optional[str]:
+    """Chemin du fichier SQLite (None pour une base en mémoire ou un autre moteur)"""
+    if not is_sqlite(url):
+        return None
+    database = make_url(url).database
+    return database if database and database != ':memory:' else None
+
+def sqlite_pragmas() -> List[Tuple[str, str]]:
+    """
+    Pragmas appliqués à chaque connexion SQLite
+
+    WAL : les lectures ne bloquent plus l'écriture, et un commit n'écrit que le journal
+    (synchronous=NORMAL reste durable en WAL, hors coupure de courant).
+    busy_timeout : un worker attend le verrou d'écriture au lieu d'échouer.
+
+    Returns:
+        list: Couples (pragma, valeur)
+    """
+    return [
+        # Sans effet sur une base existante (archive_service.enable_incremental_vacuum) ; une base neuve
+        # rend ainsi l'espace des lignes archivées par PRAGMA incremental_vacuum
+        ('auto_vacuum', 'INCREMENTAL'),
+        ('journal_mode', 'WAL'),
+        ('synchronous', os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')),
+        ('busy_timeout', os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000')),
+        # Valeur négative : taille du cache de pages en KiB, par connexion
+        ('cache_size', str(-int(os.getenv('SQLITE_CACHE_SIZE_KB', '16384')))),
+        ('mmap_size', str(int(os.getenv('SQLITE_MMAP_SIZE_MB', '128')) * 1024 * 1024)),
+        ('temp_store', 'MEMORY')
+    ]
+
+def apply_sqlite_pragmas(dbapi_connection):
+    """
+    Applique les pragmas à une connexion sqlite3 (sans effet sur les autres pilotes)
+
+    Args:
+        dbapi_connection: Connexion DB-API
+    """
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in sqlite_pragmas():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+def _on_connect(dbapi_connection, connection_record):
+    apply_sqlite_pragmas(dbapi_connection)
+
+def engine_options(url: str) -> Dict:
+    """
+    Options de create_engine (SQLALCHEMY_ENGINE_OPTIONS) selon le moteur
+
+    Le pool est propre à chaque worker gunicorn : connexions totales =
+    workers x (DB_POOL_SIZE + DB_MAX_OVERFLOW), à garder sous max_connections.
+
+    Args:
+        url (str): URL de connexion
+
+    Returns:
+        dict: Options du moteur
+    """
+    # Threads de requêtes par worker (1 en workers synchrones) + threads de fond (préchauffage, SLO)
+    threads = int(os.getenv('GUNICORN_THREADS', '1'))
+    pool_size = int(os.getenv('DB_POOL_SIZE', str(threads + 2)))
+    max_overflow = int(os.getenv('DB_MAX_OVERFLOW', str(threads)))
+    pool_timeout = float(os.getenv('DB_POOL_TIMEOUT', '10'))
+
+    if is_sqlite(url):
+        if not sqlite_database_path(url):
+            return {'connect_args': {'check_same_thread': False}}
+        return {
+            'pool_size': pool_size,
+            'max_overflow': max_overflow,
+            'pool_timeout': pool_timeout,
+            'connect_args': {
+                # Attente du verrou côté pilote, en secondes (complète busy_timeout)
+                'timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000')) / 1000,
+                'check_same_thread': False
+            }
+        }
+
+    options = {
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'pool_timeout': pool_timeout,
+        # Connexions coupées par le serveur ou un proxy (Render, Heroku) détectées avant usage
+        'pool_pre_ping': True,
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', '1800')),
+        # Les connexions en trop restent inactives et sont recyclées
+        'pool_use_lifo': True
+    }
+    if make_url(url).get_backend_name() == 'postgresql':
+        options['connect_args'] = {
+            'connect_timeout': int(os.getenv('DB_CONNECT_TIMEOUT', '10')),
+            'application_name': os.getenv('DB_APPLICATION_NAME', 'agrobizchat'),
+            'options': f"-c statement_timeout={int(os.getenv('DB_STATEMENT_TIMEOUT_MS', '30000'))}"
+        }
+    return options
+
+def configure_app(app, url: str = None) -> str:
+    """
+    Renseigne la configuration Flask-SQLAlchemy (à appeler avant db.init_app, puis init_app_engine)
+
+    Args:
+        app (Flask): Application
+        url (str): URL explicite (défaut: DATABASE_URL ou database/app.db)
+
+    Returns:
+        str: URL retenue
+    """
+    url = resolve_database_url(url)
+    path = sqlite_database_path(url)
+    if path:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(url)
+    return url
+
+def attach_engine(engine: Engine):
+    """
+    Applique les pragmas SQLite aux connexions de ce moteur uniquement
+
+    Args:
+        engine (Engine): Moteur SQLAlchemy (les autres moteurs du processus ne sont pas modifiés)
+    """
+    if not event.contains(engine, 'connect', _on_connect):
+        event.listen(engine, 'connect', _on_connect)
+
+def init_app_engine(app, database):
+    """
+    Rattache les pragmas au moteur de l'application (à appeler après db.init_app, avant la première connexion)
+
+    Args:
+        app (Flask): Application
+        database (SQLAlchemy): Extension Flask-SQLAlchemy initialisée sur l'application
+    """
+    with app.app_context():
+        attach_engine(database.engine)
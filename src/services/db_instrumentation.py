@@ -0,0 +1,369 @@
+"""
+Instrumentation des requêtes SQL pour AgroBizChat
+Mesure la durée de chaque requête exécutée par SQLAlchemy, la regroupe par empreinte
+(texte sans valeurs), capture les requêtes lentes et compte les connexions des pools
+"""
+
+import os
+import re
+import time
+import hashlib
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import Pool
+
+from src.services.latency_histogram import LatencyHistogram
+from src.services.metrics_registry import metrics_registry
+
+# Type d'opération (premier mot-clé) : cardinalité bornée, jamais le texte SQL
+KNOWN_OPERATIONS = {'SELECT', 'INSERT', 'UPDATE', 'DELETE', 'PRAGMA', 'CREATE', 'DROP', 'ALTER', 'WITH', 'EXPLAIN'}
+
+db_query_duration = metrics_registry.histogram(
+    'db_query_duration_seconds',
+    'Durée des requêtes SQL par opération',
+    ['operation'],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+db_query_errors = metrics_registry.counter('db_query_errors', 'Requêtes SQL en erreur', ['operation'])
+
+# Connexions des pools du processus courant (remis à zéro dans un worker forké)
+_pool_counts = {'open': 0, 'checked_out': 0}
+_pool_lock = threading.Lock()
+
+def _reset_pool_counts():
+    """Les connexions héritées du processus parent ne sont pas celles du worker"""
+    with _pool_lock:
+        _pool_counts['open'] = 0
+        _pool_counts['checked_out'] = 0
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_pool_counts)
+
+def pool_connection_counts() -> dict:
+    """
+    Connexions ouvertes et empruntées, tous pools SQLAlchemy du worker confondus
+
+    Returns:
+        dict: {'open': int, 'checked_out': int}
+    """
+    with _pool_lock:
+        return dict(_pool_counts)
+
+db_pool_connections = metrics_registry.gauge('db_pool_connections', 'Connexions des pools SQLAlchemy', ['state'])
+db_pool_connections.set_function(lambda: pool_connection_counts()['open'], state='open')
+db_pool_connections.set_function(lambda: pool_connection_counts()['checked_out'], state='checked_out')
+
+_WHITESPACE = re.compile(r'\s+')
+# Listes IN dépliées par SQLAlchemy : (?, ?, ?) et (?) sont la même forme
+_EXPANDED_IN = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+# Littéraux inclus dans le texte (requêtes construites à la main, text(), PRAGMA)
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'(?<![\w.])-?\d+(?:\.\d+)?\b')
+_NAMED_PARAMETER = re.compile(r'(?<![:\w]):\w+|%\(\w+\)s|%s|\$\d+')
+# Plusieurs lignes de VALUES : INSERT ... VALUES (?), (?) et VALUES (?) sont la même forme
+_VALUES_ROWS = re.compile(r'\(\?\)(?:\s*,\s*\(\?\))+')
+
+def normalize_sql(statement: str) -> str:
+    """Texte SQL sur une ligne, listes de paramètres IN repliées"""
+    return _EXPANDED_IN.sub('(?)', _WHITESPACE.sub(' ', statement or '').strip())
+
+def fingerprint_sql(statement: str) -> Tuple[str, str]:
+    """
+    Empreinte d'une requête : les littéraux et paramètres deviennent "?"
+
+    Args:
+        statement (str): Requête SQL
+
+    Returns:
+        tuple: (empreinte courte, texte normalisé sans valeurs)
+    """
+    normalized = _WHITESPACE.sub(' ', statement or '').strip()
+    normalized = _STRING_LITERAL.sub('?', normalized)
+    normalized = _NAMED_PARAMETER.sub('?', normalized)
+    normalized = _NUMBER_LITERAL.sub('?', normalized)
+    normalized = _VALUES_ROWS.sub('(?)', _EXPANDED_IN.sub('(?)', normalized))
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:16], normalized
+
+def current_route() -> Optional[str]:
+    """
+    Origine de la requête SQL : route Flask, sinon span de traitement actif (tâche de fond)
+
+    Returns:
+        str: "GET /api/..." ou "span:<nom>", None hors requête et hors span
+    """
+    try:
+        from flask import has_request_context, request
+        if has_request_context():
+            rule = request.url_rule.rule if request.url_rule is not None else request.path
+            return f"{request.method} {rule}"
+    except Exception:
+        pass
+    from src.services.tracing import tracer
+    span = tracer.current_span()
+    return f"span:{span.name}" if span is not None else None
+
+class QueryShapes:
+    """Requêtes exécutées par le worker, regroupées par empreinte : appels, durées, lignes et requêtes lentes"""
+
+    def __init__(self, max_shapes: int = None, slow_ms: float = None, slow_log_size: int = None):
+        """
+        Initialise le relevé
+
+        Args:
+            max_shapes (int): Nombre d'empreintes distinctes conservées (DB_QUERY_SHAPES_MAX)
+            slow_ms (float): Seuil de capture des requêtes lentes en millisecondes (DB_SLOW_QUERY_MS)
+            slow_log_size (int): Requêtes lentes conservées (DB_SLOW_QUERY_LOG_SIZE)
+        """
+        self.max_shapes = max_shapes if max_shapes is not None else int(os.getenv('DB_QUERY_SHAPES_MAX', '300'))
+        self.slow_ms = slow_ms if slow_ms is not None else float(os.getenv('DB_SLOW_QUERY_MS', '200'))
+        self.dropped = 0
+        self._shapes = {}
+        self._slow = deque(maxlen=slow_log_size if slow_log_size is not None else
+                           int(os.getenv('DB_SLOW_QUERY_LOG_SIZE', '100')))
+        # Texte brut -> empreinte : SQLAlchemy réutilise les mêmes chaînes, la normalisation n'est faite qu'une fois
+        self._fingerprints = {}
+        self._lock = threading.Lock()
+
+    def _fingerprint(self, statement: str) -> Tuple[str, str]:
+        cached = self._fingerprints.get(statement)
+        if cached is None:
+            if len(self._fingerprints) >= self.max_shapes * 4:
+                self._fingerprints.clear()
+            cached = self._fingerprints[statement] = fingerprint_sql(statement)
+        return cached
+
+    def record(self, statement: str, parameters, seconds: float, executemany: bool = False, rows: int = -1):
+        """
+        Compte une exécution dans le groupe de son empreinte
+
+        Args:
+            statement (str): Requête SQL paramétrée
+            parameters: Paramètres de l'exécution (conservés en mémoire pour EXPLAIN, jamais exportés)
+            seconds (float): Durée d'exécution
+            executemany (bool): Exécution par lot
+            rows (int): Lignes affectées ou renvoyées selon le pilote (-1 si inconnu)
+        """
+        key, normalized = self._fingerprint(statement)
+        duration_ms = seconds * 1000
+        slow = duration_ms >= self.slow_ms
+        route = current_route() if slow else None
+
+        with self._lock:
+            shape = self._shapes.get(key)
+            if shape is None:
+                # Requêtes construites avec des valeurs littérales variables : le nombre de formes reste borné
+                if len(self._shapes) >= self.max_shapes:
+                    self.dropped += 1
+                    return
+                shape = self._shapes[key] = {
+                    'fingerprint': key,
+                    'normalized': normalized,
+                    'sql': normalize_sql(statement),
+                    'operation': statement_operation(statement),
+                    'count': 0,
+                    'total_seconds': 0.0,
+                    'max_seconds': 0.0,
+                    'rows': 0,
+                    'slow_count': 0,
+                    'histogram': LatencyHistogram(),
+                    'parameters': None
+                }
+            shape['count'] += 1
+            shape['total_seconds'] += seconds
+            if seconds > shape['max_seconds']:
+                shape['max_seconds'] = seconds
+            if rows > 0:
+                shape['rows'] += rows
+            shape['histogram'].record(duration_ms)
+            # Dernier texte exécutable et ses paramètres, toujours ensemble (pour EXPLAIN)
+            if not executemany and isinstance(parameters, (tuple, list)):
+                shape['sql'] = normalize_sql(statement)
+                shape['parameters'] = tuple(parameters)
+            if slow:
+                shape['slow_count'] += 1
+                self._slow.append({
+                    'timestamp': datetime.now().isoformat(),
+                    'fingerprint': key,
+                    'sql': normalized[:1000],
+                    'duration_ms': round(duration_ms, 3),
+                    'rows': rows if rows >= 0 else None,
+                    'route': route
+                })
+
+    def shapes(self, operations=('SELECT', 'UPDATE', 'DELETE'), min_calls: int = 1) -> list:
+        """
+        Formes relevées, de la plus coûteuse (temps cumulé) à la moins coûteuse
+
+        Args:
+            operations (iterable): Opérations retenues
+            min_calls (int): Nombre minimal d'exécutions
+
+        Returns:
+            list: Copies des formes (sql, operation, count, total_seconds, max_seconds, parameters)
+        """
+        with self._lock:
+            selected = [{key: value for key, value in shape.items() if key != 'histogram'}
+                        for shape in self._shapes.values()
+                        if shape['operation'] in operations and shape['count'] >= min_calls]
+        return sorted(selected, key=lambda shape: shape['total_seconds'], reverse=True)
+
+    def export(self, limit: int = None) -> list:
+        """
+        Empreintes JSON-sérialisables, sans paramètres ni valeurs (partage entre workers)
+
+        Args:
+            limit (int): Nombre d'empreintes (les plus coûteuses)
+
+        Returns:
+            list: Empreintes (fingerprint, sql normalisé, compteurs, histogramme)
+        """
+        with self._lock:
+            exported = [{
+                'fingerprint': shape['fingerprint'],
+                'sql': shape['normalized'][:1000],
+                'operation': shape['operation'],
+                'count': shape['count'],
+                'total_ms': shape['total_seconds'] * 1000,
+                'max_ms': shape['max_seconds'] * 1000,
+                'rows': shape['rows'],
+                'slow_count': shape['slow_count'],
+                'histogram': shape['histogram'].to_dict()
+            } for shape in self._shapes.values()]
+        exported.sort(key=lambda shape: shape['total_ms'], reverse=True)
+        return exported[:limit]
+
+    def slow_queries(self, limit: int = None) -> list:
+        """Requêtes lentes capturées, de la plus récente à la plus ancienne"""
+        with self._lock:
+            return list(reversed(self._slow))[:limit]
+
+    @staticmethod
+    def merge(exports, slow_lists=(), limit: int = 20, sort: str = 'total') -> Dict:
+        """
+        Fusionne les relevés de plusieurs workers (même empreinte = même requête)
+
+        Args:
+            exports (iterable): Listes produites par export()
+            slow_lists (iterable): Listes produites par slow_queries()
+            limit (int): Nombre de requêtes renvoyées
+            sort (str): Classement : total, p95, count ou rows
+
+        Returns:
+            dict: {'queries': [...], 'slow_queries': [...]}
+        """
+        merged = {}
+        for shapes in exports:
+            for shape in shapes or []:
+                histogram = LatencyHistogram.from_dict(shape['histogram'])
+                entry = merged.get(shape['fingerprint'])
+                if entry is None:
+                    merged[shape['fingerprint']] = {**shape, 'histogram': histogram}
+                    continue
+                for field in ('count', 'total_ms', 'rows', 'slow_count'):
+                    entry[field] += shape[field]
+                entry['max_ms'] = max(entry['max_ms'], shape['max_ms'])
+                entry['histogram'].merge(histogram)
+
+        queries = []
+        for entry in merged.values():
+            histogram = entry.pop('histogram')
+            queries.append({
+                **entry,
+                'total_ms': round(entry['total_ms'], 3),
+                'max_ms': round(entry['max_ms'], 3),
+                'mean_ms': round(entry['total_ms'] / entry['count'], 3) if entry['count'] else 0.0,
+                'p50_ms': histogram.percentile(50),
+                'p95_ms': histogram.percentile(95),
+                'p99_ms': histogram.percentile(99),
+                'rows_per_call': round(entry['rows'] / entry['count'], 2) if entry['count'] else 0.0
+            })
+        sort_key = {'total': 'total_ms', 'p95': 'p95_ms', 'count': 'count', 'rows': 'rows'}.get(sort, 'total_ms')
+        queries.sort(key=lambda query: query[sort_key] or 0, reverse=True)
+
+        slow = sorted((query for slow_list in slow_lists for query in slow_list or []),
+                      key=lambda query: query['timestamp'], reverse=True)
+        return {'queries': queries[:limit], 'slow_queries': slow[:limit]}
+
+    def reset(self):
+        """Oublie les formes relevées et les requêtes lentes"""
+        with self._lock:
+            self._shapes = {}
+            self._slow.clear()
+            self.dropped = 0
+
+# Instance globale du relevé des formes de requêtes
+query_shapes = QueryShapes()
+
+def statement_operation(statement: str) -> str:
+    """
+    Extrait le type d'opération d'une requête SQL
+
+    Args:
+        statement (str): Requête SQL
+
+    Returns:
+        str: SELECT, INSERT, ... ou OTHER
+    """
+    keyword = statement.lstrip().split(None, 1)[0].upper() if statement and statement.strip() else ''
+    return keyword if keyword in KNOWN_OPERATIONS else 'OTHER'
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    """Empile l'heure de début (les requêtes peuvent être imbriquées)"""
+    conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    """Enregistre la durée de la requête"""
+    start_times = conn.info.get('query_start_time')
+    if not start_times:
+        return
+    elapsed = time.perf_counter() - start_times.pop()
+    db_query_duration.observe(elapsed, operation=statement_operation(statement))
+    query_shapes.record(statement, parameters, elapsed, executemany, getattr(cursor, 'rowcount', -1))
+
+def _handle_error(exception_context):
+    """Dépile l'heure de début d'une requête en erreur"""
+    conn = exception_context.connection
+    if conn is not None:
+        start_times = conn.info.get('query_start_time')
+        if start_times:
+            start_times.pop()
+    db_query_errors.inc(operation=statement_operation(exception_context.statement or ''))
+
+def _pool_delta(field: str, delta: int):
+    """Met à jour un compteur de connexions"""
+    with _pool_lock:
+        _pool_counts[field] = max(0, _pool_counts[field] + delta)
+
+def _on_pool_connect(dbapi_connection, connection_record):
+    _pool_delta('open', 1)
+
+def _on_pool_close(dbapi_connection, connection_record):
+    _pool_delta('open', -1)
+
+def _on_pool_detach(dbapi_connection, connection_record):
+    # Une connexion détachée n'appartient plus au pool
+    _pool_delta('open', -1)
+
+def _on_pool_checkout(dbapi_connection, connection_record, connection_proxy):
+    _pool_delta('checked_out', 1)
+
+def _on_pool_checkin(dbapi_connection, connection_record):
+    _pool_delta('checked_out', -1)
+
+def instrument_engines():
+    """Active l'instrumentation pour tous les moteurs SQLAlchemy (idempotent)"""
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(Engine, 'handle_error', _handle_error)
+    if not event.contains(Pool, 'connect', _on_pool_connect):
+        event.listen(Pool, 'connect', _on_pool_connect)
+        event.listen(Pool, 'close', _on_pool_close)
+        event.listen(Pool, 'detach', _on_pool_detach)
+        event.listen(Pool, 'checkout', _on_pool_checkout)
+        event.listen(Pool, 'checkin', _on_pool_checkin)
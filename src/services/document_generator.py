@@ -12,8 +12,14 @@ from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, Tabl
 from reportlab.lib import colors
 import logging
 
+from src.services.metrics_registry import metrics_registry
+from src.services.tracing import tracer
+
 logger = logging.getLogger(__name__)
 
+render_duration = metrics_registry.histogram(
+    'render_duration_seconds', 'Durée de génération des documents', ['document'])
+
 class DocumentGenerator:
     def __init__(self, output_dir: str = None):
         if output_dir is None:
@@ -24,6 +30,8 @@ class DocumentGenerator:
             self.output_dir = output_dir
         os.makedirs(self.output_dir, exist_ok=True)
     
+    @render_duration.time(document='business_plan_excel')
+    @tracer.span('render.excel')
     def generate_excel_business_plan(self, business_plan_data: Dict[str, Any], filename: str = None) -> str:
         """Génère un fichier Excel complet du business plan."""
         if not filename:
@@ -81,6 +89,8 @@ class DocumentGenerator:
             logger.error(f"Erreur génération Excel: {str(e)}")
             raise
     
+    @render_duration.time(document='itinerary_pdf')
+    @tracer.span('render.pdf')
     def generate_pdf_business_plan(self, business_plan_data: Dict[str, Any], filename: str = None) -> str:
         """Génère un fichier PDF de l'itinéraire technique."""
         if not filename:
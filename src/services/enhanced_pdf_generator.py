@@ -8,6 +8,7 @@ from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch, cm
 from reportlab.lib import colors
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, PageBreak
+from reportlab.platypus import Image as PDFImage
 from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
 from reportlab.pdfgen import canvas
 from datetime import datetime, timedelta
@@ -17,6 +18,11 @@ import base64
 from PIL import Image
 import io
 
+from src.services.metrics_registry import metrics_registry
+
+render_duration = metrics_registry.histogram(
+    'render_duration_seconds', 'Durée de génération des documents', ['document'])
+
 class EnhancedPDFGenerator:
     """Générateur de PDF enrichi avec météo et plan d'action"""
     
@@ -65,6 +71,7 @@ class EnhancedPDFGenerator:
             textColor=colors.darkgreen
         ))
     
+    @render_duration.time(document='business_plan_pdf')
     def generate_business_plan_pdf(self, user_data: Dict, weather_data: Dict = None, 
                                   business_data: Dict = None, output_path: str = None) -> str:
         """
@@ -124,6 +131,7 @@ class EnhancedPDFGenerator:
         
         return output_path
     
+    @render_duration.time(document='diagnosis_pdf')
     def generate_diagnosis_pdf(self, diagnosis_data: Dict, output_path: str = None) -> str:
         """
         Génère un PDF de diagnostic complet avec photo
@@ -155,7 +163,7 @@ class EnhancedPDFGenerator:
         story.append(PageBreak())
         
         # Photo et analyse
-        if diagnosis_data.get('photo_data'):
+        if diagnosis_data.get('photo_hash') or diagnosis_data.get('photo_data'):
             story.extend(self._create_photo_analysis_section(diagnosis_data))
             story.append(PageBreak())
         
@@ -628,6 +636,15 @@ class EnhancedPDFGenerator:
         elements.append(Paragraph(photo_note, self.styles['Normal']))
         elements.append(Spacer(1, 20))
         
+        # Miniature de la photo (lue depuis le stockage de fichiers, sans passer par base64)
+        photo_path = diagnosis_data.get('photo_path')
+        if photo_path and os.path.exists(photo_path):
+            with Image.open(photo_path) as photo:
+                width, height = photo.size
+            scale = min(12 * cm / width, 9 * cm / height, 1)
+            elements.append(PDFImage(photo_path, width=width * scale, height=height * scale))
+            elements.append(Spacer(1, 20))
+        
         # Détails techniques de l'analyse
         diagnosis = diagnosis_data.get('diagnosis', {})
         
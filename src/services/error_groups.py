@@ -0,0 +1,238 @@
+"""
+Regroupement des erreurs par empreinte pour AgroBizChat
+Type, message normalisé et site d'appel : une erreur répétée devient un compteur,
+les autres groupes restent visibles pendant un incident
+"""
+
+import os
+import re
+import sys
+import time
+import hashlib
+import threading
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+# Parties variables retirées du message avant le calcul de l'empreinte (ordre significatif)
+_NORMALIZERS = (
+    (re.compile(r'https?://\S+'), '<url>'),
+    (re.compile(r'[\w.+-]+@[\w-]+\.[\w.-]+'), '<email>'),
+    (re.compile(r'(?:whatsapp:)?\+\d{6,15}'), '<phone>'),
+    (re.compile(r'\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b'), '<uuid>'),
+    # Identifiants Twilio (SM..., MM..., AC...) et empreintes hexadécimales
+    (re.compile(r'\b[A-Z]{2}[0-9a-f]{32}\b'), '<sid>'),
+    (re.compile(r'\b[0-9a-fA-F]{16,}\b'), '<hex>'),
+    (re.compile(r"'[^']*'|\"[^\"]*\""), '<str>'),
+    (re.compile(r'\b\d+\.\d+\b'), '<n>'),
+    # Les nombres courts restent : codes d'erreur (Twilio 63038, HTTP 429)
+    (re.compile(r'\b\d{6,}\b'), '<n>'),
+)
+_MAX_MESSAGE_LENGTH = 500
+
+def normalize_message(message: str) -> str:
+    """
+    Retire d'un message les valeurs qui changent d'une occurrence à l'autre
+
+    Args:
+        message (str): Message d'erreur brut
+
+    Returns:
+        str: Message normalisé (identifiants, numéros, URLs remplacés)
+    """
+    normalized = str(message or '')[:_MAX_MESSAGE_LENGTH]
+    for pattern, replacement in _NORMALIZERS:
+        normalized = pattern.sub(replacement, normalized)
+    return ' '.join(normalized.split())
+
+def call_site(depth: int = 2) -> str:
+    """
+    Site d'appel "module.py:fonction" (sans numéro de ligne, stable entre déploiements)
+
+    Args:
+        depth (int): Nombre de cadres à remonter depuis l'appelant de call_site()
+
+    Returns:
+        str: Site d'appel relatif au projet
+    """
+    try:
+        frame = sys._getframe(depth)
+    except ValueError:
+        return 'unknown'
+    filename = frame.f_code.co_filename
+    position = filename.rfind(os.sep + 'src' + os.sep)
+    if position != -1:
+        filename = filename[position + 1:]
+    else:
+        filename = os.path.basename(filename)
+    return f"{filename}:{frame.f_code.co_name}"
+
+def fingerprint(error_type: str, normalized_message: str, site: str) -> str:
+    """Empreinte courte d'un groupe d'erreurs"""
+    return hashlib.sha1(f"{error_type}\x00{normalized_message}\x00{site}".encode('utf-8')).hexdigest()[:16]
+
+def _plain_details(details: Optional[Dict]) -> Dict:
+    """Détails JSON-sérialisables (valeurs complexes converties en chaînes)"""
+    return {
+        str(key): value if isinstance(value, (str, int, float, bool, type(None))) else str(value)
+        for key, value in (details or {}).items()
+    }
+
+class ErrorGroups:
+    """Groupes d'erreurs en LRU bornée : compteur, première/dernière occurrence et échantillons"""
+
+    def __init__(self, max_groups: int = None, max_samples: int = None, log_interval: float = None):
+        """
+        Initialise les groupes
+
+        Args:
+            max_groups (int): Nombre de groupes conservés (ERROR_GROUPS_MAX)
+            max_samples (int): Échantillons conservés par groupe (ERROR_GROUP_SAMPLES)
+            log_interval (float): Secondes minimales entre deux journalisations d'un groupe (ERROR_LOG_INTERVAL)
+        """
+        self.max_groups = max_groups if max_groups is not None else int(os.getenv('ERROR_GROUPS_MAX', '200'))
+        self.max_samples = max_samples if max_samples is not None else int(os.getenv('ERROR_GROUP_SAMPLES', '3'))
+        self.log_interval = log_interval if log_interval is not None else \
+            float(os.getenv('ERROR_LOG_INTERVAL', '60'))
+        self._groups = OrderedDict()
+        self._lock = threading.Lock()
+        self.total = 0
+        self.evicted = 0
+        self.types = {}
+
+    def record(self, error_type: str, message: str, details: Dict = None, site: str = None,
+               now: float = None) -> Tuple[Dict, int]:
+        """
+        Ajoute une occurrence à son groupe (O(1))
+
+        Args:
+            error_type (str): Type d'erreur
+            message (str): Message brut
+            details (dict): Contexte (conservé dans les échantillons)
+            site (str): Site d'appel (défaut: appelant de record())
+            now (float): Horodatage (défaut: time.time())
+
+        Returns:
+            tuple: (groupe, occurrences à journaliser : 0 si la journalisation est limitée)
+        """
+        now = now if now is not None else time.time()
+        site = site or call_site()
+        normalized = normalize_message(message)
+        key = fingerprint(error_type, normalized, site)
+        minute = int(now // 60)
+
+        with self._lock:
+            self.total += 1
+            self.types[error_type] = self.types.get(error_type, 0) + 1
+
+            group = self._groups.get(key)
+            if group is None:
+                group = self._groups[key] = {
+                    'fingerprint': key,
+                    'type': error_type,
+                    'message': normalized,
+                    'site': site,
+                    'count': 0,
+                    'first_seen': now,
+                    'last_seen': now,
+                    'samples': deque(maxlen=self.max_samples),
+                    # Occurrences par minute sur la dernière heure
+                    'minutes': deque(maxlen=60),
+                    'logged_at': 0.0,
+                    'suppressed': 0
+                }
+                if len(self._groups) > self.max_groups:
+                    self._groups.popitem(last=False)
+                    self.evicted += 1
+            else:
+                self._groups.move_to_end(key)
+
+            group['count'] += 1
+            group['last_seen'] = now
+            group['samples'].append({
+                'timestamp': datetime.fromtimestamp(now).isoformat(),
+                'message': str(message)[:_MAX_MESSAGE_LENGTH],
+                'details': _plain_details(details)
+            })
+            if group['minutes'] and group['minutes'][-1][0] == minute:
+                group['minutes'][-1][1] += 1
+            else:
+                group['minutes'].append([minute, 1])
+
+            # Première occurrence puis au plus une ligne par intervalle, avec le nombre d'occurrences
+            if now - group['logged_at'] >= self.log_interval:
+                to_log = group['suppressed'] + 1
+                group['logged_at'] = now
+                group['suppressed'] = 0
+            else:
+                to_log = 0
+                group['suppressed'] += 1
+
+        return group, to_log
+
+    def last_hour(self, now: float = None) -> int:
+        """Occurrences de la dernière heure, tous groupes confondus"""
+        oldest = int((now if now is not None else time.time()) // 60) - 59
+        with self._lock:
+            return sum(count for group in self._groups.values()
+                       for minute, count in group['minutes'] if minute >= oldest)
+
+    def groups(self, limit: int = None, now: float = None) -> List[Dict]:
+        """
+        Groupes sérialisables, du plus récemment vu au plus ancien
+
+        Args:
+            limit (int): Nombre maximal de groupes
+            now (float): Horodatage de référence pour last_hour
+
+        Returns:
+            list: Groupes (fingerprint, type, message, site, count, first/last seen, samples)
+        """
+        oldest = int((now if now is not None else time.time()) // 60) - 59
+        with self._lock:
+            selected = list(reversed(self._groups.values()))[:limit]
+            return [{
+                'fingerprint': group['fingerprint'],
+                'type': group['type'],
+                'message': group['message'],
+                'site': group['site'],
+                'count': group['count'],
+                'last_hour': sum(count for minute, count in group['minutes'] if minute >= oldest),
+                'first_seen': datetime.fromtimestamp(group['first_seen']).isoformat(),
+                'last_seen': datetime.fromtimestamp(group['last_seen']).isoformat(),
+                'samples': list(group['samples'])
+            } for group in selected]
+
+    def drop_before(self, timestamp: float):
+        """Oublie les groupes sans occurrence depuis un horodatage"""
+        with self._lock:
+            for key in [key for key, group in self._groups.items() if group['last_seen'] <= timestamp]:
+                del self._groups[key]
+
+    @staticmethod
+    def merge(group_lists) -> List[Dict]:
+        """
+        Fusionne les groupes publiés par plusieurs workers (même empreinte = même groupe)
+
+        Args:
+            group_lists (iterable): Listes produites par groups()
+
+        Returns:
+            list: Groupes fusionnés, du plus fréquent au moins fréquent
+        """
+        merged = {}
+        for groups in group_lists:
+            for group in groups or []:
+                entry = merged.get(group['fingerprint'])
+                if entry is None:
+                    merged[group['fingerprint']] = {**group, 'samples': list(group['samples'])}
+                    continue
+                entry['count'] += group['count']
+                entry['last_hour'] = entry.get('last_hour', 0) + group.get('last_hour', 0)
+                entry['first_seen'] = min(entry['first_seen'], group['first_seen'])
+                entry['last_seen'] = max(entry['last_seen'], group['last_seen'])
+                entry['samples'].extend(group['samples'])
+
+        for entry in merged.values():
+            entry['samples'] = sorted(entry['samples'], key=lambda sample: sample['timestamp'])[-5:]
+        return sorted(merged.values(), key=lambda entry: (entry['count'], entry['last_seen']), reverse=True)
@@ -8,9 +8,25 @@ import PyPDF2
 from docx import Document
 import pandas as pd
 from io import BytesIO
+import threading
+from collections import OrderedDict
+import time
+
+from src.services.metrics_registry import metrics_registry
+from src.services.tracing import tracer
 
 logger = logging.getLogger(__name__)
 
+# Cache des textes extraits, partagé par toutes les instances du processus.
+# La clé inclut mtime et taille : un template remplacé est ré-extrait.
+_extraction_cache = OrderedDict()
+_extraction_cache_lock = threading.Lock()
+EXTRACTION_CACHE_SIZE = int(os.getenv('EXTRACTION_CACHE_SIZE', '64'))
+
+gemini_calls = metrics_registry.counter('gemini_calls', 'Appels à l\'API Gemini', ['outcome'])
+gemini_call_duration = metrics_registry.histogram(
+    'gemini_call_duration_seconds', 'Durée des appels à l\'API Gemini', ['outcome'])
+
 class GeminiAnalysisService:
     def __init__(self):
         # Configuration de Gemini
@@ -92,6 +108,7 @@ class GeminiAnalysisService:
             logger.error(f"Erreur lors de la résolution du chemin {file_path}: {str(e)}")
             return file_path
         
+    @tracer.span('template.extract')
     def extract_text_from_file(self, file_path: str, file_type: str) -> str:
         """Extrait le texte d'un fichier selon son type."""
         try:
@@ -103,17 +120,31 @@ class GeminiAnalysisService:
                 logger.error(f"Fichier non trouvé: {resolved_path}")
                 return ""
             
+            file_stat = os.stat(resolved_path)
+            cache_key = (resolved_path, file_type.lower(), file_stat.st_mtime_ns, file_stat.st_size)
+            with _extraction_cache_lock:
+                if cache_key in _extraction_cache:
+                    _extraction_cache.move_to_end(cache_key)
+                    return _extraction_cache[cache_key]
+            
             if file_type.lower() == 'pdf':
-                return self._extract_from_pdf(resolved_path)
+                text = self._extract_from_pdf(resolved_path)
             elif file_type.lower() in ['doc', 'docx']:
-                return self._extract_from_docx(resolved_path)
+                text = self._extract_from_docx(resolved_path)
             elif file_type.lower() == 'txt':
-                return self._extract_from_txt(resolved_path)
+                text = self._extract_from_txt(resolved_path)
             elif file_type.lower() in ['xls', 'xlsx']:
-                return self._extract_from_excel(resolved_path)
+                text = self._extract_from_excel(resolved_path)
             else:
                 logger.warning(f"Type de fichier non supporté: {file_type}")
                 return ""
+            
+            with _extraction_cache_lock:
+                _extraction_cache[cache_key] = text
+                _extraction_cache.move_to_end(cache_key)
+                while len(_extraction_cache) > EXTRACTION_CACHE_SIZE:
+                    _extraction_cache.popitem(last=False)
+            return text
         except Exception as e:
             logger.error(f"Erreur lors de l'extraction de {file_path}: {str(e)}")
             return ""
@@ -294,7 +325,16 @@ class GeminiAnalysisService:
                 # Mode normal avec Gemini
                 logger.info("🤖 Mode GEMINI - Analyse avec IA des templates")
                 prompt = self._create_analysis_prompt(documents_content, user_request)
-                response = self.model.generate_content(prompt)
+                start_time = time.perf_counter()
+                try:
+                    with tracer.span('gemini.generate_content', prompt_chars=len(prompt)):
+                        response = self.model.generate_content(prompt)
+                except Exception:
+                    gemini_calls.inc(outcome='error')
+                    gemini_call_duration.observe(time.perf_counter() - start_time, outcome='error')
+                    raise
+                gemini_calls.inc(outcome='success')
+                gemini_call_duration.observe(time.perf_counter() - start_time, outcome='success')
                 business_plan_data = json.loads(response.text)
             
             logger.info(f"✅ Business plan généré avec succès (mode: {'DEMO' if self.demo_mode else 'GEMINI'})")
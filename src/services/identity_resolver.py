@@ -0,0 +1,236 @@
+"""
+Résolution de l'identité des messages entrants pour AgroBizChat
+(plateforme, identifiant) -> (user_id, conversation_id) par upsert natif (INSERT ... ON CONFLICT),
+dans la transaction du webhook, avec un cache court par worker
+"""
+
+import os
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import event, inspect, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from src.models.database import db, User, Conversation
+from src.services.stat_counters import stat_counters
+from src.services.tracing import tracer
+
+# Index unique partiel (une conversation active par session), cible de l'upsert des conversations
+ACTIVE_SESSION_INDEX = 'uq_conversations_active_session'
+# Champs de profil qu'un message entrant peut renseigner
+PROFILE_FIELDS = ('username', 'first_name', 'last_name', 'phone_number', 'language_code')
+
+class IdentityResolver:
+    """Upsert utilisateur + conversation en une transaction, identités récentes gardées en mémoire"""
+
+    def __init__(self, ttl: float = None, max_entries: int = None):
+        """
+        Initialise le résolveur
+
+        Args:
+            ttl (float): Durée de vie d'une identité en cache, en secondes (IDENTITY_CACHE_TTL)
+            max_entries (int): Identités conservées par worker (IDENTITY_CACHE_SIZE)
+        """
+        self.ttl = ttl if ttl is not None else float(os.getenv('IDENTITY_CACHE_TTL', '60'))
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv('IDENTITY_CACHE_SIZE', '10000'))
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        # URL du moteur -> index unique partiel présent (vérifié une fois par moteur)
+        self._upsert_support = {}
+        self.hits = 0
+        self.misses = 0
+
+        if not event.contains(Session, 'after_commit', _promote_pending):
+            event.listen(Session, 'after_commit', _promote_pending)
+            event.listen(Session, 'after_soft_rollback', _discard_pending)
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self.clear)
+
+    def resolve(self, platform: str, platform_user_id: str, session_id: str = None,
+                session=None, **profile) -> Tuple[int, int]:
+        """
+        Identifiants de l'utilisateur et de sa conversation active, créés au besoin
+
+        Les écritures ont lieu dans la transaction en cours, sans commit : le webhook
+        enregistre le message et valide le tout en une fois. Une identité en cache
+        n'écrit rien (last_interaction et updated_at sont alors précis à ttl près).
+
+        Args:
+            platform (str): Plateforme (whatsapp, telegram, messenger)
+            platform_user_id (str): Identifiant sur la plateforme
+            session_id (str): Session de la conversation (défaut: platform_user_id)
+            session: Session SQLAlchemy (défaut: db.session)
+            **profile: Champs de profil à mettre à jour (valeurs vides ignorées)
+
+        Returns:
+            tuple: (user_id, conversation_id)
+        """
+        if not platform_user_id:
+            raise ValueError("platform_user_id cannot be None")
+        session = session if session is not None else db.session
+        session_id = str(session_id or platform_user_id)
+        key = (platform, str(platform_user_id), session_id)
+
+        cached = self._get(key)
+        if cached is not None:
+            return cached
+
+        with tracer.span('db.resolve_identity', platform=platform):
+            now = datetime.utcnow()
+            profile = {field: value for field, value in profile.items() if field in PROFILE_FIELDS and value}
+            if self._supports_upsert(session):
+                user_id = self._upsert_user(session, platform, str(platform_user_id), profile, now)
+                conversation_id = self._upsert_conversation(session, user_id, session_id, now)
+            else:
+                user_id = self._get_or_create_user(session, platform, str(platform_user_id), profile, now)
+                conversation_id = self._get_or_create_conversation(session, user_id, session_id, now)
+
+        # Mis en cache au commit seulement : une transaction annulée ne laisse pas d'identifiant fantôme
+        session.info.setdefault('pending_identities', []).append((self, key, (user_id, conversation_id)))
+        return user_id, conversation_id
+
+    def _get(self, key: Tuple) -> Optional[Tuple[int, int]]:
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None or entry[1] <= time.monotonic():
+                self.misses += 1
+                return None
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def _store(self, key: Tuple, identity: Tuple[int, int]):
+        with self._lock:
+            self._cache[key] = (identity, time.monotonic() + self.ttl)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+    def forget(self, platform: str, platform_user_id: str):
+        """Retire du cache les identités d'un utilisateur (suppression, fusion de comptes)"""
+        with self._lock:
+            for key in [key for key in self._cache if key[0] == platform and key[1] == str(platform_user_id)]:
+                del self._cache[key]
+
+    def clear(self):
+        """Vide le cache (les identités du processus parent ne sont pas celles d'un worker forké)"""
+        with self._lock:
+            self._cache.clear()
+            self._upsert_support.clear()
+
+    def get_stats(self) -> Dict:
+        """Taille du cache et taux de succès"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._cache),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total * 100, 2) if total else 0.0
+            }
+
+    def _supports_upsert(self, session) -> bool:
+        """INSERT ... ON CONFLICT ... RETURNING utilisable : PostgreSQL ou SQLite 3.35+, index partiel présent"""
+        bind = session.get_bind()
+        url = str(bind.url)
+        if url not in self._upsert_support:
+            dialect = bind.dialect.name
+            supported = dialect == 'postgresql' or (dialect == 'sqlite' and sqlite3.sqlite_version_info >= (3, 35))
+            if supported:
+                indexes = inspect(bind).get_indexes(Conversation.__tablename__)
+                supported = any(index['name'] == ACTIVE_SESSION_INDEX for index in indexes)
+                if not supported:
+                    print(f"⚠️ Index {ACTIVE_SESSION_INDEX} absent (flask db upgrade) : "
+                          f"résolution d'identité par lecture puis insertion")
+            self._upsert_support[url] = supported
+        return self._upsert_support[url]
+
+    @staticmethod
+    def _insert(session, table):
+        """INSERT propre au dialecte (clause ON CONFLICT)"""
+        if session.get_bind().dialect.name == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        return insert(table)
+
+    @tracer.span('db.upsert_user')
+    def _upsert_user(self, session, platform: str, platform_user_id: str, profile: Dict, now: datetime) -> int:
+        statement = self._insert(session, User.__table__).values(
+            platform=platform, platform_user_id=platform_user_id, created_at=now, last_interaction=now, **profile
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=['platform', 'platform_user_id'],
+            set_={'last_interaction': now, **{field: statement.excluded[field] for field in profile}}
+        ).returning(User.__table__.c.id, User.__table__.c.created_at)
+        user_id, created_at = session.execute(statement).one()
+        if created_at == now:
+            # Ligne insérée (une mise à jour conserve created_at)
+            stat_counters.increment(session, {'total_users': 1, 'active_users': 1})
+        return user_id
+
+    @tracer.span('db.upsert_conversation')
+    def _upsert_conversation(self, session, user_id: int, session_id: str, now: datetime) -> int:
+        table = Conversation.__table__
+        statement = self._insert(session, table).values(
+            user_id=user_id, session_id=session_id, status='active', created_at=now, updated_at=now
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=['user_id', 'session_id'],
+            index_where=table.c.status == 'active',
+            set_={'updated_at': now}
+        ).returning(table.c.id, table.c.created_at)
+        conversation_id, created_at = session.execute(statement).one()
+        if created_at == now:
+            stat_counters.increment(session, {'total_conversations': 1, 'active_conversations': 1})
+        return conversation_id
+
+    @tracer.span('db.get_or_create_user')
+    def _get_or_create_user(self, session, platform: str, platform_user_id: str, profile: Dict,
+                            now: datetime) -> int:
+        """Repli sans upsert natif : lecture, puis insertion dans un point de sauvegarde"""
+        lookup = select(User).filter_by(platform=platform, platform_user_id=platform_user_id)
+        user = session.execute(lookup).scalar_one_or_none()
+        if user is None:
+            try:
+                with session.begin_nested():
+                    user = User(platform=platform, platform_user_id=platform_user_id, **profile)
+                    session.add(user)
+            except IntegrityError:
+                # Créé entre-temps par un autre worker
+                user = session.execute(lookup).scalar_one()
+        for field, value in profile.items():
+            setattr(user, field, value)
+        user.last_interaction = now
+        session.flush()
+        return user.id
+
+    @tracer.span('db.get_or_create_conversation')
+    def _get_or_create_conversation(self, session, user_id: int, session_id: str, now: datetime) -> int:
+        conversation = session.execute(
+            select(Conversation).filter_by(user_id=user_id, session_id=session_id, status='active').limit(1)
+        ).scalar_one_or_none()
+        if conversation is None:
+            conversation = Conversation(user_id=user_id, session_id=session_id, status='active',
+                                        created_at=now, updated_at=now)
+            session.add(conversation)
+        else:
+            conversation.updated_at = now
+        session.flush()
+        return conversation.id
+
+def _promote_pending(session):
+    """Après commit : les identités résolues dans la transaction entrent en cache"""
+    for resolver, key, identity in session.info.pop('pending_identities', ()):
+        resolver._store(key, identity)
+
+def _discard_pending(session, previous_transaction):
+    session.info.pop('pending_identities', None)
+
+# Instance globale du résolveur d'identité
+identity_resolver = IdentityResolver()
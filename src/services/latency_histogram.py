@@ -0,0 +1,282 @@
+"""
+Histogrammes de latences à buckets logarithmiques pour AgroBizChat
+Percentiles en mémoire constante, fusionnables entre workers et par fenêtre glissante
+"""
+
+import math
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+# Ratio entre deux bornes consécutives : 2^(1/4) ≈ 19% d'erreur relative au pire
+BUCKET_RATIO = 2 ** 0.25
+# Plus petite latence distinguée (en millisecondes)
+MIN_LATENCY_MS = 0.01
+
+_LOG_RATIO = math.log(BUCKET_RATIO)
+
+class LatencyHistogram:
+    """Histogramme de latences (ms) à buckets logarithmiques creux"""
+
+    __slots__ = ('buckets', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    @staticmethod
+    def bucket_index(value_ms: float) -> int:
+        """
+        Calcule l'index du bucket d'une latence
+
+        Args:
+            value_ms (float): Latence en millisecondes
+
+        Returns:
+            int: Index du bucket (0 pour les valeurs <= MIN_LATENCY_MS)
+        """
+        if value_ms <= MIN_LATENCY_MS:
+            return 0
+        return int(math.ceil(math.log(value_ms / MIN_LATENCY_MS) / _LOG_RATIO))
+
+    @staticmethod
+    def bucket_upper_bound(index: int) -> float:
+        """Borne supérieure (ms) d'un bucket"""
+        return MIN_LATENCY_MS * BUCKET_RATIO ** index
+
+    def record(self, value_ms: float, count: int = 1):
+        """
+        Enregistre une latence
+
+        Args:
+            value_ms (float): Latence en millisecondes
+            count (int): Nombre d'occurrences
+        """
+        index = self.bucket_index(value_ms)
+        self.buckets[index] = self.buckets.get(index, 0) + count
+        self.count += count
+        self.total += value_ms * count
+        if value_ms > self.max:
+            self.max = value_ms
+
+    def merge(self, other: 'LatencyHistogram'):
+        """
+        Ajoute les observations d'un autre histogramme
+
+        Args:
+            other (LatencyHistogram): Histogramme à fusionner
+        """
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, percent: float) -> Optional[float]:
+        """
+        Estime un percentile
+
+        Args:
+            percent (float): Percentile entre 0 et 100
+
+        Returns:
+            float: Latence estimée en ms (borne supérieure du bucket), None si vide
+        """
+        if not self.count:
+            return None
+
+        rank = max(1, int(math.ceil(self.count * percent / 100.0)))
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                return min(self.bucket_upper_bound(index), self.max)
+        return self.max
+
+    def count_above(self, threshold_ms: float) -> int:
+        """
+        Nombre d'observations au-dessus d'un seuil
+
+        Le bucket contenant le seuil est compté comme conforme : le résultat est
+        exact à la largeur d'un bucket près (~19%).
+
+        Args:
+            threshold_ms (float): Seuil en millisecondes
+
+        Returns:
+            int: Observations strictement au-delà du bucket du seuil
+        """
+        threshold_index = self.bucket_index(threshold_ms)
+        return sum(count for index, count in self.buckets.items() if index > threshold_index)
+
+    def summary(self, percents: Iterable[float] = (50, 95, 99)) -> Dict:
+        """
+        Résumé lisible de l'histogramme
+
+        Args:
+            percents (iterable): Percentiles à calculer
+
+        Returns:
+            dict: count, avg, max et percentiles en ms
+        """
+        result = {
+            'count': self.count,
+            'avg_ms': round(self.total / self.count, 3) if self.count else None,
+            'max_ms': round(self.max, 3) if self.count else None
+        }
+        for percent in percents:
+            value = self.percentile(percent)
+            label = f"p{str(percent).replace('.', '')}"
+            result[f"{label}_ms"] = round(value, 3) if value is not None else None
+        return result
+
+    def to_dict(self) -> Dict:
+        """Sérialisation JSON (clés de buckets en chaînes)"""
+        return {
+            'buckets': {str(index): count for index, count in self.buckets.items()},
+            'count': self.count,
+            'total': self.total,
+            'max': self.max
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'LatencyHistogram':
+        """Reconstruit un histogramme depuis to_dict()"""
+        histogram = cls()
+        histogram.buckets = {int(index): count for index, count in (data.get('buckets') or {}).items()}
+        histogram.count = data.get('count', 0)
+        histogram.total = data.get('total', 0.0)
+        histogram.max = data.get('max', 0.0)
+        return histogram
+
+class SlidingWindowHistogram:
+    """Histogrammes par tranche de temps dans un anneau de taille fixe"""
+
+    DEFAULT_WINDOWS = (('1m', 60), ('5m', 300), ('15m', 900), ('1h', 3600))
+
+    def __init__(self, slot_seconds: int = 10, slots: int = 360):
+        """
+        Initialise l'anneau
+
+        Args:
+            slot_seconds (int): Durée d'une tranche en secondes
+            slots (int): Nombre de tranches (fenêtre maximale = slot_seconds * slots)
+        """
+        self.slot_seconds = slot_seconds
+        self.slots = slots
+        self._epochs = [-1] * slots
+        self._histograms = [None] * slots
+        self._errors = [0] * slots
+        # Totaux depuis le démarrage du processus
+        self.lifetime = LatencyHistogram()
+        self.lifetime_errors = 0
+
+    def _slot(self, now: float) -> int:
+        """Index de la tranche courante, réinitialisée si elle appartient à un tour précédent"""
+        epoch = int(now // self.slot_seconds)
+        index = epoch % self.slots
+        if self._epochs[index] != epoch:
+            self._epochs[index] = epoch
+            self._histograms[index] = LatencyHistogram()
+            self._errors[index] = 0
+        return index
+
+    def record(self, value_ms: float, error: bool = False, now: float = None):
+        """
+        Enregistre une latence dans la tranche courante (O(1))
+
+        Args:
+            value_ms (float): Latence en millisecondes
+            error (bool): L'appel a échoué
+            now (float): Horodatage (défaut: time.time())
+        """
+        index = self._slot(now if now is not None else time.time())
+        self._histograms[index].record(value_ms)
+        self.lifetime.record(value_ms)
+        if error:
+            self._errors[index] += 1
+            self.lifetime_errors += 1
+
+    def window(self, seconds: float, now: float = None) -> Tuple[LatencyHistogram, int]:
+        """
+        Fusionne les tranches couvrant les dernières secondes
+
+        Args:
+            seconds (float): Durée de la fenêtre
+            now (float): Horodatage (défaut: time.time())
+
+        Returns:
+            tuple: (histogramme fusionné, nombre d'erreurs)
+        """
+        now = now if now is not None else time.time()
+        current_epoch = int(now // self.slot_seconds)
+        oldest_epoch = current_epoch - max(1, int(math.ceil(seconds / self.slot_seconds))) + 1
+
+        merged = LatencyHistogram()
+        errors = 0
+        for index, epoch in enumerate(self._epochs):
+            if oldest_epoch <= epoch <= current_epoch and self._histograms[index] is not None:
+                merged.merge(self._histograms[index])
+                errors += self._errors[index]
+        return merged, errors
+
+    def export_windows(self, windows=None, now: float = None) -> Dict:
+        """
+        Histogrammes fusionnés par fenêtre, sérialisables (partage entre workers)
+
+        Les tranches sont parcourues une seule fois, de la plus récente à la plus
+        ancienne, en accumulant : le coût ne dépend pas du nombre de fenêtres.
+
+        Args:
+            windows (iterable): Couples (libellé, secondes)
+            now (float): Horodatage (défaut: time.time())
+
+        Returns:
+            dict: {libellé: {'histogram': to_dict(), 'errors': int}} plus 'all'
+        """
+        now = now if now is not None else time.time()
+        current_epoch = int(now // self.slot_seconds)
+        windows = sorted(windows or self.DEFAULT_WINDOWS, key=lambda window: window[1])
+        slots = sorted(
+            (index for index, epoch in enumerate(self._epochs)
+             if epoch <= current_epoch and self._histograms[index] is not None),
+            key=lambda index: self._epochs[index], reverse=True
+        )
+
+        exported = {}
+        running = LatencyHistogram()
+        errors = 0
+        position = 0
+        for label, seconds in windows:
+            oldest_epoch = current_epoch - max(1, int(math.ceil(seconds / self.slot_seconds))) + 1
+            while position < len(slots) and self._epochs[slots[position]] >= oldest_epoch:
+                running.merge(self._histograms[slots[position]])
+                errors += self._errors[slots[position]]
+                position += 1
+            exported[label] = {'histogram': running.to_dict(), 'errors': errors}
+        exported['all'] = {'histogram': self.lifetime.to_dict(), 'errors': self.lifetime_errors}
+        return exported
+
+    def summary(self, windows=None, percents: Iterable[float] = (50, 95, 99, 99.9), now: float = None) -> Dict:
+        """
+        Percentiles et débit par fenêtre glissante
+
+        Args:
+            windows (iterable): Couples (libellé, secondes)
+            percents (iterable): Percentiles à calculer
+            now (float): Horodatage (défaut: time.time())
+
+        Returns:
+            dict: Résumé par fenêtre et depuis le démarrage
+        """
+        result = {}
+        for label, seconds in windows or self.DEFAULT_WINDOWS:
+            histogram, errors = self.window(seconds, now)
+            result[label] = {
+                **histogram.summary(percents),
+                'errors': errors,
+                'rate_per_s': round(histogram.count / seconds, 3)
+            }
+        result['all'] = {**self.lifetime.summary(percents), 'errors': self.lifetime_errors}
+        return result
@@ -0,0 +1,378 @@
+"""
+Backend de cache local SQLite pour AgroBizChat
+Remplace Redis quand il n'est pas joignable (offres gratuites, développement)
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+
+def _to_bytes(value: Any) -> bytes:
+    """Convertit une valeur au format binaire stocké (comme redis-py)"""
+    if isinstance(value, bytes):
+        return value
+    if isinstance(value, str):
+        return value.encode('utf-8')
+    return str(value).encode('utf-8')
+
+
+def _to_key(key: Any) -> str:
+    """Normalise une clé (redis-py accepte str ou bytes)"""
+    return key.decode('utf-8') if isinstance(key, bytes) else str(key)
+
+
+class LocalCacheBackend:
+    """
+    Stockage clé-valeur SQLite partagé entre les workers gunicorn
+
+    Expose le sous-ensemble de l'API redis-py utilisé par CacheService
+    (get/set/setex/delete/scan_iter/sadd/smembers/expire/pipeline), avec
+    expiration TTL et éviction LRU approximative bornée en taille.
+    """
+
+    # Intervalle minimal entre deux mises à jour de la date d'accès d'une clé
+    ACCESS_UPDATE_INTERVAL = 60
+    # Nombre d'écritures entre deux contrôles de taille
+    EVICTION_CHECK_EVERY = 100
+
+    def __init__(self, path: str = None, max_size_mb: float = None):
+        """
+        Initialise le backend local
+
+        Args:
+            path (str): Chemin du fichier SQLite (LOCAL_CACHE_PATH par défaut)
+            max_size_mb (float): Taille maximale des valeurs en Mo (LOCAL_CACHE_MAX_MB)
+        """
+        if path is None:
+            project_root = Path(__file__).parent.parent.parent.resolve()
+            path = os.getenv('LOCAL_CACHE_PATH', str(project_root / 'data' / 'local_cache.db'))
+
+        self.path = path
+        self.max_size_bytes = int(float(max_size_mb or os.getenv('LOCAL_CACHE_MAX_MB', '64')) * 1024 * 1024)
+        self.start_time = time.time()
+        self._local = threading.local()
+        self._writes = 0
+        self._writes_lock = threading.Lock()
+
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._create_schema()
+
+    def _connection(self) -> sqlite3.Connection:
+        """Connexion propre au thread et au processus courant (sûre après fork)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        """Transaction d'écriture (réutilise celle d'un pipeline en cours)"""
+        conn = self._connection()
+        if conn.in_transaction:
+            yield conn
+            return
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _create_schema(self):
+        """Crée les tables du cache si nécessaire"""
+        conn = self._connection()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS cache_entries (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                expires_at REAL,
+                size INTEGER NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_entries_expires ON cache_entries (expires_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_entries_accessed ON cache_entries (accessed_at)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS cache_sets (
+                key TEXT NOT NULL,
+                member BLOB NOT NULL,
+                expires_at REAL,
+                PRIMARY KEY (key, member)
+            ) WITHOUT ROWID
+        """)
+
+    # Opérations sur les chaînes
+
+    def ping(self) -> bool:
+        """Vérifie que la base est accessible"""
+        self._connection().execute("SELECT 1").fetchone()
+        return True
+
+    def get(self, key: Any) -> Optional[bytes]:
+        """Récupère une valeur non expirée"""
+        conn = self._connection()
+        now = time.time()
+        row = conn.execute(
+            "SELECT value, expires_at, accessed_at FROM cache_entries WHERE key = ?",
+            (_to_key(key),)
+        ).fetchone()
+
+        if row is None:
+            return None
+
+        value, expires_at, accessed_at = row
+        if expires_at is not None and expires_at <= now:
+            conn.execute("DELETE FROM cache_entries WHERE key = ? AND expires_at <= ?", (_to_key(key), now))
+            return None
+
+        # LRU approximatif : éviter une écriture à chaque lecture
+        if now - accessed_at > self.ACCESS_UPDATE_INTERVAL:
+            conn.execute("UPDATE cache_entries SET accessed_at = ? WHERE key = ?", (now, _to_key(key)))
+
+        return value
+
+    def set(self, name: Any, value: Any, ex: float = None, px: int = None, nx: bool = False) -> Optional[bool]:
+        """
+        Stocke une valeur (sémantique redis-py : None si nx et clé existante)
+        """
+        conn = self._connection()
+        now = time.time()
+        ttl = ex if ex is not None else (px / 1000.0 if px is not None else None)
+        expires_at = now + ttl if ttl is not None else None
+        data = _to_bytes(value)
+        key = _to_key(name)
+
+        if nx:
+            with self._transaction():
+                conn.execute("DELETE FROM cache_entries WHERE key = ? AND expires_at <= ?", (key, now))
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO cache_entries (key, value, expires_at, size, accessed_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (key, data, expires_at, len(data), now)
+                )
+            return True if cursor.rowcount == 1 else None
+
+        conn.execute(
+            "INSERT OR REPLACE INTO cache_entries (key, value, expires_at, size, accessed_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (key, data, expires_at, len(data), now)
+        )
+        self._after_write()
+        return True
+
+    def setex(self, name: Any, time_seconds: float, value: Any) -> bool:
+        """Stocke une valeur avec un TTL en secondes"""
+        return bool(self.set(name, value, ex=time_seconds))
+
+    def delete(self, *names: Any) -> int:
+        """Supprime des clés (valeurs et ensembles)"""
+        if not names:
+            return 0
+
+        conn = self._connection()
+        keys = [_to_key(name) for name in names]
+        placeholders = ",".join("?" * len(keys))
+        now = time.time()
+
+        with self._transaction():
+            deleted = conn.execute(
+                f"DELETE FROM cache_entries WHERE key IN ({placeholders}) "
+                f"AND (expires_at IS NULL OR expires_at > ?)",
+                (*keys, now)
+            ).rowcount
+            conn.execute(f"DELETE FROM cache_entries WHERE key IN ({placeholders})", keys)
+
+            set_keys = [row[0] for row in conn.execute(
+                f"SELECT DISTINCT key FROM cache_sets WHERE key IN ({placeholders})", keys
+            )]
+            conn.execute(f"DELETE FROM cache_sets WHERE key IN ({placeholders})", keys)
+
+        return deleted + len(set_keys)
+
+    def delete_if_equals(self, name: Any, value: Any) -> int:
+        """Supprime une clé seulement si elle contient la valeur donnée (libération de verrou)"""
+        return self._connection().execute(
+            "DELETE FROM cache_entries WHERE key = ? AND value = ?",
+            (_to_key(name), _to_bytes(value))
+        ).rowcount
+
+    def expire(self, name: Any, time_seconds: float) -> bool:
+        """Définit l'expiration d'une clé ou d'un ensemble"""
+        conn = self._connection()
+        expires_at = time.time() + time_seconds
+        key = _to_key(name)
+        updated = conn.execute(
+            "UPDATE cache_entries SET expires_at = ? WHERE key = ?", (expires_at, key)
+        ).rowcount
+        updated += conn.execute(
+            "UPDATE cache_sets SET expires_at = ? WHERE key = ?", (expires_at, key)
+        ).rowcount
+        return updated > 0
+
+    def scan_iter(self, match: str = None, count: int = 500) -> Iterator[str]:
+        """
+        Parcourt les clés par lots (GLOB SQLite a la syntaxe des patterns Redis)
+        """
+        conn = self._connection()
+        pattern = match or '*'
+        last_key = ''
+
+        while True:
+            now = time.time()
+            rows = conn.execute(
+                "SELECT key FROM cache_entries WHERE key > ? AND key GLOB ? "
+                "AND (expires_at IS NULL OR expires_at > ?) ORDER BY key LIMIT ?",
+                (last_key, pattern, now, count)
+            ).fetchall()
+
+            for (key,) in rows:
+                yield key
+
+            if len(rows) < count:
+                break
+            last_key = rows[-1][0]
+
+    # Opérations sur les ensembles
+
+    def sadd(self, name: Any, *values: Any) -> int:
+        """Ajoute des membres à un ensemble"""
+        conn = self._connection()
+        key = _to_key(name)
+        added = 0
+        for value in values:
+            added += conn.execute(
+                "INSERT OR IGNORE INTO cache_sets (key, member, expires_at) "
+                "VALUES (?, ?, (SELECT MAX(expires_at) FROM cache_sets WHERE key = ?))",
+                (key, _to_bytes(value), key)
+            ).rowcount
+        return added
+
+    def smembers(self, name: Any) -> set:
+        """Récupère les membres non expirés d'un ensemble"""
+        rows = self._connection().execute(
+            "SELECT member FROM cache_sets WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (_to_key(name), time.time())
+        ).fetchall()
+        return {row[0] for row in rows}
+
+    # Administration
+
+    def pipeline(self) -> 'LocalPipeline':
+        """Crée un pipeline exécuté dans une seule transaction"""
+        return LocalPipeline(self)
+
+    def dbsize(self) -> int:
+        """Nombre de clés non expirées"""
+        return self._connection().execute(
+            "SELECT COUNT(*) FROM cache_entries WHERE expires_at IS NULL OR expires_at > ?",
+            (time.time(),)
+        ).fetchone()[0]
+
+    def info(self) -> Dict:
+        """Informations au format de redis INFO"""
+        used_bytes = self._connection().execute(
+            "SELECT COALESCE(SUM(size), 0) FROM cache_entries"
+        ).fetchone()[0]
+        return {
+            'used_memory': used_bytes,
+            'used_memory_human': f"{used_bytes / (1024 * 1024):.2f}M",
+            'maxmemory': self.max_size_bytes,
+            'redis_version': f"local-sqlite-{sqlite3.sqlite_version}",
+            'uptime_in_seconds': int(time.time() - self.start_time)
+        }
+
+    def purge_expired(self) -> int:
+        """Supprime les entrées et membres expirés"""
+        conn = self._connection()
+        now = time.time()
+        purged = conn.execute("DELETE FROM cache_entries WHERE expires_at <= ?", (now,)).rowcount
+        purged += conn.execute("DELETE FROM cache_sets WHERE expires_at <= ?", (now,)).rowcount
+        return purged
+
+    def evict(self) -> int:
+        """
+        Ramène la taille sous 90% du maximum en supprimant les clés
+        les moins récemment utilisées
+
+        Returns:
+            int: Nombre d'entrées évincées
+        """
+        conn = self._connection()
+        evicted = self.purge_expired()
+        target = int(self.max_size_bytes * 0.9)
+
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache_entries").fetchone()[0]
+        while total > target:
+            rows = conn.execute(
+                "SELECT key, size FROM cache_entries ORDER BY accessed_at LIMIT 200"
+            ).fetchall()
+            if not rows:
+                break
+
+            to_delete = []
+            for key, size in rows:
+                to_delete.append(key)
+                total -= size
+                if total <= target:
+                    break
+
+            placeholders = ",".join("?" * len(to_delete))
+            evicted += conn.execute(
+                f"DELETE FROM cache_entries WHERE key IN ({placeholders})", to_delete
+            ).rowcount
+
+        return evicted
+
+    def _after_write(self):
+        """Déclenche périodiquement le contrôle de taille"""
+        with self._writes_lock:
+            self._writes += 1
+            check = self._writes % self.EVICTION_CHECK_EVERY == 0
+
+        if check:
+            try:
+                self.evict()
+            except sqlite3.Error as e:
+                print(f"Erreur éviction cache local: {e}")
+
+
+class LocalPipeline:
+    """Pipeline minimal : commandes mises en file et exécutées dans une transaction"""
+
+    def __init__(self, backend: LocalCacheBackend):
+        self.backend = backend
+        self.commands: List[tuple] = []
+
+    def __getattr__(self, name: str):
+        method = getattr(self.backend, name)
+
+        def queue(*args, **kwargs):
+            self.commands.append((method, args, kwargs))
+            return self
+
+        return queue
+
+    def execute(self) -> List:
+        """Exécute les commandes en file"""
+        results = []
+
+        try:
+            with self.backend._transaction():
+                for method, args, kwargs in self.commands:
+                    results.append(method(*args, **kwargs))
+        finally:
+            self.commands = []
+
+        return results
@@ -0,0 +1,409 @@
+"""
+Registre de métriques Prometheus/OpenMetrics pour AgroBizChat
+Compteurs, jauges et histogrammes à cardinalité bornée, agrégés entre workers
+(workers terminés compris : les compteurs exportés restent monotones)
+"""
+
+import os
+import time
+import threading
+from functools import wraps
+from typing import Callable, Dict, Iterable, List, Tuple
+
+import psutil
+
+from src.services.worker_metrics import WorkerSnapshotStore
+
+CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+# Valeur de label utilisée quand une métrique dépasse son nombre maximal de séries
+OVERFLOW_LABEL = '__overflow__'
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _escape(value: str) -> str:
+    """Échappe une valeur de label (antislash, guillemet, saut de ligne)"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(names: Iterable[str], values: Iterable[str], extra: Dict = None) -> str:
+    """Formate {nom="valeur",...} ou une chaîne vide"""
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs += [f'{name}="{_escape(value)}"' for name, value in (extra or {}).items()]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _format_value(value: float) -> str:
+    """Formate un nombre au format OpenMetrics"""
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+class _Metric:
+    """Base commune : séries indexées par tuple de valeurs de labels"""
+
+    type_name = None
+
+    def __init__(self, registry: 'MetricsRegistry', name: str, documentation: str,
+                 labelnames: Iterable[str] = (), max_series: int = None):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.max_series = max_series or registry.max_series
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict) -> Tuple:
+        """Clé de série, repliée sur OVERFLOW_LABEL au-delà de max_series"""
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        if key not in self._series and len(self._series) >= self.max_series:
+            key = tuple(OVERFLOW_LABEL for _ in self.labelnames)
+        return key
+
+    def snapshot(self) -> Dict:
+        """Instantané JSON-sérialisable"""
+        with self._lock:
+            series = [[list(key), value] for key, value in self._series.items()]
+        return {
+            'type': self.type_name,
+            'help': self.documentation,
+            'labelnames': list(self.labelnames),
+            'series': series
+        }
+
+class Counter(_Metric):
+    """Compteur monotone"""
+
+    type_name = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        """Incrémente le compteur"""
+        with self._lock:
+            key = self._key(labels)
+            self._series[key] = self._series.get(key, 0) + amount
+        self.registry.maybe_publish()
+
+class Gauge(_Metric):
+    """Jauge (valeur instantanée, propre à chaque worker, disparaît avec lui)"""
+
+    type_name = 'gauge'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._functions = {}
+
+    def set(self, value: float, **labels):
+        """Fixe la valeur de la jauge"""
+        with self._lock:
+            self._series[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        """Augmente la jauge"""
+        with self._lock:
+            key = self._key(labels)
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        """Diminue la jauge"""
+        self.inc(-amount, **labels)
+
+    def set_function(self, func: Callable[[], float], **labels):
+        """
+        Évalue la valeur au moment de l'export
+
+        Args:
+            func (callable): Fonction sans argument retournant la valeur
+            **labels: Labels de la série
+        """
+        with self._lock:
+            self._functions[self._key(labels)] = func
+
+    def snapshot(self) -> Dict:
+        """Instantané incluant les valeurs calculées"""
+        with self._lock:
+            functions = list(self._functions.items())
+        for key, func in functions:
+            try:
+                value = func()
+            except Exception as e:
+                print(f"Erreur jauge {self.name}: {e}")
+                continue
+            with self._lock:
+                self._series[key] = value
+        return super().snapshot()
+
+class Histogram(_Metric):
+    """Histogramme cumulatif à bornes fixes (en secondes)"""
+
+    type_name = 'histogram'
+
+    def __init__(self, *args, buckets: Iterable[float] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets or DEFAULT_BUCKETS))
+
+    def observe(self, value: float, **labels):
+        """Enregistre une observation"""
+        with self._lock:
+            key = self._key(labels)
+            state = self._series.get(key)
+            if state is None:
+                state = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][index] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+        self.registry.maybe_publish()
+
+    def time(self, **labels):
+        """
+        Mesure une durée (gestionnaire de contexte ou décorateur)
+
+        Args:
+            **labels: Labels de la série
+        """
+        return _Timer(self, labels)
+
+    def snapshot(self) -> Dict:
+        """Instantané incluant les bornes"""
+        with self._lock:
+            series = [[list(key), [list(state[0]), state[1], state[2]]] for key, state in self._series.items()]
+        return {
+            'type': self.type_name,
+            'help': self.documentation,
+            'labelnames': list(self.labelnames),
+            'buckets': list(self.buckets),
+            'series': series
+        }
+
+class _Timer:
+    """Chronomètre pour Histogram.time()"""
+
+    def __init__(self, histogram: Histogram, labels: Dict):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.start_time, **self.labels)
+        return False
+
+    def __call__(self, func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with _Timer(self.histogram, self.labels):
+                return func(*args, **kwargs)
+        return wrapper
+
+class MetricsRegistry:
+    """Registre des métriques du processus et export OpenMetrics multi-workers"""
+
+    def __init__(self, namespace: str = 'agrobiz', store: WorkerSnapshotStore = None):
+        """
+        Initialise le registre
+
+        Args:
+            namespace (str): Préfixe des noms de métriques
+            store (WorkerSnapshotStore): Partage inter-workers (optionnel)
+        """
+        self.namespace = namespace
+        self.max_series = int(os.getenv('METRICS_MAX_SERIES', '200'))
+        self.store = store if store is not None else WorkerSnapshotStore('metrics')
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name: str, documentation: str, labelnames: Iterable[str] = (), **kwargs):
+        """Crée la métrique ou retourne celle déjà enregistrée sous ce nom"""
+        full_name = f"{self.namespace}_{name}" if self.namespace else name
+        with self._lock:
+            metric = self._metrics.get(full_name)
+            if metric is None:
+                metric = self._metrics[full_name] = cls(self, full_name, documentation, labelnames, **kwargs)
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = (), **kwargs) -> Counter:
+        """Déclare un compteur (le suffixe _total est ajouté à l'export)"""
+        return self._register(Counter, name, documentation, labelnames, **kwargs)
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = (), **kwargs) -> Gauge:
+        """Déclare une jauge"""
+        return self._register(Gauge, name, documentation, labelnames, **kwargs)
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (), **kwargs) -> Histogram:
+        """Déclare un histogramme"""
+        return self._register(Histogram, name, documentation, labelnames, **kwargs)
+
+    def register_collector(self, collector: Callable[[], List[Dict]]):
+        """
+        Ajoute une source de métriques déjà agrégées, évaluée à l'export
+
+        Args:
+            collector (callable): Retourne des familles
+                {'name', 'type', 'help', 'samples': [(suffixe, {labels}, valeur)]}
+        """
+        with self._lock:
+            if collector not in self._collectors:
+                self._collectors.append(collector)
+
+    def snapshot(self) -> Dict:
+        """Instantané de toutes les métriques du processus"""
+        with self._lock:
+            metrics = list(self._metrics.items())
+        return {
+            'pid': os.getpid(),
+            'worker': self.store.worker_index(),
+            'metrics': {name: metric.snapshot() for name, metric in metrics}
+        }
+
+    def maybe_publish(self):
+        """Publie l'instantané si l'intervalle de publication est écoulé"""
+        if self.store.should_publish():
+            self.store.publish(self.snapshot())
+
+    def start(self) -> bool:
+        """
+        Publication périodique de l'instantané du worker, même inactif (post_worker_init)
+
+        Returns:
+            bool: True si la publication a été lancée dans ce processus
+        """
+        return self.store.start_publisher(self.snapshot)
+
+    def publish(self) -> bool:
+        """Publie immédiatement l'instantané (arrêt du worker)"""
+        return self.store.publish(self.snapshot(), force=True)
+
+    @staticmethod
+    def _merge(snapshots: List[Dict], gauges: bool = True) -> Dict:
+        """Somme compteurs et histogrammes ; les jauges gardent le numéro stable du worker en label"""
+        merged = {}
+        for snapshot in snapshots:
+            worker = str(snapshot.get('worker', snapshot.get('pid', '')))
+            for name, data in (snapshot.get('metrics') or {}).items():
+                if data['type'] == 'gauge' and not gauges:
+                    continue
+                family = merged.setdefault(name, {
+                    'type': data['type'],
+                    'help': data['help'],
+                    'labelnames': data['labelnames'],
+                    'buckets': data.get('buckets'),
+                    'series': {}
+                })
+                for labels, value in data['series']:
+                    if data['type'] == 'gauge':
+                        family['series'][tuple(labels) + (worker,)] = value
+                    elif data['type'] == 'counter':
+                        key = tuple(labels)
+                        family['series'][key] = family['series'].get(key, 0) + value
+                    else:
+                        key = tuple(labels)
+                        state = family['series'].setdefault(key, [[0] * len(value[0]), 0.0, 0])
+                        state[0] = [a + b for a, b in zip(state[0], value[0])]
+                        state[1] += value[1]
+                        state[2] += value[2]
+        return merged
+
+    @classmethod
+    def _retire(cls, retired: Dict, snapshot: Dict) -> Dict:
+        """Ajoute les compteurs et histogrammes d'un worker terminé au cumul (ses jauges sont oubliées)"""
+        merged = cls._merge([retired, snapshot], gauges=False)
+        return {
+            'metrics': {
+                name: {**{key: value for key, value in family.items() if key != 'series'},
+                       'series': [[list(labels), value] for labels, value in family['series'].items()]}
+                for name, family in merged.items()
+            }
+        }
+
+    def render(self) -> str:
+        """
+        Export texte OpenMetrics des workers vivants et du cumul des workers terminés
+
+        Returns:
+            str: Exposition terminée par "# EOF"
+        """
+        self.store.publish(self.snapshot(), force=True)
+        snapshots, retired = self.store.collect_totals(self._retire)
+        snapshots = (snapshots or [self.snapshot()]) + [retired]
+        lines = []
+
+        for name, family in sorted(self._merge(snapshots).items()):
+            lines.append(f"# TYPE {name} {family['type']}")
+            lines.append(f"# HELP {name} {_escape(family['help'])}")
+            labelnames = family['labelnames']
+
+            for labels, value in sorted(family['series'].items()):
+                if family['type'] == 'counter':
+                    lines.append(f"{name}_total{_format_labels(labelnames, labels)} {_format_value(value)}")
+                elif family['type'] == 'gauge':
+                    lines.append(f"{name}{_format_labels(labelnames + ['worker'], labels)} {_format_value(value)}")
+                else:
+                    bucket_counts, total, count = value
+                    cumulative = 0
+                    for bound, bucket_count in zip(family['buckets'], bucket_counts):
+                        cumulative += bucket_count
+                        bucket_labels = _format_labels(labelnames, labels, {'le': _format_value(bound)})
+                        lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+                    inf_labels = _format_labels(labelnames, labels, {'le': '+Inf'})
+                    lines.append(f"{name}_bucket{inf_labels} {count}")
+                    lines.append(f"{name}_count{_format_labels(labelnames, labels)} {count}")
+                    lines.append(f"{name}_sum{_format_labels(labelnames, labels)} {_format_value(total)}")
+
+        for collector in list(self._collectors):
+            try:
+                families = collector()
+            except Exception as e:
+                print(f"Erreur collecteur métriques: {e}")
+                continue
+            for family in families:
+                lines.append(f"# TYPE {family['name']} {family['type']}")
+                lines.append(f"# HELP {family['name']} {_escape(family['help'])}")
+                for suffix, labels, value in family['samples']:
+                    label_text = _format_labels(labels.keys(), labels.values())
+                    lines.append(f"{family['name']}{suffix}{label_text} {_format_value(value)}")
+
+        lines.append('# EOF')
+        return '\n'.join(lines) + '\n'
+
+_process_cache = {}
+
+def _current_process() -> psutil.Process:
+    """psutil.Process du processus courant (recréé après un fork)"""
+    pid = os.getpid()
+    process = _process_cache.get(pid)
+    if process is None:
+        _process_cache.clear()
+        process = _process_cache[pid] = psutil.Process(pid)
+    return process
+
+def _open_fds() -> int:
+    """Descripteurs ouverts (non disponible sous Windows)"""
+    try:
+        return _current_process().num_fds()
+    except AttributeError:
+        return 0
+
+def register_process_metrics(registry: 'MetricsRegistry'):
+    """
+    Déclare les jauges du processus (mémoire, CPU, threads, descripteurs)
+
+    Args:
+        registry (MetricsRegistry): Registre cible
+    """
+    registry.gauge('process_resident_memory_bytes', 'Mémoire résidente du worker').set_function(
+        lambda: _current_process().memory_info().rss)
+    registry.gauge('process_cpu_seconds', 'Temps CPU cumulé du worker (user + system)').set_function(
+        lambda: sum(_current_process().cpu_times()[:2]))
+    registry.gauge('process_threads', 'Nombre de threads du worker').set_function(
+        lambda: _current_process().num_threads())
+    registry.gauge('process_open_fds', 'Descripteurs de fichiers ouverts').set_function(_open_fds)
+    registry.gauge('process_start_time_seconds', 'Démarrage du worker (epoch)').set_function(
+        lambda: _current_process().create_time())
+
+# Registre global des métriques
+metrics_registry = MetricsRegistry()
+register_process_metrics(metrics_registry)
@@ -10,126 +10,142 @@ from typing import Dict, List, Optional
 from datetime import datetime, timedelta
 import json
 import os
+from collections import deque
+
+from src.services.db_instrumentation import QueryShapes, query_shapes
+from src.services.error_groups import ErrorGroups, call_site
+from src.services.latency_histogram import LatencyHistogram, SlidingWindowHistogram
+from src.services.system_collector import SystemCollector
+from src.services.worker_metrics import WorkerSnapshotStore
+
+OTHER_ENDPOINT = 'other'
+# Volume publié par worker : l'historique complet reste local
+SNAPSHOT_RECENT_ERRORS = 50
+SNAPSHOT_ERROR_GROUPS = 100
+SNAPSHOT_PERFORMANCE_POINTS = 60
+SNAPSHOT_QUERY_SHAPES = 50
+SNAPSHOT_SLOW_QUERIES = 20
 
 class MonitoringService:
     """Service de monitoring pour surveiller les performances"""
     
-    def __init__(self):
+    def __init__(self, snapshot_store: WorkerSnapshotStore = None):
+        """
+        Initialise le monitoring
+        
+        Args:
+            snapshot_store (WorkerSnapshotStore): Partage inter-workers (défaut: data/worker_metrics)
+        """
         self.metrics = {}
-        self.performance_data = []
-        self.error_logs = []
+        # Flux récent borné, et groupes par empreinte qui survivent à une rafale d'erreurs identiques
+        self.error_logs = deque(maxlen=int(os.getenv('ERROR_LOG_SIZE', '500')))
+        self.error_groups = ErrorGroups()
         self.api_calls = {}
         self.start_time = datetime.now()
         self.monitoring_enabled = os.getenv('ENABLE_METRICS', 'true').lower() == 'true'
         
+        # Histogrammes glissants par endpoint : mémoire fixe, O(1) par appel
+        self.window_slot_seconds = int(os.getenv('MONITORING_SLOT_SECONDS', '10'))
+        self.window_slots = int(os.getenv('MONITORING_SLOTS', '360'))
+        self.max_endpoints = int(os.getenv('MONITORING_MAX_ENDPOINTS', '200'))
+        self._api_lock = threading.Lock()
+        
+        # Chaque worker gunicorn publie son instantané, la lecture fusionne tous les workers
+        self.snapshot_store = snapshot_store if snapshot_store is not None else WorkerSnapshotStore('monitoring')
+        
+        # Mesures hôte et processus non bloquantes, historique en tableaux de taille fixe
+        self.collector = SystemCollector(on_sample=self._on_system_sample)
+        
         if self.monitoring_enabled:
             self._start_background_monitoring()
+            if hasattr(os, 'register_at_fork'):
+                os.register_at_fork(after_in_child=self._after_fork)
     
     def _start_background_monitoring(self):
         """Démarre le monitoring en arrière-plan"""
-        def monitor_loop():
-            while True:
-                try:
-                    self._collect_system_metrics()
-                    time.sleep(60)  # Collecte toutes les minutes
-                except Exception as e:
-                    print(f"Erreur monitoring: {e}")
-        
-        monitor_thread = threading.Thread(target=monitor_loop, daemon=True)
-        monitor_thread.start()
+        self.collector.start()
+        self._start_publisher()
         print("✅ Monitoring démarré en arrière-plan")
     
+    def _start_publisher(self):
+        """Publie l'instantané du worker à intervalle régulier, hors du chemin des requêtes"""
+        def publish_loop():
+            while True:
+                time.sleep(max(1.0, self.snapshot_store.publish_interval))
+                self.publish_snapshot()
+        
+        threading.Thread(target=publish_loop, name='monitoring-publish', daemon=True).start()
+    
+    def _after_fork(self):
+        """Dans un worker forké : données propres au processus et nouveau thread de publication"""
+        self._api_lock = threading.Lock()
+        self.api_calls = {}
+        self.error_logs = deque(maxlen=self.error_logs.maxlen)
+        self.error_groups = ErrorGroups()
+        self.metrics = {}
+        self.start_time = datetime.now()
+        self._start_publisher()
+    
+    def _on_system_sample(self, metrics: Dict):
+        """Reçoit chaque mesure du collecteur"""
+        self.metrics = metrics
+        self.publish_snapshot(force=True)
+    
     def _collect_system_metrics(self):
-        """Collecte les métriques système"""
+        """Collecte les métriques système et processus (sans bloquer)"""
         try:
-            # Métriques CPU
-            cpu_percent = psutil.cpu_percent(interval=1)
-            cpu_count = psutil.cpu_count()
-            
-            # Métriques mémoire
-            memory = psutil.virtual_memory()
-            memory_percent = memory.percent
-            memory_used = memory.used / (1024**3)  # GB
-            memory_total = memory.total / (1024**3)  # GB
-            
-            # Métriques disque
-            disk = psutil.disk_usage('/')
-            disk_percent = disk.percent
-            disk_used = disk.used / (1024**3)  # GB
-            disk_total = disk.total / (1024**3)  # GB
-            
-            # Métriques réseau
-            network = psutil.net_io_counters()
-            bytes_sent = network.bytes_sent
-            bytes_recv = network.bytes_recv
-            
-            # Uptime
-            uptime = (datetime.now() - self.start_time).total_seconds()
-            
-            metrics = {
-                'timestamp': datetime.now().isoformat(),
-                'cpu': {
-                    'percent': cpu_percent,
-                    'count': cpu_count
-                },
-                'memory': {
-                    'percent': memory_percent,
-                    'used_gb': round(memory_used, 2),
-                    'total_gb': round(memory_total, 2)
-                },
-                'disk': {
-                    'percent': disk_percent,
-                    'used_gb': round(disk_used, 2),
-                    'total_gb': round(disk_total, 2)
-                },
-                'network': {
-                    'bytes_sent': bytes_sent,
-                    'bytes_recv': bytes_recv
-                },
-                'uptime_seconds': uptime
-            }
-            
-            self.performance_data.append(metrics)
-            
-            # Garder seulement les 1000 dernières métriques
-            if len(self.performance_data) > 1000:
-                self.performance_data = self.performance_data[-1000:]
-            
-            self.metrics = metrics
-            
+            self.metrics = self.collector.collect()
         except Exception as e:
             print(f"Erreur collecte métriques: {e}")
     
-    def log_api_call(self, endpoint: str, method: str, status_code: int, response_time: float):
+    def log_api_call(self, endpoint: str, method: str, status_code: int, response_time: float,
+                     request_bytes: int = 0, response_bytes: int = 0):
         """
         Enregistre un appel API
         
         Args:
-            endpoint (str): Endpoint appelé
+            endpoint (str): Endpoint appelé (modèle de route)
             method (str): Méthode HTTP
             status_code (int): Code de statut
             response_time (float): Temps de réponse en secondes
+            request_bytes (int): Taille du corps de la requête
+            response_bytes (int): Taille de la réponse
         """
         if not self.monitoring_enabled:
             return
         
-        call_data = {
-            'timestamp': datetime.now().isoformat(),
-            'endpoint': endpoint,
-            'method': method,
-            'status_code': status_code,
-            'response_time': response_time
-        }
-        
-        # Enregistrer dans les métriques
-        if endpoint not in self.api_calls:
-            self.api_calls[endpoint] = []
-        
-        self.api_calls[endpoint].append(call_data)
-        
-        # Garder seulement les 100 derniers appels par endpoint
-        if len(self.api_calls[endpoint]) > 100:
-            self.api_calls[endpoint] = self.api_calls[endpoint][-100:]
+        with self._api_lock:
+            stats = self.api_calls.get(endpoint)
+            if stats is None:
+                # Nombre d'endpoints borné : le surplus est regroupé
+                if len(self.api_calls) >= self.max_endpoints:
+                    endpoint = OTHER_ENDPOINT
+                    stats = self.api_calls.get(endpoint)
+                if stats is None:
+                    stats = self.api_calls[endpoint] = {
+                        'histogram': SlidingWindowHistogram(self.window_slot_seconds, self.window_slots),
+                        'total_calls': 0,
+                        'total_time': 0.0,
+                        'min_response_time': None,
+                        'max_response_time': 0.0,
+                        'status_distribution': {},
+                        'methods': {},
+                        'request_bytes': 0,
+                        'response_bytes': 0,
+                        'last_call': None
+                    }
+            
+            stats['histogram'].record(response_time * 1000, error=status_code >= 500)
+            stats['total_calls'] += 1
+            stats['total_time'] += response_time
+            if stats['min_response_time'] is None or response_time < stats['min_response_time']:
+                stats['min_response_time'] = response_time
+            stats['max_response_time'] = max(stats['max_response_time'], response_time)
+            stats['status_distribution'][status_code] = stats['status_distribution'].get(status_code, 0) + 1
+            stats['methods'][method] = stats['methods'].get(method, 0) + 1
+            stats['request_bytes'] += request_bytes
+            stats['response_bytes'] += response_bytes
+            stats['last_call'] = datetime.now().isoformat()
     
     def log_error(self, error_type: str, message: str, details: Dict = None):
         """
@@ -150,11 +166,97 @@ class MonitoringService:
             'details': details or {}
         }
         
+        # Le deque borné écarte les plus anciennes sans recopier la liste
         self.error_logs.append(error_data)
         
-        # Garder seulement les 500 dernières erreurs
-        if len(self.error_logs) > 500:
-            self.error_logs = self.error_logs[-500:]
+        group, to_log = self.error_groups.record(error_type, message, details, site=call_site(2))
+        if to_log:
+            repeated = f" (x{to_log} depuis le dernier signalement)" if to_log > 1 else ''
+            print(f"⚠️ Erreur [{error_type}] {group['message']} @ {group['site']}{repeated}")
+    
+    def _local_snapshot(self) -> Dict:
+        """
+        Instantané JSON-sérialisable du worker courant
+        
+        Returns:
+            dict: Appels API (compteurs et fenêtres glissantes), erreurs et métriques système
+        """
+        now = time.time()
+        with self._api_lock:
+            api_calls = {
+                endpoint: {
+                    'total_calls': calls['total_calls'],
+                    'total_time': calls['total_time'],
+                    'min_response_time': calls['min_response_time'],
+                    'max_response_time': calls['max_response_time'],
+                    'status_distribution': {str(code): count for code, count in calls['status_distribution'].items()},
+                    'methods': dict(calls['methods']),
+                    'request_bytes': calls['request_bytes'],
+                    'response_bytes': calls['response_bytes'],
+                    'last_call': calls['last_call'],
+                    'windows': calls['histogram'].export_windows(now=now)
+                }
+                for endpoint, calls in self.api_calls.items()
+            }
+        
+        error_logs = list(self.error_logs)
+        
+        return {
+            'api_calls': api_calls,
+            'errors': {
+                'total': self.error_groups.total,
+                'types': dict(self.error_groups.types),
+                'last_hour': self.error_groups.last_hour(now),
+                'recent': error_logs[-SNAPSHOT_RECENT_ERRORS:],
+                'groups': self.error_groups.groups(SNAPSHOT_ERROR_GROUPS, now)
+            },
+            'db_queries': {
+                'shapes': query_shapes.export(SNAPSHOT_QUERY_SHAPES),
+                'slow': query_shapes.slow_queries(SNAPSHOT_SLOW_QUERIES)
+            },
+            'current_metrics': self.metrics,
+            'performance_history': self.collector.history(since=now - 3600, resolution='raw')[-SNAPSHOT_PERFORMANCE_POINTS:]
+        }
+    
+    def publish_snapshot(self, force: bool = False) -> bool:
+        """
+        Publie l'instantané du worker pour les autres processus
+        
+        Args:
+            force (bool): Ignorer l'intervalle de publication
+            
+        Returns:
+            bool: True si l'instantané a été écrit
+        """
+        if not self.monitoring_enabled:
+            return False
+        try:
+            return self.snapshot_store.publish(self._local_snapshot(), force=force)
+        except Exception as e:
+            print(f"Erreur publication monitoring: {e}")
+            return False
+    
+    def _other_worker_snapshots(self) -> List:
+        """
+        Instantanés publiés par les autres workers vivants
+        
+        Returns:
+            list: Couples (instantané, âge en secondes)
+        """
+        try:
+            return self.snapshot_store.collect(exclude_self=True, with_age=True)
+        except Exception as e:
+            print(f"Erreur lecture monitoring des workers: {e}")
+            return []
+    
+    def _worker_snapshots(self) -> List:
+        """
+        Instantanés de tous les workers (le worker courant est lu en direct)
+        
+        Returns:
+            list: Couples (instantané, âge en secondes)
+        """
+        return [(self._local_snapshot(), 0.0)] + self._other_worker_snapshots()
     
     def get_current_metrics(self) -> Dict:
         """
@@ -171,17 +273,22 @@ class MonitoringService:
         
         return {
             'monitoring_enabled': True,
+            'db_queries': {
+                'shapes': query_shapes.export(SNAPSHOT_QUERY_SHAPES),
+                'slow': query_shapes.slow_queries(SNAPSHOT_SLOW_QUERIES)
+            },
             'current_metrics': self.metrics,
             'uptime': (datetime.now() - self.start_time).total_seconds(),
             'start_time': self.start_time.isoformat()
         }
     
-    def get_performance_history(self, hours: int = 24) -> List[Dict]:
+    def get_performance_history(self, hours: int = 24, resolution: str = None) -> List[Dict]:
         """
         Récupère l'historique des performances
         
         Args:
             hours (int): Nombre d'heures à récupérer
+            resolution (str): 'raw', '1m', '10m' ou '1h' (défaut: la plus fine couvrant la période)
             
         Returns:
             list: Historique des performances
@@ -189,12 +296,70 @@ class MonitoringService:
         if not self.monitoring_enabled:
             return []
         
-        cutoff_time = datetime.now() - timedelta(hours=hours)
+        cutoff = datetime.now() - timedelta(hours=hours)
+        cutoff_time = cutoff.isoformat()
+        resolution = resolution or self.collector.store.resolution_for(cutoff.timestamp())
+        
+        # Historique persisté (survit aux redémarrages) à la résolution demandée
+        sources = [self.collector.history(since=cutoff.timestamp(), resolution=resolution)]
+        if resolution not in ('raw', '1m'):
+            return sources[0]
         
-        return [
-            metric for metric in self.performance_data
-            if datetime.fromisoformat(metric['timestamp']) > cutoff_time
-        ]
+        # Les métriques système sont communes à la machine : un point par minute suffit
+        # (complété par la dernière heure des autres workers)
+        for snapshot, _ in self._other_worker_snapshots():
+            sources.append(snapshot.get('performance_history') or [])
+        
+        history = {}
+        for points in sources:
+            for metric in points:
+                if metric['timestamp'] > cutoff_time:
+                    history.setdefault(metric['timestamp'][:16], metric)
+        
+        return [history[minute] for minute in sorted(history)]
+    
+    @staticmethod
+    def _merge_windows(target: Dict, windows: Dict, age: float):
+        """
+        Fusionne les fenêtres glissantes exportées par un worker
+        
+        Args:
+            target (dict): {libellé: [LatencyHistogram, erreurs]} à compléter
+            windows (dict): Résultat de SlidingWindowHistogram.export_windows()
+            age (float): Âge de l'instantané en secondes
+        """
+        window_seconds = dict(SlidingWindowHistogram.DEFAULT_WINDOWS)
+        for label, window in windows.items():
+            # Un instantané plus vieux que la fenêtre ne la recouvre plus
+            if label in window_seconds and age >= window_seconds[label]:
+                continue
+            entry = target.setdefault(label, [LatencyHistogram(), 0])
+            entry[0].merge(LatencyHistogram.from_dict(window['histogram']))
+            entry[1] += window['errors']
+    
+    @staticmethod
+    def _summarize_windows(windows: Dict, percents=(50, 95, 99, 99.9)) -> Dict:
+        """
+        Percentiles et débit par fenêtre à partir des histogrammes fusionnés
+        
+        Args:
+            windows (dict): {libellé: [LatencyHistogram, erreurs]}
+            percents (iterable): Percentiles à calculer
+            
+        Returns:
+            dict: Même format que SlidingWindowHistogram.summary()
+        """
+        result = {}
+        for label, seconds in SlidingWindowHistogram.DEFAULT_WINDOWS:
+            histogram, errors = windows.get(label) or (LatencyHistogram(), 0)
+            result[label] = {
+                **histogram.summary(percents),
+                'errors': errors,
+                'rate_per_s': round(histogram.count / seconds, 3)
+            }
+        histogram, errors = windows.get('all') or (LatencyHistogram(), 0)
+        result['all'] = {**histogram.summary(percents), 'errors': errors}
+        return result
     
     def get_api_statistics(self) -> Dict:
         """
@@ -206,32 +371,74 @@ class MonitoringService:
         if not self.monitoring_enabled:
             return {}
         
-        stats = {}
+        merged = {}
+        for snapshot, age in self._worker_snapshots():
+            for endpoint, calls in (snapshot.get('api_calls') or {}).items():
+                entry = merged.get(endpoint)
+                if entry is None:
+                    entry = merged[endpoint] = {
+                        'total_calls': 0, 'total_time': 0.0, 'min_response_time': None,
+                        'max_response_time': 0.0, 'status_distribution': {}, 'methods': {},
+                        'request_bytes': 0, 'response_bytes': 0, 'last_call': None, 'windows': {}
+                    }
+                entry['total_calls'] += calls['total_calls']
+                entry['total_time'] += calls['total_time']
+                if calls['min_response_time'] is not None and (
+                        entry['min_response_time'] is None or calls['min_response_time'] < entry['min_response_time']):
+                    entry['min_response_time'] = calls['min_response_time']
+                entry['max_response_time'] = max(entry['max_response_time'], calls['max_response_time'])
+                for code, count in calls['status_distribution'].items():
+                    entry['status_distribution'][int(code)] = entry['status_distribution'].get(int(code), 0) + count
+                for method, count in calls['methods'].items():
+                    entry['methods'][method] = entry['methods'].get(method, 0) + count
+                entry['request_bytes'] += calls.get('request_bytes', 0)
+                entry['response_bytes'] += calls.get('response_bytes', 0)
+                if calls['last_call'] and (entry['last_call'] is None or calls['last_call'] > entry['last_call']):
+                    entry['last_call'] = calls['last_call']
+                self._merge_windows(entry['windows'], calls.get('windows') or {}, age)
         
-        for endpoint, calls in self.api_calls.items():
-            if not calls:
+        stats = {}
+        for endpoint, calls in merged.items():
+            if not calls['total_calls']:
                 continue
             
-            # Calculer les statistiques
-            response_times = [call['response_time'] for call in calls]
-            status_codes = [call['status_code'] for call in calls]
-            
-            # Répartition des codes de statut
-            status_distribution = {}
-            for status in status_codes:
-                status_distribution[status] = status_distribution.get(status, 0) + 1
-            
             stats[endpoint] = {
-                'total_calls': len(calls),
-                'avg_response_time': sum(response_times) / len(response_times) if response_times else 0,
-                'min_response_time': min(response_times) if response_times else 0,
-                'max_response_time': max(response_times) if response_times else 0,
-                'status_distribution': status_distribution,
-                'last_call': calls[-1]['timestamp'] if calls else None
+                'total_calls': calls['total_calls'],
+                'avg_response_time': calls['total_time'] / calls['total_calls'],
+                'min_response_time': calls['min_response_time'] or 0,
+                'max_response_time': calls['max_response_time'],
+                'status_distribution': calls['status_distribution'],
+                'methods': calls['methods'],
+                'avg_request_bytes': round(calls['request_bytes'] / calls['total_calls'], 1),
+                'avg_response_bytes': round(calls['response_bytes'] / calls['total_calls'], 1),
+                'last_call': calls['last_call'],
+                # p50/p95/p99/p999 par fenêtre glissante (1m, 5m, 15m, 1h) et depuis le démarrage
+                'latency_ms': self._summarize_windows(calls['windows'])
             }
         
         return stats
     
+    def get_latency_windows(self, endpoints) -> Dict:
+        """
+        Histogrammes glissants fusionnés (tous workers) d'un groupe d'endpoints
+
+        Args:
+            endpoints (iterable): Modèles de route (ex: "/webhook/whatsapp")
+
+        Returns:
+            dict: {libellé de fenêtre: [LatencyHistogram, erreurs]}
+        """
+        windows = {}
+        if not self.monitoring_enabled:
+            return windows
+
+        endpoints = set(endpoints)
+        for snapshot, age in self._worker_snapshots():
+            for endpoint, calls in (snapshot.get('api_calls') or {}).items():
+                if endpoint in endpoints:
+                    self._merge_windows(windows, calls.get('windows') or {}, age)
+        return windows
+
     def get_error_statistics(self) -> Dict:
         """
         Récupère les statistiques des erreurs
@@ -242,25 +449,50 @@ class MonitoringService:
         if not self.monitoring_enabled:
             return {}
         
-        if not self.error_logs:
-            return {
-                'total_errors': 0,
-                'error_types': {},
-                'recent_errors': []
-            }
-        
-        # Répartition par type d'erreur
+        total_errors = 0
         error_types = {}
-        for error in self.error_logs:
-            error_type = error['type']
-            error_types[error_type] = error_types.get(error_type, 0) + 1
+        recent_errors = []
+        group_lists = []
+        for snapshot, _ in self._worker_snapshots():
+            errors = snapshot.get('errors') or {}
+            total_errors += errors.get('total', 0)
+            for error_type, count in (errors.get('types') or {}).items():
+                error_types[error_type] = error_types.get(error_type, 0) + count
+            recent_errors.extend(errors.get('recent') or [])
+            group_lists.append(errors.get('groups') or [])
+        
+        recent_errors.sort(key=lambda error: error['timestamp'])
         
         return {
-            'total_errors': len(self.error_logs),
+            'total_errors': total_errors,
             'error_types': error_types,
-            'recent_errors': self.error_logs[-10:]  # 10 dernières erreurs
+            'recent_errors': recent_errors[-10:],  # 10 dernières erreurs, tous workers
+            # Groupes par empreinte (type, message normalisé, site d'appel), les plus fréquents d'abord
+            'error_groups': ErrorGroups.merge(group_lists)[:20]
         }
     
+    def get_query_statistics(self, limit: int = 20, sort: str = 'total') -> Dict:
+        """
+        Requêtes SQL les plus coûteuses et requêtes lentes récentes, tous workers
+        
+        Args:
+            limit (int): Nombre de requêtes renvoyées
+            sort (str): Classement : total, p95, count ou rows
+            
+        Returns:
+            dict: Requêtes par empreinte (appels, temps total, p95, lignes) et requêtes lentes
+        """
+        exports = []
+        slow_lists = []
+        for snapshot, _ in self._worker_snapshots():
+            queries = snapshot.get('db_queries') or {}
+            exports.append(queries.get('shapes') or [])
+            slow_lists.append(queries.get('slow') or [])
+        
+        statistics = QueryShapes.merge(exports, slow_lists, limit=limit, sort=sort)
+        statistics['slow_threshold_ms'] = query_shapes.slow_ms
+        return statistics
+    
     def get_health_status(self) -> Dict:
         """
         Récupère le statut de santé de l'application
@@ -287,17 +519,26 @@ class MonitoringService:
             memory_ok = self.metrics.get('memory', {}).get('percent', 0) < 90
             disk_ok = self.metrics.get('disk', {}).get('percent', 0) < 90
             
-            # Vérifier les erreurs récentes
-            recent_errors = [
-                error for error in self.error_logs
-                if datetime.fromisoformat(error['timestamp']) > datetime.now() - timedelta(hours=1)
-            ]
+            # Vérifier les erreurs récentes (tous workers)
+            recent_errors_count = sum(
+                (snapshot.get('errors') or {}).get('last_hour', 0)
+                for snapshot, _ in self._worker_snapshots()
+            )
             
-            errors_ok = len(recent_errors) < 10  # Moins de 10 erreurs par heure
+            errors_ok = recent_errors_count < 10  # Moins de 10 erreurs par heure
             
-            if cpu_ok and memory_ok and disk_ok and errors_ok:
+            # Latence vue par les utilisateurs : objectifs SLO (dernière évaluation)
+            from src.services.slo_service import slo_service
+            slo_report = slo_service.last_report()
+            latency_ok = slo_report['status'] in ('ok', 'no_data')
+            
+            if cpu_ok and memory_ok and disk_ok and errors_ok and latency_ok:
                 status = 'healthy'
                 message = 'Application en bonne santé'
+            elif not latency_ok and cpu_ok and memory_ok and disk_ok:
+                status = 'critical' if slo_report['status'] == 'critical' else 'warning'
+                message = 'Objectifs de latence non tenus: ' + ', '.join(
+                    slo['name'] for slo in slo_report['slos'] if slo['status'] in ('warning', 'critical'))
             elif not errors_ok:
                 status = 'warning'
                 message = 'Trop d\'erreurs récentes'
@@ -312,9 +553,11 @@ class MonitoringService:
                     'cpu_ok': cpu_ok,
                     'memory_ok': memory_ok,
                     'disk_ok': disk_ok,
-                    'errors_ok': errors_ok
+                    'errors_ok': errors_ok,
+                    'latency_ok': latency_ok
                 },
-                'recent_errors_count': len(recent_errors)
+                'recent_errors_count': recent_errors_count,
+                'slo': {slo['name']: slo['status'] for slo in slo_report['slos']}
             }
             
         except Exception as e:
@@ -359,7 +602,12 @@ class MonitoringService:
         
         export_data = {
             'export_timestamp': datetime.now().isoformat(),
+            'workers': 1 + len(self._other_worker_snapshots()),
             'system_info': self.get_system_info(),
+            'db_queries': {
+                'shapes': query_shapes.export(SNAPSHOT_QUERY_SHAPES),
+                'slow': query_shapes.slow_queries(SNAPSHOT_SLOW_QUERIES)
+            },
             'current_metrics': self.metrics,
             'api_statistics': self.get_api_statistics(),
             'error_statistics': self.get_error_statistics(),
@@ -384,23 +632,21 @@ class MonitoringService:
         cutoff_time = datetime.now() - timedelta(days=days)
         
         # Effacer les anciennes métriques de performance
-        self.performance_data = [
-            metric for metric in self.performance_data
-            if datetime.fromisoformat(metric['timestamp']) > cutoff_time
-        ]
-        
-        # Effacer les anciens appels API
-        for endpoint in self.api_calls:
-            self.api_calls[endpoint] = [
-                call for call in self.api_calls[endpoint]
-                if datetime.fromisoformat(call['timestamp']) > cutoff_time
-            ]
+        self.collector.store.drop_before(cutoff_time.timestamp())
+        
+        # Oublier les endpoints inactifs (les fenêtres glissantes expirent d'elles-mêmes)
+        with self._api_lock:
+            self.api_calls = {
+                endpoint: calls for endpoint, calls in self.api_calls.items()
+                if calls['last_call'] and datetime.fromisoformat(calls['last_call']) > cutoff_time
+            }
         
         # Effacer les anciennes erreurs
-        self.error_logs = [
-            error for error in self.error_logs
-            if datetime.fromisoformat(error['timestamp']) > cutoff_time
-        ]
+        self.error_logs = deque(
+            (error for error in self.error_logs if datetime.fromisoformat(error['timestamp']) > cutoff_time),
+            maxlen=self.error_logs.maxlen
+        )
+        self.error_groups.drop_before(cutoff_time.timestamp())
         
         print(f"✅ Données de monitoring nettoyées (conservées: {days} jours)")
     
@@ -420,8 +666,9 @@ class MonitoringService:
         try:
             # Statistiques générales
             uptime_hours = (datetime.now() - self.start_time).total_seconds() / 3600
-            total_api_calls = sum(len(calls) for calls in self.api_calls.values())
-            total_errors = len(self.error_logs)
+            api_statistics = self.get_api_statistics()
+            total_api_calls = sum(calls['total_calls'] for calls in api_statistics.values())
+            total_errors = self.get_error_statistics().get('total_errors', 0)
             
             # Métriques actuelles
             current_cpu = self.metrics.get('cpu', {}).get('percent', 0)
@@ -430,14 +677,15 @@ class MonitoringService:
             
             # Endpoints les plus utilisés
             endpoint_usage = {}
-            for endpoint, calls in self.api_calls.items():
-                endpoint_usage[endpoint] = len(calls)
+            for endpoint, calls in api_statistics.items():
+                endpoint_usage[endpoint] = calls['total_calls']
             
             top_endpoints = sorted(endpoint_usage.items(), key=lambda x: x[1], reverse=True)[:5]
             
             return {
                 'monitoring_enabled': True,
                 'uptime_hours': round(uptime_hours, 2),
+                'workers': 1 + len(self._other_worker_snapshots()),
                 'total_api_calls': total_api_calls,
                 'total_errors': total_errors,
                 'current_metrics': {
@@ -455,4 +703,7 @@ class MonitoringService:
                 'monitoring_enabled': True,
                 'error': str(e),
                 'message': 'Erreur lors de la génération du rapport'
-            } 
\ No newline at end of file
+            }
+
+# Instance globale du monitoring
+monitoring_service = MonitoringService()
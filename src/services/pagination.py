@@ -0,0 +1,171 @@
+"""
+Pagination des listes pour AgroBizChat
+Pagination par curseur (keyset) sur des colonnes indexées, chargement sélectif des colonnes
+et réponses JSON produites au fil de la lecture pour les exports
+"""
+
+import json
+import base64
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from flask import Response, stream_with_context
+from sqlalchemy import DateTime, tuple_
+from sqlalchemy.orm import load_only
+
+# Champ de to_dict -> colonne JSON (valeur par défaut fournie par la méthode get_<champ>)
+JSON_FIELDS = {
+    'context': 'context',
+    'metadata': 'metadata_info',
+    'variables_used': 'variables_used'
+}
+# Lignes lues par aller-retour lors d'un export
+STREAM_BATCH_SIZE = 500
+
+def encode_cursor(values: Sequence) -> str:
+    """
+    Curseur opaque à partir des valeurs de tri de la dernière ligne
+
+    Args:
+        values (sequence): Valeurs des colonnes de tri (dates en ISO 8601)
+
+    Returns:
+        str: Curseur base64 utilisable dans une URL
+    """
+    raw = json.dumps([value.isoformat() if isinstance(value, datetime) else value for value in values])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor: str, columns: Sequence) -> Tuple:
+    """
+    Valeurs de tri d'un curseur, converties selon le type des colonnes
+
+    Args:
+        cursor (str): Curseur produit par encode_cursor
+        columns (sequence): Colonnes de tri
+
+    Returns:
+        tuple: Valeurs à comparer
+
+    Raises:
+        ValueError: Curseur invalide
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except Exception:
+        raise ValueError(f"Curseur invalide: {cursor}")
+    if not isinstance(values, list) or len(values) != len(columns):
+        raise ValueError(f"Curseur invalide: {cursor}")
+    return tuple(
+        datetime.fromisoformat(value) if isinstance(column.type, DateTime) and value is not None else value
+        for column, value in zip(columns, values)
+    )
+
+def parse_limit(value, default: int, maximum: int = 500) -> int:
+    """Taille de page demandée, bornée"""
+    try:
+        return max(1, min(int(value), maximum)) if value is not None else default
+    except (TypeError, ValueError):
+        return default
+
+def keyset_page(query, columns: Sequence, cursor: str = None, limit: int = 50,
+                descending: bool = True) -> Tuple[List, Optional[str]]:
+    """
+    Page suivant le curseur : WHERE (tri) < (curseur) ORDER BY tri LIMIT n
+
+    Contrairement à OFFSET, le coût ne dépend pas de la position dans la liste (parcours
+    d'index à partir du curseur) et une insertion ne décale pas les pages suivantes.
+
+    Args:
+        query: Query ORM (Model.query filtré)
+        columns (sequence): Colonnes de tri, la dernière unique (ex: created_at, id)
+        cursor (str): Curseur de la page précédente (None : première page)
+        limit (int): Lignes par page
+        descending (bool): Plus récents d'abord
+
+    Returns:
+        tuple: (lignes, curseur de la page suivante ou None)
+    """
+    if cursor:
+        values = decode_cursor(cursor, columns)
+        key = tuple_(*columns)
+        query = query.filter(key < tuple_(*values) if descending else key > tuple_(*values))
+    query = query.order_by(*[column.desc() if descending else column.asc() for column in columns])
+    rows = query.limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor([getattr(rows[-1], column.key) for column in columns])
+
+def field_options(model, fields: Optional[str], required: Sequence[str] = ('id',)) -> Tuple[list, Optional[List[str]]]:
+    """
+    Options de chargement pour ?fields=a,b : seules les colonnes demandées sont lues
+
+    Args:
+        model: Modèle SQLAlchemy
+        fields (str): Champs de to_dict séparés par des virgules (None : tous)
+        required (sequence): Colonnes toujours chargées (clé, colonnes de tri)
+
+    Returns:
+        tuple: (options de requête, liste des champs ou None)
+
+    Raises:
+        ValueError: Champ inconnu
+    """
+    if not fields:
+        return [], None
+    names = [name.strip() for name in fields.split(',') if name.strip()]
+    table_columns = model.__table__.columns
+    columns = []
+    for name in names:
+        column_name = JSON_FIELDS.get(name, name)
+        if column_name not in table_columns:
+            raise ValueError(f"Champ inconnu: {name}")
+        columns.append(column_name)
+    columns.extend(name for name in required if name not in columns)
+    return [load_only(*[getattr(model, name) for name in columns])], names
+
+def serialize(obj, fields: Optional[List[str]] = None) -> Dict:
+    """
+    Dictionnaire de to_dict, limité aux champs demandés sans lire les colonnes non chargées
+
+    Args:
+        obj: Instance de modèle
+        fields (list): Champs (None : to_dict complet)
+
+    Returns:
+        dict: Champs sérialisés
+    """
+    if fields is None:
+        return obj.to_dict()
+    data = {}
+    for name in fields:
+        if name in JSON_FIELDS:
+            value = getattr(obj, f'get_{name}')()
+        else:
+            value = getattr(obj, name)
+        data[name] = value.isoformat() if isinstance(value, datetime) else value
+    return data
+
+def stream_json(items: Iterable[Dict], key: str = None, **extra) -> Response:
+    """
+    Réponse JSON écrite au fil de la lecture (mémoire bornée quel que soit le nombre de lignes)
+
+    Args:
+        items (iterable): Dictionnaires à sérialiser (générateur sur une requête yield_per)
+        key (str): Clé de la liste dans l'objet renvoyé (None : tableau seul)
+        **extra: Autres clés de l'objet renvoyé
+
+    Returns:
+        Response: Réponse application/json
+    """
+    def generate():
+        if key is None:
+            yield '['
+        else:
+            header = json.dumps(extra)[:-1] if extra else '{'
+            yield f'{header}{", " if extra else ""}{json.dumps(key)}: ['
+        for index, item in enumerate(items):
+            yield (',' if index else '') + json.dumps(item)
+        yield ']' if key is None else ']}'
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
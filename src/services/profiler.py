@@ -0,0 +1,277 @@
+"""
+Profileur statistique à la demande pour AgroBizChat
+Échantillonne les piles des threads du worker pendant une durée bornée
+et produit un format "collapsed stacks" (flamegraph.pl, speedscope)
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Optional
+
+# Threads en train de servir une requête : {thread_id: environ WSGI}
+_active_requests = {}
+
+def request_started(environ):
+    """Associe le thread courant à sa requête (appelé par le middleware de mesure)"""
+    _active_requests[threading.get_ident()] = environ
+
+def request_finished():
+    """Libère l'association du thread courant"""
+    _active_requests.pop(threading.get_ident(), None)
+
+def _default_directory() -> str:
+    """Répertoire des résultats (PROFILER_DIR ou data/profiles)"""
+    directory = os.getenv('PROFILER_DIR')
+    if not directory:
+        project_root = Path(__file__).parent.parent.parent.resolve()
+        directory = str(project_root / "data" / "profiles")
+    return directory
+
+# Préfixes retirés des chemins (piles plus lisibles et plus compactes)
+_PATH_MARKERS = (
+    os.sep + 'site-packages' + os.sep,
+    os.sep + 'src' + os.sep,
+    os.sep + f"python{sys.version_info.major}.{sys.version_info.minor}" + os.sep
+)
+
+def _frame_label(frame) -> str:
+    """Libellé d'un cadre : module relatif au projet et fonction"""
+    code = frame.f_code
+    filename = code.co_filename
+    for marker in _PATH_MARKERS:
+        position = filename.rfind(marker)
+        if position != -1:
+            filename = filename[position + 1:]
+            break
+    return f"{filename}:{code.co_name}"
+
+class SamplingProfiler:
+    """Échantillonnage périodique de sys._current_frames(), une session à la fois par worker"""
+
+    def __init__(self, directory: str = None):
+        """
+        Initialise le profileur
+
+        Args:
+            directory (str): Répertoire partagé entre workers pour les résultats
+        """
+        self.directory = directory or _default_directory()
+        self.max_seconds = float(os.getenv('PROFILER_MAX_SECONDS', '60'))
+        self.min_interval_ms = float(os.getenv('PROFILER_MIN_INTERVAL_MS', '5'))
+        self.max_depth = int(os.getenv('PROFILER_MAX_DEPTH', '64'))
+        self.max_stacks = int(os.getenv('PROFILER_MAX_STACKS', '5000'))
+        self._lock = threading.Lock()
+        self._session = None
+
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+        except Exception as e:
+            print(f"Erreur création répertoire profils: {e}")
+
+    def _path(self, session_id: str, extension: str) -> str:
+        """Chemin d'un fichier de session"""
+        return os.path.join(self.directory, f"{session_id}.{extension}")
+
+    def start(self, duration: float = 10, interval_ms: float = 10, route: str = None,
+              requests_only: bool = False) -> Dict:
+        """
+        Lance une session d'échantillonnage en arrière-plan
+
+        Args:
+            duration (float): Durée en secondes (bornée par PROFILER_MAX_SECONDS)
+            interval_ms (float): Intervalle d'échantillonnage (borné par PROFILER_MIN_INTERVAL_MS)
+            route (str): Ne garder que les threads servant ce modèle de route
+            requests_only (bool): Ne garder que les threads servant une requête
+
+        Returns:
+            dict: Session créée, ou erreur si une session est déjà en cours
+        """
+        with self._lock:
+            if self._session is not None and self._session['status'] == 'running':
+                return {'success': False, 'error': 'Une session de profilage est déjà en cours',
+                        'session': dict(self._session)}
+
+            session = {
+                'id': uuid.uuid4().hex[:12],
+                'pid': os.getpid(),
+                'status': 'running',
+                'duration': min(max(float(duration), 0.1), self.max_seconds),
+                'interval_ms': max(float(interval_ms), self.min_interval_ms),
+                'route': route,
+                'requests_only': bool(requests_only or route),
+                'started_at': time.time(),
+                'samples': 0,
+                'stacks': 0
+            }
+            self._session = session
+
+        self._write_status(session)
+        threading.Thread(target=self._run, args=(session,), name='sampling-profiler', daemon=True).start()
+        return {'success': True, 'session': dict(session)}
+
+    def stop(self, session_id: str) -> bool:
+        """
+        Demande l'arrêt anticipé d'une session (quel que soit le worker qui l'exécute)
+
+        Args:
+            session_id (str): Identifiant de session
+
+        Returns:
+            bool: True si la session existe
+        """
+        if not session_id.isalnum() or not os.path.exists(self._path(session_id, 'json')):
+            return False
+        try:
+            Path(self._path(session_id, 'stop')).touch()
+            return True
+        except Exception as e:
+            print(f"Erreur arrêt profilage: {e}")
+            return False
+
+    def _keep_thread(self, thread_id: int, session: Dict) -> bool:
+        """Filtre des threads échantillonnés"""
+        if not session['requests_only']:
+            return True
+        environ = _active_requests.get(thread_id)
+        if environ is None:
+            return False
+        if session['route']:
+            from src.services.request_timing import ROUTE_ENVIRON_KEY
+            return environ.get(ROUTE_ENVIRON_KEY) == session['route']
+        return True
+
+    def _collapse(self, frame) -> str:
+        """Pile racine -> feuille, séparée par des ';'"""
+        labels = []
+        while frame is not None and len(labels) < self.max_depth:
+            labels.append(_frame_label(frame))
+            frame = frame.f_back
+        return ';'.join(reversed(labels))
+
+    def _run(self, session: Dict):
+        """Boucle d'échantillonnage"""
+        stacks = Counter()
+        own_thread = threading.get_ident()
+        interval = session['interval_ms'] / 1000
+        deadline = session['started_at'] + session['duration']
+        stop_path = self._path(session['id'], 'stop')
+        sampling_time = 0.0
+        next_stop_check = 0.0
+
+        try:
+            while time.time() < deadline:
+                tick = time.perf_counter()
+                # Les cadres ne sont pas conservés : seules les chaînes sont gardées
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == own_thread or not self._keep_thread(thread_id, session):
+                        continue
+                    stack = self._collapse(frame)
+                    if stack in stacks or len(stacks) < self.max_stacks:
+                        stacks[stack] += 1
+                    else:
+                        stacks['[pile tronquée]'] += 1
+                session['samples'] += 1
+                sampling_time += time.perf_counter() - tick
+
+                if time.time() >= next_stop_check:
+                    next_stop_check = time.time() + 0.5
+                    if os.path.exists(stop_path):
+                        session['status'] = 'stopped'
+                        break
+                time.sleep(interval)
+        except Exception as e:
+            session['status'] = 'failed'
+            session['error'] = str(e)
+            print(f"Erreur profilage: {e}")
+
+        if session['status'] == 'running':
+            session['status'] = 'done'
+        session['finished_at'] = time.time()
+        session['stacks'] = len(stacks)
+        session['thread_samples'] = sum(stacks.values())
+        elapsed = session['finished_at'] - session['started_at']
+        session['overhead_pct'] = round(sampling_time * 100 / elapsed, 3) if elapsed else 0.0
+
+        try:
+            with open(self._path(session['id'], 'collapsed'), 'w', encoding='utf-8') as f:
+                for stack, count in stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            if os.path.exists(stop_path):
+                os.remove(stop_path)
+        except Exception as e:
+            print(f"Erreur écriture profil: {e}")
+        self._write_status(session)
+
+    def _write_status(self, session: Dict):
+        """Publie l'état de la session pour tous les workers"""
+        tmp_path = self._path(session['id'], f"json.{os.getpid()}.tmp")
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(session, f)
+            os.replace(tmp_path, self._path(session['id'], 'json'))
+        except Exception as e:
+            print(f"Erreur écriture état profilage: {e}")
+
+    def get_session(self, session_id: str) -> Optional[Dict]:
+        """
+        État d'une session (lu depuis le répertoire partagé)
+
+        Args:
+            session_id (str): Identifiant de session
+
+        Returns:
+            dict: État de la session ou None
+        """
+        if not session_id.isalnum():
+            return None
+        try:
+            with open(self._path(session_id, 'json'), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def get_collapsed(self, session_id: str) -> Optional[str]:
+        """
+        Résultat au format collapsed stacks ("cadre;cadre;cadre nombre" par ligne)
+
+        Args:
+            session_id (str): Identifiant de session
+
+        Returns:
+            str: Contenu, ou None si la session n'est pas terminée
+        """
+        if not session_id.isalnum():
+            return None
+        try:
+            with open(self._path(session_id, 'collapsed'), 'r', encoding='utf-8') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def top_functions(self, session_id: str, limit: int = 20) -> list:
+        """
+        Fonctions les plus échantillonnées en feuille de pile (temps propre)
+
+        Args:
+            session_id (str): Identifiant de session
+            limit (int): Nombre de fonctions
+
+        Returns:
+            list: Couples (fonction, échantillons)
+        """
+        collapsed = self.get_collapsed(session_id) or ''
+        leaves = Counter()
+        for line in collapsed.splitlines():
+            stack, _, count = line.rpartition(' ')
+            if stack:
+                leaves[stack.rsplit(';', 1)[-1]] += int(count)
+        return leaves.most_common(limit)
+
+# Instance globale du profileur
+sampling_profiler = SamplingProfiler()
@@ -0,0 +1,117 @@
+"""
+Middleware WSGI de mesure des requêtes pour AgroBizChat
+Chronomètre toutes les requêtes de l'application, quel que soit le blueprint
+"""
+
+import time
+from typing import Callable, Iterable
+
+from src.services.metrics_registry import metrics_registry
+from src.services.monitoring_service import monitoring_service
+from src.services.profiler import request_started, request_finished
+
+# Clé d'environ WSGI renseignée par Flask avec le modèle de route (/api/user/<int:id>)
+ROUTE_ENVIRON_KEY = 'agrobiz.route'
+UNMATCHED_ROUTE = 'unmatched'
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+http_request_duration = metrics_registry.histogram(
+    'http_request_duration_seconds', 'Durée des requêtes HTTP par route', ['route', 'method', 'status'])
+http_request_size = metrics_registry.histogram(
+    'http_request_size_bytes', 'Taille des corps de requête HTTP', ['route', 'method'], buckets=SIZE_BUCKETS)
+http_response_size = metrics_registry.histogram(
+    'http_response_size_bytes', 'Taille des réponses HTTP', ['route', 'method'], buckets=SIZE_BUCKETS)
+http_requests_in_flight = metrics_registry.gauge('http_requests_in_flight', 'Requêtes HTTP en cours')
+
+def stamp_route(request):
+    """
+    Mémorise le modèle de route dans l'environ (à appeler dans before_request)
+
+    Args:
+        request: Requête Flask courante
+    """
+    if request.url_rule is not None:
+        request.environ[ROUTE_ENVIRON_KEY] = request.url_rule.rule
+
+class _TimedResponse:
+    """Itérable de réponse qui compte les octets et enregistre la mesure à la fermeture"""
+
+    def __init__(self, iterable: Iterable, on_close: Callable[[int], None]):
+        self._iterable = iterable
+        self._on_close = on_close
+        self._bytes = 0
+
+    def __iter__(self):
+        for chunk in self._iterable:
+            self._bytes += len(chunk)
+            yield chunk
+
+    def close(self):
+        try:
+            if hasattr(self._iterable, 'close'):
+                self._iterable.close()
+        finally:
+            self._on_close(self._bytes)
+
+class RequestTimingMiddleware:
+    """Mesure durée, statut et tailles de chaque requête au niveau WSGI"""
+
+    def __init__(self, wsgi_app, monitoring=None):
+        """
+        Enveloppe l'application WSGI
+
+        Args:
+            wsgi_app: Application WSGI (app.wsgi_app)
+            monitoring (MonitoringService): Destination des statistiques par endpoint
+        """
+        self.wsgi_app = wsgi_app
+        self.monitoring = monitoring or monitoring_service
+
+    def _record(self, environ, status: str, start_time: float, response_bytes: int):
+        """Enregistre la requête terminée"""
+        elapsed = time.perf_counter() - start_time
+        route = environ.get(ROUTE_ENVIRON_KEY, UNMATCHED_ROUTE)
+        method = environ.get('REQUEST_METHOD', 'GET')
+        status_code = int(status.split(' ', 1)[0]) if status else 500
+        try:
+            request_bytes = int(environ.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            request_bytes = 0
+
+        request_finished()
+        http_requests_in_flight.dec()
+        http_request_duration.observe(elapsed, route=route, method=method, status=status_code)
+        http_request_size.observe(request_bytes, route=route, method=method)
+        http_response_size.observe(response_bytes, route=route, method=method)
+        self.monitoring.log_api_call(route, method, status_code, elapsed,
+                                     request_bytes=request_bytes, response_bytes=response_bytes)
+
+    def __call__(self, environ, start_response):
+        start_time = time.perf_counter()
+        http_requests_in_flight.inc()
+        # Permet au profileur de filtrer les threads par route
+        request_started(environ)
+        response_status = []
+        content_length = []
+
+        def timed_start_response(status, headers, exc_info=None):
+            response_status[:] = [status]
+            content_length[:] = [value for name, value in headers if name.lower() == 'content-length']
+            return start_response(status, headers, exc_info)
+
+        try:
+            iterable = self.wsgi_app(environ, timed_start_response)
+        except Exception:
+            self._record(environ, '500 INTERNAL SERVER ERROR', start_time, 0)
+            raise
+
+        def finish(counted_bytes: int):
+            self._record(environ, response_status[0] if response_status else '', start_time, counted_bytes)
+
+        # Fichiers servis par sendfile : ne pas envelopper pour garder l'optimisation du serveur
+        file_wrapper = environ.get('wsgi.file_wrapper')
+        if isinstance(file_wrapper, type) and isinstance(iterable, file_wrapper):
+            finish(int(content_length[0]) if content_length else 0)
+            return iterable
+
+        return _TimedResponse(iterable, finish)
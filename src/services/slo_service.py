@@ -0,0 +1,374 @@
+"""
+Objectifs de latence (SLO) pour AgroBizChat
+Évaluation continue des histogrammes du monitoring par taux de consommation
+du budget d'erreur sur plusieurs fenêtres, alertes vers des sorties configurables
+"""
+
+import os
+import json
+import time
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List
+
+import requests
+
+try:
+    import fcntl
+except ImportError:  # Windows : pas de verrou, chaque processus alerte
+    fcntl = None
+
+from src.services.monitoring_service import monitoring_service
+from src.services.latency_histogram import LatencyHistogram, SlidingWindowHistogram
+
+# Objectifs par défaut : "95% des requêtes sous le seuil" = p95 < seuil
+DEFAULT_SLOS = [
+    {
+        'name': 'webhook_latency',
+        'description': 'Webhook WhatsApp : p95 < 500 ms',
+        'endpoints': ['/webhook/whatsapp'],
+        'threshold_ms': 500,
+        'objective': 95.0
+    },
+    {
+        'name': 'plan_delivery_latency',
+        'description': 'Livraison du business plan (Gemini + envoi) : p95 < 60 s',
+        'endpoints': ['/webhook/whatsapp-gemini', '/api/chatbot/whatsapp-gemini'],
+        'threshold_ms': 60000,
+        'objective': 95.0
+    }
+]
+
+# Règles multi-fenêtres : la fenêtre longue mesure l'ampleur, la courte confirme que
+# le problème est toujours en cours (l'alerte retombe vite après la correction).
+# Les fenêtres sont celles des histogrammes glissants du monitoring (1h au plus).
+DEFAULT_RULES = [
+    {'name': 'fast_burn', 'long': '1h', 'short': '5m', 'burn_rate': 14.4, 'severity': 'critical'},
+    {'name': 'slow_burn', 'long': '1h', 'short': '15m', 'burn_rate': 6.0, 'severity': 'warning'}
+]
+
+SEVERITY_ORDER = {'ok': 0, 'no_data': 0, 'warning': 1, 'critical': 2}
+
+def _data_path(filename: str) -> str:
+    """Chemin d'un fichier du répertoire data/"""
+    project_root = Path(__file__).parent.parent.parent.resolve()
+    return str(project_root / "data" / filename)
+
+class LogAlertSink:
+    """Écrit les alertes dans la sortie du worker"""
+
+    def send(self, alert: Dict):
+        icon = '✅' if alert['status'] == 'resolved' else '🚨'
+        print(f"{icon} SLO {alert['slo']} {alert['status']} ({alert['severity']}): {alert['message']}")
+
+class FileAlertSink:
+    """Ajoute les alertes à un fichier JSONL (stand-in local d'un gestionnaire d'alertes)"""
+
+    def __init__(self, path: str = None):
+        self.path = path or os.getenv('SLO_ALERT_FILE') or _data_path('alerts.jsonl')
+        self._lock = threading.Lock()
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        except Exception as e:
+            print(f"Erreur création répertoire alertes: {e}")
+
+    def send(self, alert: Dict):
+        line = json.dumps(alert, ensure_ascii=False, default=str) + '\n'
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+
+class WebhookAlertSink:
+    """Envoie les alertes en JSON à une URL (Slack, Alertmanager, serveur de test...)"""
+
+    def __init__(self, url: str = None, timeout: float = None):
+        self.url = url or os.getenv('SLO_ALERT_WEBHOOK_URL')
+        self.timeout = timeout if timeout is not None else float(os.getenv('SLO_ALERT_WEBHOOK_TIMEOUT', '5'))
+
+    def send(self, alert: Dict):
+        if not self.url:
+            return
+        response = requests.post(self.url, json=alert, timeout=self.timeout)
+        response.raise_for_status()
+
+_SINK_TYPES = {
+    'log': LogAlertSink,
+    'file': FileAlertSink,
+    'webhook': WebhookAlertSink
+}
+
+def _load_config() -> Dict:
+    """Configuration SLO_CONFIG : JSON en ligne ou chemin d'un fichier JSON"""
+    raw = os.getenv('SLO_CONFIG', '').strip()
+    if not raw:
+        return {}
+    try:
+        if not raw.startswith('{'):
+            with open(raw, 'r', encoding='utf-8') as f:
+                raw = f.read()
+        return json.loads(raw)
+    except Exception as e:
+        print(f"Erreur lecture configuration SLO: {e}")
+        return {}
+
+class SLOService:
+    """Évalue les SLO de latence et publie les changements d'état vers les sorties"""
+
+    def __init__(self, slos: List[Dict] = None, rules: List[Dict] = None, sinks: List = None,
+                 monitoring=None, interval: float = None):
+        """
+        Initialise le service
+
+        Args:
+            slos (list): Objectifs {name, endpoints, threshold_ms, objective, count_errors}
+            rules (list): Règles {name, long, short, burn_rate, severity}
+            sinks (list): Sorties d'alertes (objets avec une méthode send(alert))
+            monitoring (MonitoringService): Source des histogrammes (défaut: instance globale)
+            interval (float): Secondes entre deux évaluations (SLO_EVAL_INTERVAL)
+        """
+        config = _load_config()
+        self.slos = [self._normalize(slo) for slo in (slos or config.get('slos') or DEFAULT_SLOS)]
+        self.rules = list(rules or config.get('rules') or DEFAULT_RULES)
+        if sinks is None:
+            names = os.getenv('SLO_ALERT_SINKS', 'log,file')
+            sinks = [_SINK_TYPES[name.strip()]() for name in names.split(',') if name.strip() in _SINK_TYPES]
+        self.sinks = list(sinks)
+        self.monitoring = monitoring or monitoring_service
+        self.interval = interval if interval is not None else float(os.getenv('SLO_EVAL_INTERVAL', '30'))
+        # Sous ce volume, une fenêtre ne déclenche rien (une requête lente sur deux n'est pas un incident)
+        self.min_events = int(os.getenv('SLO_MIN_EVENTS', '10'))
+        self.lock_path = _data_path('slo.lock')
+        self._window_seconds = dict(SlidingWindowHistogram.DEFAULT_WINDOWS)
+        self._states = {}
+        self._last_report = None
+        self._lock_file = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._pid = os.getpid()
+
+    @staticmethod
+    def _normalize(slo: Dict) -> Dict:
+        """Valeurs par défaut d'un objectif"""
+        return {
+            'description': '',
+            'objective': 95.0,
+            'count_errors': True,
+            **slo,
+            'endpoints': list(slo.get('endpoints') or [])
+        }
+
+    def add_sink(self, sink):
+        """
+        Ajoute une sortie d'alertes
+
+        Args:
+            sink: Objet avec une méthode send(alert: dict)
+        """
+        self.sinks.append(sink)
+
+    def _window_status(self, slo: Dict, histogram, errors: int) -> Dict:
+        """Part de requêtes hors objectif et taux de consommation du budget sur une fenêtre"""
+        total = histogram.count
+        bad = histogram.count_above(slo['threshold_ms'])
+        if slo['count_errors']:
+            # Une erreur 5xx lente est comptée deux fois : majoré par le total
+            bad = min(total, bad + errors)
+        budget = 1 - slo['objective'] / 100.0
+        bad_ratio = bad / total if total else 0.0
+        percentile = histogram.percentile(slo['objective'])
+        return {
+            'total': total,
+            'bad': bad,
+            'bad_ratio': round(bad_ratio, 4),
+            'burn_rate': round(bad_ratio / budget, 3) if budget > 0 else None,
+            # Percentile de l'objectif (p95 pour 95%)
+            'percentile_ms': round(percentile, 3) if percentile is not None else None
+        }
+
+    def evaluate_slo(self, slo: Dict) -> Dict:
+        """
+        Évalue un objectif sur toutes les fenêtres et applique les règles
+
+        Args:
+            slo (dict): Objectif normalisé
+
+        Returns:
+            dict: Fenêtres, règles déclenchées et statut (ok, warning, critical, no_data)
+        """
+        merged = self.monitoring.get_latency_windows(slo['endpoints'])
+        windows = {}
+        for label in self._window_seconds:
+            histogram, errors = merged.get(label) or (LatencyHistogram(), 0)
+            windows[label] = self._window_status(slo, histogram, errors)
+
+        firing = []
+        for rule in self.rules:
+            long_window = windows.get(rule['long'])
+            short_window = windows.get(rule['short'])
+            if not long_window or not short_window:
+                continue
+            if all(window['total'] >= self.min_events and window['burn_rate'] is not None
+                   and window['burn_rate'] >= rule['burn_rate'] for window in (long_window, short_window)):
+                firing.append(rule)
+
+        if firing:
+            rule = max(firing, key=lambda rule: SEVERITY_ORDER.get(rule['severity'], 0))
+            status = rule['severity']
+        else:
+            rule = None
+            status = 'ok' if any(window['total'] for window in windows.values()) else 'no_data'
+
+        return {
+            'name': slo['name'],
+            'description': slo['description'],
+            'threshold_ms': slo['threshold_ms'],
+            'objective': slo['objective'],
+            'status': status,
+            'rule': rule['name'] if rule else None,
+            'firing_rules': [rule['name'] for rule in firing],
+            'windows': windows
+        }
+
+    def evaluate(self, dispatch: bool = False) -> Dict:
+        """
+        Évalue tous les objectifs
+
+        Args:
+            dispatch (bool): Envoyer les alertes sur changement d'état
+
+        Returns:
+            dict: Statut global et détail par objectif
+        """
+        results = [self.evaluate_slo(slo) for slo in self.slos]
+        status = 'no_data' if all(result['status'] == 'no_data' for result in results) else 'ok'
+        for result in results:
+            if SEVERITY_ORDER.get(result['status'], 0) > SEVERITY_ORDER[status]:
+                status = result['status']
+
+        report = {
+            'status': status,
+            'evaluated_at': datetime.now().isoformat(),
+            'slos': results
+        }
+        self._last_report = (time.time(), report)
+
+        if dispatch:
+            for result in results:
+                self._transition(result)
+        return report
+
+    def last_report(self, max_age: float = None) -> Dict:
+        """
+        Dernière évaluation si elle est récente, sinon nouvelle évaluation (sans alerte)
+
+        Args:
+            max_age (float): Ancienneté acceptée en secondes (défaut: intervalle d'évaluation)
+
+        Returns:
+            dict: Résultat de evaluate()
+        """
+        max_age = self.interval if max_age is None else max_age
+        if self._last_report is not None and time.time() - self._last_report[0] <= max_age:
+            return self._last_report[1]
+        return self.evaluate()
+
+    def _transition(self, result: Dict):
+        """Alerte quand un objectif change de sévérité (déclenchement, aggravation, résolution)"""
+        previous = self._states.get(result['name'], 'ok')
+        current = result['status'] if result['status'] in ('warning', 'critical') else 'ok'
+        if current == previous:
+            return
+        self._states[result['name']] = current
+
+        long_window = next((rule['long'] for rule in self.rules if rule['name'] == result['rule']), '1h')
+        window = result['windows'].get(long_window) or {}
+        if current == 'ok':
+            message = f"{result['description'] or result['name']} : retour dans l'objectif"
+        else:
+            message = (f"{result['description'] or result['name']} : {window.get('bad_ratio', 0) * 100:.1f}% "
+                       f"des requêtes hors objectif sur {long_window} "
+                       f"(consommation du budget x{window.get('burn_rate')})")
+        self.dispatch({
+            'slo': result['name'],
+            'status': 'resolved' if current == 'ok' else 'firing',
+            'severity': previous if current == 'ok' else current,
+            'rule': result['rule'],
+            'message': message,
+            'windows': result['windows'],
+            'pid': os.getpid(),
+            'timestamp': datetime.now().isoformat()
+        })
+
+    def dispatch(self, alert: Dict):
+        """
+        Envoie une alerte à toutes les sorties (une sortie en échec n'empêche pas les autres)
+
+        Args:
+            alert (dict): Alerte sérialisable
+        """
+        for sink in self.sinks:
+            try:
+                sink.send(alert)
+            except Exception as e:
+                print(f"Erreur envoi alerte SLO ({type(sink).__name__}): {e}")
+
+    def is_leader(self) -> bool:
+        """
+        Un seul worker envoie les alertes : celui qui détient le verrou (réélu si il disparaît)
+
+        Returns:
+            bool: True si le processus courant alerte
+        """
+        if self._lock_file is not None:
+            return True
+        if fcntl is None:
+            self._lock_file = True
+            return True
+        try:
+            os.makedirs(os.path.dirname(self.lock_path), exist_ok=True)
+            lock_file = open(self.lock_path, 'a')
+        except Exception as e:
+            print(f"Erreur verrou SLO: {e}")
+            return False
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def start(self) -> bool:
+        """
+        Démarre l'évaluation continue en arrière-plan (une fois par processus)
+
+        Returns:
+            bool: True si un thread a été lancé
+        """
+        if self._pid != os.getpid():
+            # Processus forké : ni le thread ni le verrou ne sont hérités
+            self._pid = os.getpid()
+            self._lock_file = None
+            self._thread = None
+            self._stop = threading.Event()
+        if self._thread is not None and self._thread.is_alive():
+            return False
+        self._thread = threading.Thread(target=self._loop, name='slo-evaluator', daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        """Arrête l'évaluation continue"""
+        self._stop.set()
+
+    def _loop(self):
+        """Évalue à intervalle fixe ; seul le worker détenteur du verrou alerte"""
+        while not self._stop.wait(self.interval):
+            try:
+                self.evaluate(dispatch=self.is_leader())
+            except Exception as e:
+                print(f"Erreur évaluation SLO: {e}")
+
+# Instance globale du service SLO
+slo_service = SLOService()
@@ -0,0 +1,210 @@
+"""
+Compteurs du tableau de bord admin pour AgroBizChat
+Une ligne par statistique dans stat_counters, ajustée dans la transaction de chaque écriture :
+la lecture des statistiques ne parcourt plus les tables
+"""
+
+import os
+import threading
+from datetime import datetime
+from typing import Dict
+
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from src.models.database import (db, User, Conversation, BusinessPlan, Message, BusinessPlanTemplate,
+                                 CompanyData, AIConfiguration, ArchiveSegment, StatCounter)
+
+# Compteur -> (modèle, colonne filtrée, valeur comptée) ; colonne None : toutes les lignes
+COUNTERS = {
+    'total_users': (User, None, None),
+    'active_users': (User, 'is_active', True),
+    'total_conversations': (Conversation, None, None),
+    'active_conversations': (Conversation, 'status', 'active'),
+    'total_business_plans': (BusinessPlan, None, None),
+    # Messages archivés inclus : l'archivage ne modifie pas ce total
+    'total_messages': (Message, None, None),
+    'total_templates': (BusinessPlanTemplate, None, None),
+    'active_templates': (BusinessPlanTemplate, 'is_active', True),
+    'total_companies': (CompanyData, None, None),
+    'ai_configurations': (AIConfiguration, 'is_active', True),
+}
+# Tenu par l'archivage (src/services/archive_service.py)
+ARCHIVED_MESSAGES = 'archived_messages'
+
+class StatCounters:
+    """Deltas calculés au flush de la session (ou passés par les écritures SQL directes), recomptage à la demande"""
+
+    def __init__(self):
+        self._tracked = {}
+        for name, (model, column, value) in COUNTERS.items():
+            self._tracked.setdefault(model, []).append((name, column, value))
+            if column is not None:
+                # Ancienne valeur chargée avant modification : une colonne expirée après commit a quand même un historique
+                attribute = getattr(model, column)
+                if not event.contains(attribute, 'set', _load_previous):
+                    event.listen(attribute, 'set', _load_previous, active_history=True)
+        self._lock = threading.Lock()
+        # URL du moteur -> table stat_counters présente
+        self._available = {}
+
+        if not event.contains(Session, 'before_flush', _collect_deltas):
+            event.listen(Session, 'before_flush', _collect_deltas)
+            event.listen(Session, 'after_flush', _apply_deltas)
+            event.listen(Session, 'after_soft_rollback', _discard_deltas)
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._available.clear)
+
+    def flush_deltas(self, session) -> Dict[str, int]:
+        """
+        Deltas des compteurs pour les objets ajoutés, supprimés ou modifiés de la session
+
+        Args:
+            session: Session SQLAlchemy avant le flush
+
+        Returns:
+            dict: Compteur -> variation (non nulle)
+        """
+        deltas = {}
+
+        def add(name, delta):
+            if delta:
+                deltas[name] = deltas.get(name, 0) + delta
+
+        for objects, sign in ((session.new, 1), (session.deleted, -1)):
+            for obj in objects:
+                for name, column, value in self._tracked.get(type(obj), ()):
+                    add(name, sign if column is None or self._value(obj, column) == value else 0)
+
+        for obj in session.dirty:
+            for name, column, value in self._tracked.get(type(obj), ()):
+                if column is None:
+                    continue
+                history = inspect(obj).attrs[column].history
+                if not history.added:
+                    continue
+                before = history.deleted[0] if history.deleted else None
+                add(name, int(history.added[0] == value) - int(before == value))
+        return deltas
+
+    @staticmethod
+    def _value(obj, column: str):
+        """Valeur de la colonne, défaut du modèle pour un objet pas encore inséré"""
+        current = getattr(obj, column)
+        if current is None and not inspect(obj).persistent:
+            default = obj.__table__.c[column].default
+            if default is not None and default.is_scalar:
+                return default.arg
+        return current
+
+    def increment(self, connection, deltas: Dict[str, int]):
+        """
+        Ajuste les compteurs dans la transaction en cours (écritures hors ORM : upserts, insertions par lot)
+
+        Args:
+            connection: Connection, Session ou scoped_session (db.session) de la transaction
+            deltas (dict): Compteur -> variation
+        """
+        deltas = {name: delta for name, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        if not isinstance(connection, Connection):
+            # Session ou scoped_session (db.session) : connexion de la transaction en cours
+            connection = connection.connection()
+        if not self._is_available(connection):
+            return
+        table = StatCounter.__table__
+        now = datetime.utcnow()
+        for name, delta in sorted(deltas.items()):
+            # Compteur absent (base jamais recomptée) : ignoré, le prochain get_all recompte
+            connection.execute(
+                table.update().where(table.c.name == name).values(value=table.c.value + delta, updated_at=now)
+            )
+
+    def _is_available(self, connection) -> bool:
+        """Table stat_counters présente sur cette base (vérifié une fois par moteur)"""
+        url = str(connection.engine.url)
+        with self._lock:
+            if url not in self._available:
+                self._available[url] = inspect(connection).has_table(StatCounter.__tablename__)
+            return self._available[url]
+
+    def get_all(self, exact: bool = False, engine=None) -> Dict[str, int]:
+        """
+        Valeurs des compteurs (une lecture de quelques lignes)
+
+        Args:
+            exact (bool): Recompter les tables et corriger les compteurs
+            engine: Moteur SQLAlchemy (défaut: db.engine)
+
+        Returns:
+            dict: Compteur -> valeur
+        """
+        engine = engine if engine is not None else db.engine
+        if exact:
+            return self.recount(engine)
+        with engine.connect() as conn:
+            values = dict(conn.execute(select(StatCounter.__table__.c.name, StatCounter.__table__.c.value)).all())
+        if any(name not in values for name in list(COUNTERS) + [ARCHIVED_MESSAGES]):
+            # Première lecture (base créée par create_all) : compteurs initialisés par un recomptage
+            return self.recount(engine)
+        return values
+
+    def recount(self, engine=None) -> Dict[str, int]:
+        """
+        Recompte toutes les statistiques (COUNT(*) par table) et remplace les compteurs
+
+        Args:
+            engine: Moteur SQLAlchemy (défaut: db.engine)
+
+        Returns:
+            dict: Compteur -> valeur exacte
+        """
+        engine = engine if engine is not None else db.engine
+        table = StatCounter.__table__
+        segment = ArchiveSegment.__table__
+        now = datetime.utcnow()
+        with engine.begin() as conn:
+            # Verrou d'écriture pris avant de compter : une écriture concurrente attend la fin
+            # du recomptage puis ajoute son delta à la valeur exacte
+            conn.execute(table.update().values(updated_at=now))
+            existing = set(conn.execute(select(table.c.name)).scalars())
+            values = {}
+            for name, (model, column, value) in COUNTERS.items():
+                query = select(func.count()).select_from(model.__table__)
+                if column is not None:
+                    query = query.where(model.__table__.c[column] == value)
+                values[name] = conn.execute(query).scalar()
+            values[ARCHIVED_MESSAGES] = conn.execute(
+                select(func.coalesce(func.sum(segment.c.row_count), 0)).where(segment.c.table_name == 'messages')
+            ).scalar()
+            values['total_messages'] += values[ARCHIVED_MESSAGES]
+
+            for name, value in values.items():
+                if name in existing:
+                    conn.execute(table.update().where(table.c.name == name).values(value=value))
+                else:
+                    conn.execute(table.insert().values(name=name, value=value, updated_at=now))
+        with self._lock:
+            self._available[str(engine.url)] = True
+        return values
+
+def _load_previous(target, value, oldvalue, initiator):
+    """Écouteur vide : active_history=True suffit à charger l'ancienne valeur"""
+
+def _collect_deltas(session, flush_context, instances):
+    """Avant le flush : variations des compteurs (valeurs précédentes encore accessibles)"""
+    session.info['stat_deltas'] = stat_counters.flush_deltas(session)
+
+def _apply_deltas(session, flush_context):
+    """Après le flush : compteurs ajustés dans la même transaction que les lignes"""
+    deltas = session.info.pop('stat_deltas', None)
+    if deltas:
+        stat_counters.increment(session.connection(), deltas)
+
+def _discard_deltas(session, previous_transaction):
+    session.info.pop('stat_deltas', None)
+
+# Instance globale des compteurs de statistiques
+stat_counters = StatCounters()
@@ -0,0 +1,229 @@
+"""
+Collecteur de métriques système et processus pour AgroBizChat
+Mesures non bloquantes stockées dans des séries de taille fixe, un collecteur par worker
+"""
+
+import gc
+import os
+import time
+import threading
+from datetime import datetime
+from typing import Callable, Dict, List, Sequence
+
+import psutil
+
+from src.services.timeseries_store import TimeSeriesStore
+
+HOST_FIELDS = (
+    'timestamp', 'cpu_percent', 'memory_percent', 'memory_used_gb', 'memory_total_gb',
+    'disk_percent', 'disk_used_gb', 'disk_total_gb', 'net_bytes_sent', 'net_bytes_recv'
+)
+PROCESS_FIELDS = (
+    'uptime_seconds', 'process_cpu_percent', 'process_rss_mb', 'process_threads', 'process_open_fds',
+    'gc_gen0', 'gc_gen1', 'gc_gen2', 'gc_collections', 'db_connections', 'db_connections_checked_out'
+)
+FIELDS = HOST_FIELDS + PROCESS_FIELDS
+# Compteurs cumulés : les agrégats gardent la dernière valeur plutôt que la moyenne
+CUMULATIVE_FIELDS = ('net_bytes_sent', 'net_bytes_recv', 'uptime_seconds', 'gc_collections')
+CPU_COUNT = psutil.cpu_count()
+
+def row_to_metrics(row: Sequence[float]) -> Dict:
+    """
+    Convertit un échantillon au format historique de MonitoringService
+
+    Args:
+        row (sequence): Valeurs dans l'ordre de FIELDS
+
+    Returns:
+        dict: Métriques hôte (cpu, memory, disk, network) et processus
+    """
+    values = dict(zip(FIELDS, row))
+    return {
+        'timestamp': datetime.fromtimestamp(values['timestamp']).isoformat(),
+        'cpu': {
+            'percent': values['cpu_percent'],
+            'count': CPU_COUNT
+        },
+        'memory': {
+            'percent': values['memory_percent'],
+            'used_gb': values['memory_used_gb'],
+            'total_gb': values['memory_total_gb']
+        },
+        'disk': {
+            'percent': values['disk_percent'],
+            'used_gb': values['disk_used_gb'],
+            'total_gb': values['disk_total_gb']
+        },
+        'network': {
+            'bytes_sent': int(values['net_bytes_sent']),
+            'bytes_recv': int(values['net_bytes_recv'])
+        },
+        'process': {
+            'pid': os.getpid(),
+            'cpu_percent': values['process_cpu_percent'],
+            'rss_mb': values['process_rss_mb'],
+            'threads': int(values['process_threads']),
+            'open_fds': int(values['process_open_fds']),
+            'gc_counts': [int(values['gc_gen0']), int(values['gc_gen1']), int(values['gc_gen2'])],
+            'gc_collections': int(values['gc_collections']),
+            'db_connections': int(values['db_connections']),
+            'db_connections_checked_out': int(values['db_connections_checked_out'])
+        },
+        'uptime_seconds': values['uptime_seconds']
+    }
+
+class SystemCollector:
+    """Collecte périodique en arrière-plan, redémarrée dans chaque processus forké"""
+
+    def __init__(self, interval: float = None, capacity: int = None, on_sample: Callable[[Dict], None] = None,
+                 store: TimeSeriesStore = None):
+        """
+        Initialise le collecteur
+
+        Args:
+            interval (float): Secondes entre deux mesures (MONITORING_INTERVAL)
+            capacity (int): Points conservés par résolution (MONITORING_HISTORY_SIZE)
+            on_sample (callable): Appelé avec chaque mesure au format row_to_metrics()
+            store (TimeSeriesStore): Séries de destination (défaut: data/timeseries/system.*)
+        """
+        self.interval = interval if interval is not None else float(os.getenv('MONITORING_INTERVAL', '60'))
+        capacity = capacity if capacity is not None else int(os.getenv('MONITORING_HISTORY_SIZE', '1440'))
+        # Brut, 1m, 10m, 1h : 24h de mesures brutes à 60s, 60 jours en agrégats horaires
+        self.store = store if store is not None else TimeSeriesStore(
+            'system', FIELDS, capacity=capacity, cumulative_fields=CUMULATIVE_FIELDS)
+        self.on_sample = on_sample
+        self.disk_path = os.getenv('MONITORING_DISK_PATH', '/')
+        self._started = False
+        self._reset()
+
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _reset(self):
+        """État propre au processus courant"""
+        self._pid = os.getpid()
+        self._process = psutil.Process(self._pid)
+        self._process_start = time.time()
+        self._stop = threading.Event()
+        self._thread = None
+        # cpu_percent(interval=None) mesure depuis l'appel précédent : premier appel de référence
+        try:
+            psutil.cpu_percent(interval=None)
+            self._process.cpu_percent(interval=None)
+        except Exception:
+            pass
+
+    def _after_fork(self):
+        """Dans le worker forké : nouvelles références psutil et nouveau thread"""
+        was_started = self._started
+        self._started = False
+        self._reset()
+        self.store.after_fork()
+        if was_started:
+            self.start()
+
+    def start(self) -> bool:
+        """
+        Démarre la collecte en arrière-plan (une fois par processus)
+
+        Returns:
+            bool: True si un thread a été lancé
+        """
+        if self._pid != os.getpid():
+            self._reset()
+            self.store.after_fork()
+        if self._thread is not None and self._thread.is_alive():
+            return False
+        self._started = True
+        self._thread = threading.Thread(target=self._loop, name='system-collector', daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        """Arrête la collecte"""
+        self._started = False
+        self._stop.set()
+
+    def _loop(self):
+        """Mesure à intervalle fixe (première mesure après une seconde, base du calcul CPU)"""
+        self._stop.wait(min(1.0, self.interval))
+        while not self._stop.is_set():
+            try:
+                metrics = self.collect()
+                if self.on_sample:
+                    self.on_sample(metrics)
+            except Exception as e:
+                print(f"Erreur collecte métriques: {e}")
+            self._stop.wait(self.interval)
+
+    def _sample(self) -> List[float]:
+        """Mesure non bloquante de l'hôte et du processus"""
+        from src.services.db_instrumentation import pool_connection_counts
+
+        memory = psutil.virtual_memory()
+        disk = psutil.disk_usage(self.disk_path)
+        network = psutil.net_io_counters()
+        process = self._process
+
+        with process.oneshot():
+            rss = process.memory_info().rss
+            threads = process.num_threads()
+            process_cpu = process.cpu_percent(interval=None)
+            try:
+                open_fds = process.num_fds()
+            except AttributeError:
+                open_fds = 0
+
+        gc_counts = gc.get_count()
+        gc_collections = sum(stats['collections'] for stats in gc.get_stats())
+        pool_counts = pool_connection_counts()
+
+        return [
+            time.time(),
+            psutil.cpu_percent(interval=None),
+            memory.percent,
+            round(memory.used / (1024**3), 2),
+            round(memory.total / (1024**3), 2),
+            disk.percent,
+            round(disk.used / (1024**3), 2),
+            round(disk.total / (1024**3), 2),
+            network.bytes_sent if network else 0,
+            network.bytes_recv if network else 0,
+            time.time() - self._process_start,
+            process_cpu,
+            round(rss / (1024**2), 2),
+            threads,
+            open_fds,
+            gc_counts[0], gc_counts[1], gc_counts[2],
+            gc_collections,
+            pool_counts['open'],
+            pool_counts['checked_out']
+        ]
+
+    def collect(self) -> Dict:
+        """
+        Prend une mesure et l'ajoute aux séries
+
+        Returns:
+            dict: Mesure au format row_to_metrics()
+        """
+        if self._pid != os.getpid():
+            self._reset()
+            self.store.after_fork()
+        row = self._sample()
+        self.store.append(row)
+        return row_to_metrics(row)
+
+    def history(self, since: float = None, until: float = None, resolution: str = None) -> List[Dict]:
+        """
+        Mesures conservées, de la plus ancienne à la plus récente
+
+        Args:
+            since (float): Ne garder que les mesures postérieures (epoch)
+            until (float): Ne garder que les mesures antérieures (epoch)
+            resolution (str): 'raw', '1m', '10m' ou '1h' (défaut: selon la période)
+
+        Returns:
+            list: Mesures au format row_to_metrics()
+        """
+        return [row_to_metrics(row) for row in self.store.query(since, until, resolution).tolist()]
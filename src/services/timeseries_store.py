@@ -0,0 +1,323 @@
+"""
+Stockage compact des séries temporelles de performance pour AgroBizChat
+Anneaux NumPy en colonnes, agrégats 1m/10m/1h et persistance en ajout seul
+"""
+
+import os
+import json
+import threading
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows : pas de verrou, chaque processus persiste
+    fcntl = None
+
+# (libellé, secondes par point ; 0 = mesures brutes)
+DEFAULT_RESOLUTIONS = (('raw', 0), ('1m', 60), ('10m', 600), ('1h', 3600))
+
+def _default_directory() -> str:
+    """Répertoire de persistance (TIMESERIES_DIR ou data/timeseries)"""
+    directory = os.getenv('TIMESERIES_DIR')
+    if not directory:
+        project_root = Path(__file__).parent.parent.parent.resolve()
+        directory = str(project_root / "data" / "timeseries")
+    return directory
+
+class MetricRing:
+    """Échantillons dans un tableau NumPy (capacité x champs) de taille fixe, la 1re colonne est l'horodatage"""
+
+    def __init__(self, fields: Sequence[str], capacity: int):
+        """
+        Initialise l'anneau
+
+        Args:
+            fields (sequence): Noms des colonnes (la première est l'horodatage)
+            capacity (int): Nombre maximal d'échantillons conservés
+        """
+        self.fields = tuple(fields)
+        self.capacity = max(1, capacity)
+        self._data = np.zeros((self.capacity, len(self.fields)), dtype=np.float64)
+        self._next = 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def append(self, values: Sequence[float]):
+        """Ajoute un échantillon (écrase le plus ancien quand l'anneau est plein)"""
+        with self._lock:
+            self._data[self._next] = values
+            self._next = (self._next + 1) % self.capacity
+            self._count = min(self._count + 1, self.capacity)
+
+    def extend(self, rows: np.ndarray):
+        """Ajoute des échantillons déjà ordonnés (chargement depuis le disque)"""
+        for row in rows[-self.capacity:]:
+            self.append(row)
+
+    def _ordered(self) -> np.ndarray:
+        """Copie des échantillons du plus ancien au plus récent (à appeler sous verrou)"""
+        if self._count < self.capacity:
+            return self._data[:self._count].copy()
+        return np.concatenate((self._data[self._next:], self._data[:self._next]))
+
+    def range(self, since: float = None, until: float = None) -> np.ndarray:
+        """
+        Tranche temporelle ]since, until] par recherche dichotomique
+
+        Args:
+            since (float): Borne basse exclue (epoch)
+            until (float): Borne haute incluse (epoch)
+
+        Returns:
+            ndarray: Lignes ordonnées (copie)
+        """
+        with self._lock:
+            data = self._ordered()
+        timestamps = data[:, 0]
+        start = np.searchsorted(timestamps, since, side='right') if since is not None else 0
+        end = np.searchsorted(timestamps, until, side='right') if until is not None else len(data)
+        return data[start:end]
+
+    def rows(self, since: float = None) -> Iterator[Tuple[float, ...]]:
+        """Échantillons postérieurs à since, sous forme de tuples"""
+        for row in self.range(since).tolist():
+            yield tuple(row)
+
+    def last(self) -> Optional[Tuple[float, ...]]:
+        """Dernier échantillon ou None"""
+        with self._lock:
+            if not self._count:
+                return None
+            return tuple(self._data[(self._next - 1) % self.capacity].tolist())
+
+    def oldest_timestamp(self) -> Optional[float]:
+        """Horodatage du plus ancien échantillon conservé"""
+        with self._lock:
+            if not self._count:
+                return None
+            return float(self._data[(self._next - self._count) % self.capacity, 0])
+
+    def drop_before(self, timestamp: float):
+        """Oublie les échantillons antérieurs ou égaux à un horodatage"""
+        with self._lock:
+            data = self._ordered()
+            keep = data[np.searchsorted(data[:, 0], timestamp, side='right'):]
+            self._data[:len(keep)] = keep
+            self._count = len(keep)
+            self._next = self._count % self.capacity
+
+    def clear(self):
+        """Vide l'anneau"""
+        with self._lock:
+            self._next = 0
+            self._count = 0
+
+class _Rollup:
+    """Agrégat en cours d'un intervalle (moyenne, ou dernière valeur pour les compteurs cumulés)"""
+
+    def __init__(self, nfields: int):
+        self.bucket = None
+        self.sums = np.zeros(nfields)
+        self.last = np.zeros(nfields)
+        self.count = 0
+
+class TimeSeriesStore:
+    """Séries multi-résolution : mesures brutes et agrégats, persistés par un seul worker"""
+
+    def __init__(self, name: str, fields: Sequence[str], capacity: int = None,
+                 resolutions: Iterable[Tuple[str, int]] = DEFAULT_RESOLUTIONS,
+                 cumulative_fields: Iterable[str] = (), directory: str = None, persist: bool = None):
+        """
+        Initialise le stockage
+
+        Args:
+            name (str): Nom de la série (fichiers <name>.<résolution>.bin)
+            fields (sequence): Colonnes, la première est l'horodatage
+            capacity (int): Points conservés par résolution (TIMESERIES_CAPACITY)
+            resolutions (iterable): Couples (libellé, secondes par point)
+            cumulative_fields (iterable): Compteurs cumulés agrégés par dernière valeur
+            directory (str): Répertoire de persistance
+            persist (bool): Persister sur disque (TIMESERIES_PERSIST)
+        """
+        self.name = name
+        self.fields = tuple(fields)
+        self.capacity = capacity if capacity is not None else int(os.getenv('TIMESERIES_CAPACITY', '1440'))
+        self.resolutions = tuple(resolutions)
+        self.rings = {label: MetricRing(self.fields, self.capacity) for label, _ in self.resolutions}
+        self._last_mask = np.array([field in set(cumulative_fields) for field in self.fields])
+        self._last_mask[0] = False
+        self.directory = directory or _default_directory()
+        self.persist = persist if persist is not None else \
+            os.getenv('TIMESERIES_PERSIST', 'true').lower() == 'true'
+        self._lock = threading.Lock()
+        self._lock_file = None
+        self._reset_rollups()
+
+        if self.persist:
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                self._check_header()
+            except Exception as e:
+                print(f"Erreur initialisation séries temporelles: {e}")
+                self.persist = False
+        self.load()
+
+    def _reset_rollups(self):
+        """Agrégats en cours vides"""
+        self._rollups = {label: _Rollup(len(self.fields)) for label, seconds in self.resolutions if seconds}
+
+    def _path(self, label: str) -> str:
+        """Fichier binaire d'une résolution"""
+        return os.path.join(self.directory, f"{self.name}.{label}.bin")
+
+    def _check_header(self):
+        """Les fichiers existants ne sont réutilisés que si les colonnes sont identiques"""
+        header_path = os.path.join(self.directory, f"{self.name}.json")
+        header = {'fields': list(self.fields)}
+        try:
+            with open(header_path, 'r', encoding='utf-8') as f:
+                if json.load(f) == header:
+                    return
+        except (FileNotFoundError, ValueError):
+            pass
+        for label, _ in self.resolutions:
+            if os.path.exists(self._path(label)):
+                os.remove(self._path(label))
+        with open(header_path, 'w', encoding='utf-8') as f:
+            json.dump(header, f)
+
+    def is_writer(self) -> bool:
+        """
+        Un seul worker écrit sur disque : celui qui détient le verrou (réélu si il disparaît)
+
+        Returns:
+            bool: True si le processus courant persiste les points
+        """
+        if not self.persist:
+            return False
+        if self._lock_file is not None:
+            return True
+        if fcntl is None:
+            self._lock_file = True
+            return True
+        lock_file = open(os.path.join(self.directory, f"{self.name}.lock"), 'a')
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def load(self):
+        """Recharge les derniers points persistés (historique conservé après redémarrage)"""
+        if not self.persist:
+            return
+        row_bytes = 8 * len(self.fields)
+        for label, _ in self.resolutions:
+            path = self._path(label)
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                continue
+            rows = min(size // row_bytes, self.capacity)
+            try:
+                data = np.fromfile(path, dtype=np.float64, count=rows * len(self.fields),
+                                   offset=(size // row_bytes - rows) * row_bytes)
+                self.rings[label].extend(data.reshape(-1, len(self.fields)))
+            except Exception as e:
+                print(f"Erreur chargement séries {label}: {e}")
+
+    def _write(self, label: str, rows: List[np.ndarray]):
+        """Ajoute des points au fichier, compacté quand il dépasse deux fois la capacité"""
+        path = self._path(label)
+        try:
+            with open(path, 'ab') as f:
+                f.write(np.asarray(rows, dtype=np.float64).tobytes())
+            if os.path.getsize(path) > 2 * self.capacity * 8 * len(self.fields):
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                self.rings[label].range().tofile(tmp_path)
+                os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"Erreur écriture séries {label}: {e}")
+
+    def append(self, values: Sequence[float]):
+        """
+        Ajoute une mesure brute et alimente les agrégats
+
+        Args:
+            values (sequence): Valeurs dans l'ordre des champs (horodatage en premier)
+        """
+        row = np.asarray(values, dtype=np.float64)
+        writes = {}
+        with self._lock:
+            for label, seconds in self.resolutions:
+                if not seconds:
+                    self.rings[label].append(row)
+                    writes[label] = [row]
+                    continue
+
+                rollup = self._rollups[label]
+                bucket = int(row[0] // seconds)
+                if rollup.bucket is not None and bucket != rollup.bucket and rollup.count:
+                    point = np.where(self._last_mask, rollup.last, rollup.sums / rollup.count)
+                    point[0] = rollup.bucket * seconds
+                    self.rings[label].append(point)
+                    writes[label] = [point]
+                    rollup.sums[:] = 0
+                    rollup.count = 0
+                rollup.bucket = bucket
+                rollup.sums += row
+                rollup.last[:] = row
+                rollup.count += 1
+
+        if writes and self.is_writer():
+            for label, rows in writes.items():
+                self._write(label, rows)
+
+    def resolution_for(self, since: float = None) -> str:
+        """Résolution la plus fine dont l'historique couvre la période demandée"""
+        for label, _ in self.resolutions:
+            oldest = self.rings[label].oldest_timestamp()
+            if oldest is not None and (since is None or oldest <= since):
+                return label
+        populated = [label for label, _ in self.resolutions if len(self.rings[label])]
+        return populated[-1] if populated else self.resolutions[0][0]
+
+    def query(self, since: float = None, until: float = None, resolution: str = None) -> np.ndarray:
+        """
+        Tranche temporelle d'une résolution
+
+        Args:
+            since (float): Borne basse exclue (epoch)
+            until (float): Borne haute incluse (epoch)
+            resolution (str): 'raw', '1m', '10m', '1h' (défaut: choisie selon la période)
+
+        Returns:
+            ndarray: Lignes ordonnées, colonnes dans l'ordre des champs
+        """
+        label = resolution if resolution in self.rings else self.resolution_for(since)
+        return self.rings[label].range(since, until)
+
+    def drop_before(self, timestamp: float):
+        """Oublie en mémoire les points antérieurs à un horodatage"""
+        for ring in self.rings.values():
+            ring.drop_before(timestamp)
+
+    def after_fork(self):
+        """Dans un processus forké : verrou d'écriture non hérité, historique rechargé"""
+        if self._lock_file not in (None, True):
+            self._lock_file.close()
+        self._lock_file = None
+        self._lock = threading.Lock()
+        for ring in self.rings.values():
+            ring._lock = threading.Lock()
+            ring.clear()
+        self._reset_rollups()
+        self.load()
@@ -0,0 +1,332 @@
+"""
+Traçage léger du pipeline pour AgroBizChat
+Spans par étape (webhook, base, templates, Gemini, rendu, Twilio), contexte propagé
+par contextvars et export échantillonné vers un fichier JSONL
+"""
+
+import os
+import json
+import time
+import random
+import threading
+import contextvars
+from collections import deque
+from functools import wraps
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from src.services.metrics_registry import metrics_registry
+
+# Span actif du contexte courant (thread ou tâche)
+_current_span = contextvars.ContextVar('agrobiz_current_span', default=None)
+
+trace_span_duration = metrics_registry.histogram(
+    'trace_span_duration_seconds', 'Durée des étapes tracées du pipeline', ['span'])
+
+def _default_sink_path() -> str:
+    """Fichier d'export (TRACE_SINK_PATH ou data/traces.jsonl)"""
+    path = os.getenv('TRACE_SINK_PATH')
+    if not path:
+        project_root = Path(__file__).parent.parent.parent.resolve()
+        path = str(project_root / "data" / "traces.jsonl")
+    return path
+
+def parse_traceparent(header: str) -> Optional[Dict]:
+    """
+    Décode un en-tête W3C traceparent (00-<trace_id>-<span_id>-<flags>)
+
+    Args:
+        header (str): Valeur de l'en-tête
+
+    Returns:
+        dict: trace_id, parent_id et sampled, ou None si invalide
+    """
+    parts = (header or '').strip().split('-')
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        int(parts[1], 16)
+        int(parts[2], 16)
+        flags = int(parts[3], 16)
+    except ValueError:
+        return None
+    if parts[1] == '0' * 32 or parts[2] == '0' * 16:
+        return None
+    return {'trace_id': parts[1], 'parent_id': parts[2], 'sampled': bool(flags & 1)}
+
+class _Trace:
+    """Spans terminés d'une même requête"""
+
+    def __init__(self, trace_id: str, sampled: bool):
+        self.trace_id = trace_id
+        self.sampled = sampled
+        self.spans = []
+        self.dropped = 0
+        self.finished = False
+
+class Span:
+    """Étape chronométrée d'une trace"""
+
+    def __init__(self, trace: _Trace, name: str, parent: 'Span' = None,
+                 parent_id: str = None, attributes: Dict = None):
+        self.trace = trace
+        self.name = name
+        self.span_id = '%016x' % random.getrandbits(64)
+        self.parent = parent
+        self.parent_id = parent.span_id if parent is not None else parent_id
+        self.attributes = dict(attributes or {})
+        self.status = 'ok'
+        self.start_time = time.time()
+        self._start_perf = time.perf_counter()
+        self.duration_ms = None
+        self.children_ms = 0.0
+
+    def set_attribute(self, key: str, value):
+        """Ajoute un attribut (jamais de donnée personnelle : numéro, message...)"""
+        self.attributes[key] = value
+
+    def set_error(self, error):
+        """Marque le span en erreur (classe de l'exception seulement : le message peut contenir un numéro ou un texte d'utilisateur)"""
+        self.status = 'error'
+        self.attributes['error'] = type(error).__name__
+
+    def traceparent(self) -> str:
+        """En-tête W3C à transmettre aux appels sortants"""
+        return f"00-{self.trace.trace_id}-{self.span_id}-{'01' if self.trace.sampled else '00'}"
+
+    def to_dict(self, trace_start: float) -> Dict:
+        """Représentation exportée (décalage relatif au début de la trace)"""
+        return {
+            'name': self.name,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'offset_ms': round((self.start_time - trace_start) * 1000, 3),
+            'duration_ms': round(self.duration_ms, 3),
+            'self_ms': round(max(0.0, self.duration_ms - self.children_ms), 3),
+            'status': self.status,
+            'attributes': self.attributes
+        }
+
+class _SpanScope:
+    """Ouvre un span (gestionnaire de contexte ou décorateur), comme Histogram.time()"""
+
+    def __init__(self, tracer: 'Tracer', name: str, attributes: Dict, traceparent: str = None):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.traceparent = traceparent
+        self.span = None
+
+    def __enter__(self) -> Optional[Span]:
+        if not self.tracer.enabled:
+            return None
+        self.span = self.tracer._start(self.name, self.attributes, self.traceparent)
+        self._token = _current_span.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.span is not None:
+            _current_span.reset(self._token)
+            if exc is not None:
+                self.span.set_error(exc)
+            self.tracer._end(self.span)
+        return False
+
+    def __call__(self, func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with _SpanScope(self.tracer, self.name, self.attributes, self.traceparent):
+                return func(*args, **kwargs)
+        return wrapper
+
+class Tracer:
+    """Crée les spans, termine les traces et exporte celles échantillonnées"""
+
+    def __init__(self, sink_path: str = None, sample_rate: float = None, slow_ms: float = None):
+        """
+        Initialise le traceur
+
+        Args:
+            sink_path (str): Fichier JSONL partagé par les workers
+            sample_rate (float): Part des traces exportées (0 à 1)
+            slow_ms (float): Les traces plus lentes sont toujours exportées
+        """
+        self.enabled = os.getenv('TRACING_ENABLED', 'true').lower() == 'true'
+        self.sink_path = sink_path or _default_sink_path()
+        self.sample_rate = sample_rate if sample_rate is not None else float(os.getenv('TRACE_SAMPLE_RATE', '0.1'))
+        self.slow_ms = slow_ms if slow_ms is not None else float(os.getenv('TRACE_SLOW_MS', '2000'))
+        self.max_spans = int(os.getenv('TRACE_MAX_SPANS', '200'))
+        self.sink_max_bytes = int(os.getenv('TRACE_SINK_MAX_BYTES', str(10 * 1024 * 1024)))
+        # Traces récentes du worker (échantillonnées ou non) pour /traces/slowest
+        self._recent = deque(maxlen=int(os.getenv('TRACE_BUFFER_SIZE', '500')))
+        self._sink_lock = threading.Lock()
+
+        try:
+            os.makedirs(os.path.dirname(self.sink_path), exist_ok=True)
+        except Exception as e:
+            print(f"Erreur création répertoire traces: {e}")
+
+    def span(self, name: str, traceparent: str = None, **attributes) -> _SpanScope:
+        """
+        Span d'une étape : racine si aucun span n'est actif, enfant sinon
+
+        Args:
+            name (str): Nom de l'étape (cardinalité bornée, ex: "gemini.generate_content")
+            traceparent (str): En-tête W3C entrant (spans racines uniquement)
+            **attributes: Attributs du span
+
+        Returns:
+            _SpanScope: Utilisable avec "with" ou comme décorateur
+        """
+        return _SpanScope(self, name, attributes, traceparent)
+
+    def current_span(self) -> Optional[Span]:
+        """Span actif du contexte courant"""
+        return _current_span.get()
+
+    def current_traceparent(self) -> Optional[str]:
+        """En-tête traceparent du span actif (propagation vers un service externe)"""
+        span = _current_span.get()
+        return span.traceparent() if span is not None else None
+
+    def _start(self, name: str, attributes: Dict, traceparent: str = None) -> Span:
+        """Crée un span rattaché au span actif, ou une nouvelle trace"""
+        parent = _current_span.get()
+        if parent is not None and not parent.trace.finished:
+            return Span(parent.trace, name, parent=parent, attributes=attributes)
+
+        incoming = parse_traceparent(traceparent)
+        if incoming:
+            trace = _Trace(incoming['trace_id'], incoming['sampled'] or random.random() < self.sample_rate)
+            return Span(trace, name, parent_id=incoming['parent_id'], attributes=attributes)
+
+        trace = _Trace('%032x' % random.getrandbits(128), random.random() < self.sample_rate)
+        return Span(trace, name, attributes=attributes)
+
+    def _end(self, span: Span):
+        """Termine un span ; la fin du span racine termine la trace"""
+        span.duration_ms = (time.perf_counter() - span._start_perf) * 1000
+        trace_span_duration.observe(span.duration_ms / 1000, span=span.name)
+
+        if span.parent is not None:
+            span.parent.children_ms += span.duration_ms
+        trace = span.trace
+        if trace.finished:
+            return
+        if len(trace.spans) < self.max_spans:
+            trace.spans.append(span)
+        else:
+            trace.dropped += 1
+
+        if span.parent is None:
+            trace.finished = True
+            self._finish(trace, span)
+
+    def _finish(self, trace: _Trace, root: Span):
+        """Résume la trace, la garde en mémoire et l'exporte si échantillonnée"""
+        stages = {}
+        for span in trace.spans:
+            stages[span.name] = stages.get(span.name, 0.0) + max(0.0, span.duration_ms - span.children_ms)
+
+        record = {
+            'trace_id': trace.trace_id,
+            'name': root.name,
+            'start': root.start_time,
+            'duration_ms': round(root.duration_ms, 3),
+            'status': 'error' if any(span.status == 'error' for span in trace.spans) else 'ok',
+            'pid': os.getpid(),
+            'stages': {name: round(value, 3) for name, value in sorted(stages.items(), key=lambda item: -item[1])},
+            'spans': [span.to_dict(root.start_time) for span in sorted(trace.spans, key=lambda span: span.start_time)],
+            'dropped_spans': trace.dropped
+        }
+        self._recent.append(record)
+
+        # Échantillonnage en tête, plus toutes les traces lentes ou en erreur
+        if trace.sampled or record['duration_ms'] >= self.slow_ms or record['status'] == 'error':
+            record['sampled'] = 'head' if trace.sampled else 'tail'
+            self._export(record)
+
+    def _export(self, record: Dict):
+        """Ajoute la trace au fichier JSONL (une ligne, écriture en append)"""
+        line = json.dumps(record, ensure_ascii=False, default=str) + '\n'
+        with self._sink_lock:
+            try:
+                if os.path.exists(self.sink_path) and os.path.getsize(self.sink_path) > self.sink_max_bytes:
+                    os.replace(self.sink_path, self.sink_path + '.1')
+                with open(self.sink_path, 'a', encoding='utf-8') as f:
+                    f.write(line)
+            except Exception as e:
+                print(f"Erreur export trace: {e}")
+
+    def _read_sink(self, max_bytes: int = 1024 * 1024) -> List[Dict]:
+        """Dernières traces exportées par tous les workers (fin du fichier)"""
+        records = []
+        try:
+            with open(self.sink_path, 'rb') as f:
+                f.seek(0, os.SEEK_END)
+                size = f.tell()
+                f.seek(max(0, size - max_bytes))
+                lines = f.read().splitlines()
+            if size > max_bytes:
+                lines = lines[1:]  # Première ligne probablement tronquée
+            for line in lines:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Erreur lecture traces: {e}")
+        return records
+
+    def slowest(self, limit: int = 10, minutes: float = 60, name: str = None) -> List[Dict]:
+        """
+        Traces récentes les plus lentes, avec le détail par étape
+
+        Args:
+            limit (int): Nombre de traces
+            minutes (float): Ancienneté maximale
+            name (str): Filtrer sur le span racine (ex: "whatsapp.webhook")
+
+        Returns:
+            list: Traces triées par durée décroissante
+        """
+        cutoff = time.time() - minutes * 60
+        traces = {}
+        for record in self._read_sink() + list(self._recent):
+            if record.get('start', 0) < cutoff or (name and record.get('name') != name):
+                continue
+            traces[record['trace_id']] = record
+        return sorted(traces.values(), key=lambda record: record['duration_ms'], reverse=True)[:limit]
+
+def trace_request(name: str) -> Callable:
+    """
+    Span racine d'une vue Flask (reprend l'en-tête traceparent entrant)
+
+    Args:
+        name (str): Nom du span racine (ex: "whatsapp.webhook")
+
+    Returns:
+        callable: Décorateur de vue
+    """
+    def decorator(view: Callable) -> Callable:
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            from flask import request
+
+            route = request.url_rule.rule if request.url_rule is not None else None
+            with tracer.span(name, traceparent=request.headers.get('traceparent'),
+                             route=route, method=request.method) as span:
+                response = view(*args, **kwargs)
+                if span is not None and isinstance(response, tuple) and len(response) > 1 \
+                        and isinstance(response[1], int):
+                    span.set_attribute('status_code', response[1])
+                    if response[1] >= 500:
+                        span.status = 'error'
+                return response
+        return wrapper
+    return decorator
+
+# Instance globale du traceur
+tracer = Tracer()
@@ -9,6 +9,8 @@ from datetime import datetime, timedelta
 from typing import Dict, Optional, List
 import os
 
+from src.services.cache_service import cache_service
+
 class WeatherService:
     """Service pour récupérer les données météorologiques"""
     
@@ -16,6 +18,20 @@ class WeatherService:
     BASE_URL = "https://api.meteobenin.bj"
     SANDBOX_URL = "https://api-sandbox.meteobenin.bj"
     
+    # Mapping des zones agro-écologiques du Bénin
+    ZONE_COORDINATES = {
+        'Zone côtière': {'lat': 6.3690, 'lon': 2.4225, 'name': 'Cotonou'},
+        'Zone des terres de barre': {'lat': 6.4969, 'lon': 2.6043, 'name': 'Abomey-Calavi'},
+        'Zone des collines': {'lat': 7.1761, 'lon': 1.9911, 'name': 'Abomey'},
+        'Zone de l\'Atacora': {'lat': 10.3049, 'lon': 1.3750, 'name': 'Natitingou'},
+        'Zone de la Donga': {'lat': 9.7000, 'lon': 1.6667, 'name': 'Djougou'},
+        'Zone de l\'Ouémé': {'lat': 6.6333, 'lon': 2.4667, 'name': 'Porto-Novo'},
+        'Zone de l\'Alibori': {'lat': 11.3000, 'lon': 2.3500, 'name': 'Kandi'},
+        'Zone du Borgou': {'lat': 9.7000, 'lon': 2.6000, 'name': 'Parakou'},
+        'Zone du Mono': {'lat': 6.5000, 'lon': 1.7500, 'name': 'Lokossa'},
+        'Zone du Couffo': {'lat': 6.8500, 'lon': 1.9500, 'name': 'Aplahoué'}
+    }
+    
     def __init__(self, api_key: str = None, use_sandbox: bool = True):
         self.api_key = api_key or os.getenv('METEOBENIN_API_KEY')
         self.use_sandbox = use_sandbox
@@ -42,6 +58,11 @@ class WeatherService:
             if self.dev_mode:
                 return self._get_mock_weather(zone_agro_ecologique)
             
+            # Météo réelle déjà récupérée (par un autre worker ou le préchauffage)
+            cached_weather = cache_service.get_cached_weather_data(zone_agro_ecologique)
+            if cached_weather:
+                return cached_weather
+            
             # Mapping des zones vers les coordonnées
             zone_coordinates = self._get_zone_coordinates(zone_agro_ecologique)
             if not zone_coordinates:
@@ -57,7 +78,9 @@ class WeatherService:
             )
             
             if response.status_code == 200:
-                return self._parse_weather_data(response.json())
+                weather = self._parse_weather_data(response.json())
+                cache_service.cache_weather_data(zone_agro_ecologique, weather)
+                return weather
             else:
                 print(f"Erreur API météo: {response.status_code}")
                 return self._get_mock_weather(zone_agro_ecologique)
@@ -137,21 +160,7 @@ class WeatherService:
         Returns:
             dict: {'lat': float, 'lon': float} ou None
         """
-        # Mapping des zones agro-écologiques du Bénin
-        zone_mapping = {
-            'Zone côtière': {'lat': 6.3690, 'lon': 2.4225, 'name': 'Cotonou'},
-            'Zone des terres de barre': {'lat': 6.4969, 'lon': 2.6043, 'name': 'Abomey-Calavi'},
-            'Zone des collines': {'lat': 7.1761, 'lon': 1.9911, 'name': 'Abomey'},
-            'Zone de l\'Atacora': {'lat': 10.3049, 'lon': 1.3750, 'name': 'Natitingou'},
-            'Zone de la Donga': {'lat': 9.7000, 'lon': 1.6667, 'name': 'Djougou'},
-            'Zone de l\'Ouémé': {'lat': 6.6333, 'lon': 2.4667, 'name': 'Porto-Novo'},
-            'Zone de l\'Alibori': {'lat': 11.3000, 'lon': 2.3500, 'name': 'Kandi'},
-            'Zone du Borgou': {'lat': 9.7000, 'lon': 2.6000, 'name': 'Parakou'},
-            'Zone du Mono': {'lat': 6.5000, 'lon': 1.7500, 'name': 'Lokossa'},
-            'Zone du Couffo': {'lat': 6.8500, 'lon': 1.9500, 'name': 'Aplahoué'}
-        }
-        
-        return zone_mapping.get(zone_agro_ecologique)
+        return self.ZONE_COORDINATES.get(zone_agro_ecologique)
     
     def _get_mock_weather(self, zone_agro_ecologique: str) -> Dict:
         """
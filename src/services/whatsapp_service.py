@@ -4,6 +4,9 @@ from typing import Optional
 from twilio.rest import Client
 from twilio.base.exceptions import TwilioRestException
 
+from src.services.tracing import tracer
+from src.services.monitoring_service import monitoring_service
+
 logger = logging.getLogger(__name__)
 
 class WhatsAppService:
@@ -24,6 +27,7 @@ class WhatsAppService:
                 logger.error(f"Erreur initialisation Twilio: {str(e)}")
                 self.client = None
     
+    @tracer.span('twilio.send_message')
     def send_message(self, to_number: str, message: str) -> bool:
         """Envoie un message WhatsApp via Twilio."""
         try:
@@ -51,6 +55,8 @@ class WhatsAppService:
             
         except TwilioRestException as e:
             logger.error(f"❌ Erreur Twilio: {e.msg} (Code: {e.code})")
+            monitoring_service.log_error('twilio', f"{e.msg} (Code: {e.code})",
+                                         {'code': e.code, 'status': e.status})
             
             # Gérer spécifiquement la limite quotidienne
             if e.code == 63038:
@@ -61,8 +67,10 @@ class WhatsAppService:
             return False
         except Exception as e:
             logger.error(f"❌ Erreur envoi message WhatsApp: {str(e)}")
+            monitoring_service.log_error('whatsapp_send', str(e), {'exception': type(e).__name__})
             return False
     
+    @tracer.span('twilio.send_document')
     def send_document(self, to_number: str, file_url: str, caption: str = "") -> bool:
         """Envoie un document WhatsApp via Twilio."""
         try:
@@ -91,6 +99,8 @@ class WhatsAppService:
             
         except TwilioRestException as e:
             logger.error(f"❌ Erreur Twilio document: {e.msg} (Code: {e.code})")
+            monitoring_service.log_error('twilio', f"{e.msg} (Code: {e.code})",
+                                         {'code': e.code, 'status': e.status})
             
             # Gérer spécifiquement la limite quotidienne
             if e.code == 63038:
@@ -101,6 +111,7 @@ class WhatsAppService:
             return False
         except Exception as e:
             logger.error(f"❌ Erreur envoi document WhatsApp: {str(e)}")
+            monitoring_service.log_error('whatsapp_send', str(e), {'exception': type(e).__name__})
             return False
     
     def send_business_plan_files(self, to_number: str, excel_url: str, pdf_url: str, business_plan_title: str) -> bool:
@@ -0,0 +1,314 @@
+"""
+Partage de métriques entre workers gunicorn pour AgroBizChat
+Chaque processus publie un instantané JSON, la lecture fusionne les processus vivants
+(identifiés par PID et date de démarrage : un PID réutilisé ne reprend pas l'instantané d'un autre)
+et les cumuls des workers terminés, pour que les compteurs exportés ne reculent pas
+"""
+
+import os
+import json
+import time
+import glob
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import psutil
+
+try:
+    import fcntl
+except ImportError:  # Windows : pas de verrou entre workers, numéro de worker = PID
+    fcntl = None
+
+# Emplacements de numéro de worker (label "worker" des jauges)
+MAX_WORKER_SLOTS = 256
+
+# (PID, répertoire) -> (numéro, fichier verrouillé gardé ouvert)
+_worker_slots = {}
+_worker_slots_lock = threading.Lock()
+
+def _default_directory() -> str:
+    """Répertoire des instantanés (WORKER_METRICS_DIR ou data/worker_metrics)"""
+    directory = os.getenv('WORKER_METRICS_DIR')
+    if not directory:
+        project_root = Path(__file__).parent.parent.parent.resolve()
+        directory = str(project_root / "data" / "worker_metrics")
+    return directory
+
+def _start_token(pid: int) -> Optional[str]:
+    """
+    Jeton de démarrage d'un processus (date de création au centième de seconde)
+
+    Returns:
+        str: Jeton, chaîne vide si illisible, None si le processus n'existe plus
+    """
+    try:
+        return str(int(psutil.Process(pid).create_time() * 100))
+    except psutil.NoSuchProcess:
+        return None
+    except psutil.AccessDenied:
+        return ''
+
+def _write_json(directory: str, path: str, payload: Dict):
+    """Écriture atomique (fichier temporaire puis remplacement)"""
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(payload, f)
+        os.replace(tmp_path, path)
+    except Exception:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+def clear_snapshots(directory: str = None) -> int:
+    """
+    Efface les instantanés et cumuls d'une exécution précédente (démarrage du maître gunicorn)
+
+    Args:
+        directory (str): Répertoire des instantanés (défaut: WORKER_METRICS_DIR)
+
+    Returns:
+        int: Nombre de fichiers supprimés
+    """
+    directory = directory or _default_directory()
+    removed = 0
+    for path in glob.glob(os.path.join(directory, '*.json')) + glob.glob(os.path.join(directory, '.*.tmp')):
+        try:
+            os.remove(path)
+            removed += 1
+        except OSError as e:
+            print(f"Erreur suppression instantané {path}: {e}")
+    return removed
+
+class WorkerSnapshotStore:
+    """Instantanés de métriques par processus, fusionnés à la lecture"""
+
+    def __init__(self, name: str, directory: str = None, publish_interval: float = None):
+        """
+        Initialise le stockage des instantanés
+
+        Args:
+            name (str): Nom du jeu de métriques (ex: "cache")
+            directory (str): Répertoire partagé entre workers
+            publish_interval (float): Intervalle minimal entre deux écritures (s)
+        """
+        self.name = name
+        self.directory = directory or _default_directory()
+        self.publish_interval = publish_interval if publish_interval is not None else \
+            float(os.getenv('WORKER_METRICS_INTERVAL', '5'))
+        self._last_publish = 0.0
+        self._lock = threading.Lock()
+        # (PID, jeton de démarrage) du processus courant, recalculé après un fork
+        self._token = (None, '')
+        self._publisher_pid = None
+
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+        except Exception as e:
+            print(f"Erreur création répertoire métriques: {e}")
+
+    def _path(self, pid: int, token: str) -> str:
+        """Chemin de l'instantané d'un processus (PID et jeton de démarrage)"""
+        return os.path.join(self.directory, f"{self.name}.{pid}-{token}.json")
+
+    def _retired_path(self) -> str:
+        """Chemin du cumul des workers terminés"""
+        return os.path.join(self.directory, f"{self.name}.retired.json")
+
+    @contextmanager
+    def _exclusive(self):
+        """Verrou entre processus : un worker terminé n'est cumulé qu'une fois, et jamais lu en double"""
+        lock_file = None
+        if fcntl is not None:
+            try:
+                lock_file = open(os.path.join(self.directory, f".{self.name}.lock"), 'a')
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            except OSError as e:
+                print(f"Erreur verrou métriques {self.name}: {e}")
+        try:
+            yield
+        finally:
+            if lock_file is not None:
+                lock_file.close()
+
+    def should_publish(self) -> bool:
+        """Indique si l'intervalle de publication est écoulé"""
+        return time.time() - self._last_publish >= self.publish_interval
+
+    def publish(self, snapshot: Dict, force: bool = False) -> bool:
+        """
+        Écrit l'instantané du processus courant (écriture atomique)
+
+        Args:
+            snapshot (dict): Données JSON-sérialisables
+            force (bool): Ignorer l'intervalle de publication
+
+        Returns:
+            bool: True si l'instantané a été écrit
+        """
+        if not force and not self.should_publish():
+            return False
+
+        with self._lock:
+            self._last_publish = time.time()
+            pid = os.getpid()
+            if self._token[0] != pid:
+                self._token = (pid, _start_token(pid) or '')
+            try:
+                _write_json(self.directory, self._path(pid, self._token[1]),
+                            {'pid': pid, 'updated_at': self._last_publish, 'data': snapshot})
+                return True
+            except Exception as e:
+                print(f"Erreur publication métriques {self.name}: {e}")
+                return False
+
+    def start_publisher(self, snapshot: Callable[[], Dict]) -> bool:
+        """
+        Publie snapshot() à chaque intervalle, même sans trafic (une fois par processus)
+
+        Args:
+            snapshot (callable): Instantané du processus courant
+
+        Returns:
+            bool: True si le thread de publication a été lancé
+        """
+        with self._lock:
+            if self._publisher_pid == os.getpid():
+                return False
+            self._publisher_pid = os.getpid()
+
+        def publish_loop():
+            while True:
+                time.sleep(max(1.0, self.publish_interval))
+                try:
+                    self.publish(snapshot(), force=True)
+                except Exception as e:
+                    print(f"Erreur publication métriques {self.name}: {e}")
+
+        threading.Thread(target=publish_loop, name=f'{self.name}-publish', daemon=True).start()
+        return True
+
+    def worker_index(self) -> str:
+        """
+        Numéro stable du worker : plus petit emplacement libre, repris par le remplaçant d'un worker
+        recyclé (le PID change à chaque recyclage et multiplierait les séries)
+
+        Returns:
+            str: Numéro du worker (PID si aucun emplacement n'est disponible)
+        """
+        key = (os.getpid(), self.directory)
+        with _worker_slots_lock:
+            slot = _worker_slots.get(key)
+            if slot is None:
+                slot = _worker_slots[key] = self._claim_slot()
+        return slot[0]
+
+    def _claim_slot(self) -> Tuple[str, object]:
+        """Verrouille le premier emplacement libre (libéré par le système à la fin du processus)"""
+        if fcntl is not None:
+            for index in range(MAX_WORKER_SLOTS):
+                try:
+                    slot_file = open(os.path.join(self.directory, f".worker.{index}.lock"), 'a')
+                except OSError as e:
+                    print(f"Erreur emplacement worker: {e}")
+                    break
+                try:
+                    fcntl.flock(slot_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    return str(index), slot_file
+                except OSError:
+                    slot_file.close()
+        return str(os.getpid()), None
+
+    def collect(self, exclude_self: bool = False, with_age: bool = False) -> List[Dict]:
+        """
+        Lit les instantanés des processus vivants et supprime ceux des processus morts
+        (ou d'un ancien processus dont le PID a été réutilisé)
+
+        Args:
+            exclude_self (bool): Ignorer l'instantané du processus courant
+            with_age (bool): Retourner des couples (données, âge en secondes)
+
+        Returns:
+            list: Données publiées par chaque worker
+        """
+        return self._scan(exclude_self, with_age)[0]
+
+    def collect_totals(self, retire: Callable[[Dict, Dict], Dict]) -> Tuple[List[Dict], Dict]:
+        """
+        Instantanés des workers vivants et cumul des workers terminés, lus sous le même verrou
+
+        Le dernier instantané d'un worker terminé est ajouté au cumul (persisté) avant la suppression
+        de son fichier : la somme vivants + cumul ne diminue pas quand gunicorn recycle un worker.
+
+        Args:
+            retire (callable): retire(cumul, instantané) -> nouveau cumul
+
+        Returns:
+            tuple: (instantanés des workers vivants, cumul des workers terminés)
+        """
+        return self._scan(False, False, retire)
+
+    def _scan(self, exclude_self: bool, with_age: bool,
+              retire: Callable[[Dict, Dict], Dict] = None) -> Tuple[List, Dict]:
+        snapshots = []
+        now = time.time()
+        own_pid = os.getpid()
+        finished = []
+
+        with self._exclusive():
+            retired = {}
+            if retire is not None and os.path.exists(self._retired_path()):
+                try:
+                    with open(self._retired_path(), 'r', encoding='utf-8') as f:
+                        retired = json.load(f).get('data') or {}
+                except Exception as e:
+                    print(f"Erreur lecture cumul métriques {self.name}: {e}")
+
+            for path in glob.glob(os.path.join(self.directory, f"{self.name}.*.json")):
+                pid_text, _, token = os.path.basename(path)[len(self.name) + 1:-len('.json')].partition('-')
+                try:
+                    pid = int(pid_text)
+                except ValueError:
+                    continue
+
+                if exclude_self and pid == own_pid:
+                    continue
+
+                try:
+                    with open(path, 'r', encoding='utf-8') as f:
+                        payload = json.load(f)
+                except Exception:
+                    payload = None
+
+                live_token = _start_token(pid)
+                if live_token is None or (live_token and token != live_token):
+                    finished.append(path)
+                    if retire is not None and payload is not None:
+                        retired = retire(retired, payload.get('data') or {})
+                    continue
+
+                if payload is None:
+                    continue
+                age = now - payload.get('updated_at', 0)
+                data = payload.get('data') or {}
+                snapshots.append((data, age) if with_age else data)
+
+            # Cumul enregistré avant la suppression : un arrêt entre les deux compte en trop, jamais en moins
+            if retire is not None and finished:
+                try:
+                    _write_json(self.directory, self._retired_path(), {'updated_at': now, 'data': retired})
+                except Exception as e:
+                    print(f"Erreur enregistrement cumul métriques {self.name}: {e}")
+                    finished = []
+            for path in finished:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+        return snapshots, retired
@@ -11,6 +11,7 @@ sys.path.insert(0, os.path.dirname(__file__))
 from src.services.disease_detection import DiseaseDetectionService
 from src.services.enhanced_pdf_generator import EnhancedPDFGenerator
 import base64
+import hashlib
 import io
 
 def test_disease_detection_service():
@@ -244,7 +245,7 @@ def test_diagnosis_log_model():
             confidence=0.85,
             severity='Élevée',
             culture='mais',
-            photo_data=base64.b64encode(b"test_photo").decode('utf-8'),
+            photo_hash=hashlib.sha256(b"test_photo").hexdigest(),
             diagnosis_data='{"test": "data"}'
         )
         
@@ -253,6 +254,7 @@ def test_diagnosis_log_model():
         assert diagnosis_log.confidence == 0.85, "Confiance incorrecte"
         assert diagnosis_log.severity == 'Élevée', "Sévérité incorrecte"
         assert diagnosis_log.culture == 'mais', "Culture incorrecte"
+        assert len(diagnosis_log.photo_hash) == 64, "Empreinte photo incorrecte"
         
         # Test get_diagnosis_data
         diagnosis_data = diagnosis_log.get_diagnosis_data()